@@ -115,11 +115,9 @@ class ProjectUserInviteViewSet(ProjectFilteringViewSet):
         )
         invite_text = request.data.get("text")
         if not invite_text or "%LINK%" not in invite_text:
-            invite_text = (
-                swapper.load_model("django_project_base", "ProjectSettings")
-                .objects.get(project=self.request.selected_project, name=INVITE_NOTIFICATION_TEXT)
-                .python_value
-            )
+            invite_text = swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(
+                self.request.selected_project
+            )[INVITE_NOTIFICATION_TEXT]
             invite_text = invite_text.replace("__LINK__", invite_url)
         else:
             invite_text = invite_text.replace("%LINK%", invite_url)
@@ -39,6 +39,7 @@ from rest_registration.exceptions import UserNotFound
 from django_project_base.account.constants import MERGE_USERS_QS_CK
 from django_project_base.account.middleware import ProjectNotSelectedError
 from django_project_base.account.rest.project_profiles_utils import get_project_members
+from django_project_base.base.auth_backends import user_cache_invalidate_many
 from django_project_base.base.event import UserRegisteredEvent
 from django_project_base.base.permissions import IsProjectOwner
 from django_project_base.constants import NOTIFY_NEW_USER_SETTING_NAME
@@ -49,7 +50,7 @@ from django_project_base.notifications.email_notification import (
 from django_project_base.notifications.models import DjangoProjectBaseMessage
 from django_project_base.permissions import BasePermissions
 from django_project_base.rest.project import ProjectSerializer, ProjectViewSet
-from django_project_base.settings import DELETE_PROFILE_TIMEDELTA, USER_CACHE_KEY
+from django_project_base.settings import DELETE_PROFILE_TIMEDELTA
 from django_project_base.utils import get_pk_name
 
 search_fields = ["username", "email", "first_name", "last_name"]
@@ -550,7 +551,7 @@ class ProfileViewSet(ModelViewSet):
 
         profile_obj.save(update_fields=["delete_at"])
         # user.save(update_fields=["is_active"])
-        cache.delete(USER_CACHE_KEY.format(id=user.id))
+        user_cache_invalidate_many([user.id])
         request.session.flush()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -641,10 +642,10 @@ class ProfileViewSet(ModelViewSet):
             slug=getattr(self.request, settings.DJANGO_PROJECT_BASE_BASE_REQUEST_URL_VARIABLES["project"]["value_name"])
         )
         if (
-            sett := swapper.load_model("django_project_base", "ProjectSettings")
-            .objects.filter(name=NOTIFY_NEW_USER_SETTING_NAME, project=project)
-            .first()
-        ) and sett.python_value:
+            swapper.load_model("django_project_base", "ProjectSettings")
+            .get_snapshot(project)
+            .get(NOTIFY_NEW_USER_SETTING_NAME)
+        ):
             recipients = [response.data[get_pk_name(get_user_model())]]
             EMailNotification(
                 message=DjangoProjectBaseMessage(
@@ -1,11 +1,44 @@
+import time
+import uuid
+
+from contextvars import ContextVar
+
 import swapper
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from django.core.cache import cache
+from django.core.signals import request_finished, request_started
 from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from django_project_base.caching import model_codec
+from django_project_base.caching.instrumentation import record_cache_event
+from django_project_base.caching.local_cache import LocalCache
+from django_project_base.settings import USER_CACHE_DATA_KEY, USER_CACHE_KEY
+
+# Users already resolved in current request, keyed by user id. None outside of requests
+_request_users = ContextVar("request_users", default=None)
+
+
+@receiver(request_started)
+def start_request_users(**kwargs):
+    _request_users.set(dict())
+
+
+@receiver(request_finished)
+def finish_request_users(**kwargs):
+    _request_users.set(None)
 
-from django_project_base.settings import USER_CACHE_KEY
+
+def user_cache_invalidate_many(user_ids):
+    # Cached user data is only valid together with its version, so dropping versions invalidates all cache levels
+    cache.delete_many([USER_CACHE_KEY.format(id=user_id) for user_id in user_ids])
+    request_users = _request_users.get()
+    if request_users is not None:
+        for user_id in user_ids:
+            request_users.pop(user_id, None)
 
 
 def user_cache_invalidate(instance):
@@ -14,7 +47,7 @@ def user_cache_invalidate(instance):
     else:
         instance_user_id = instance.user_id
 
-    cache.delete(USER_CACHE_KEY.format(id=instance_user_id))
+    user_cache_invalidate_many([instance_user_id])
 
 
 def invalidate_cache(sender, instance, **kwargs):
@@ -31,6 +64,17 @@ class UsersBackend(ModelBackend):
 
 
 class UsersCachingBackend(UsersBackend):
+    """
+    Users are cached on three levels:
+    - for the duration of a request, so repeated lookups in the same request are free
+    - in a per-process LRU cache (USER_CACHE_LOCAL_TIMEOUT, USER_CACHE_LOCAL_SIZE settings)
+    - in shared cache
+
+    Shared cache holds a version stamp for each user (USER_CACHE_KEY) and user data for that version. The process
+    cache is only used if its version matches the one in shared cache, so resolving a user costs one small read.
+    Deleting the version stamp invalidates the user on all levels.
+    """
+
     def __init__(self) -> None:
         super().__init__()
         post_save.connect(invalidate_cache, sender=get_user_model())
@@ -40,10 +84,59 @@ class UsersCachingBackend(UsersBackend):
         post_save.connect(invalidate_cache, sender=swapper.load_model("django_project_base", "Profile"))
         post_delete.connect(invalidate_cache, sender=swapper.load_model("django_project_base", "Profile"))
 
+    def get_local_cache(self) -> LocalCache:
+        return LocalCache.get_local_cache(
+            "users",
+            max_size=getattr(settings, "USER_CACHE_LOCAL_SIZE", 1000),
+            timeout=getattr(settings, "USER_CACHE_LOCAL_TIMEOUT", 60),
+        )
+
     def get_user(self, user_id):
-        user = cache.get(USER_CACHE_KEY.format(id=user_id or 0))
-        if not user:
-            user = super().get_user(user_id)
-            if user_id and user:
-                cache.set(USER_CACHE_KEY.format(id=user_id or 0), user)
+        request_users = _request_users.get()
+        if request_users is not None and user_id in request_users:
+            record_cache_event("users", "user", "request_hit")
+            return request_users[user_id]
+        user = self.get_cached_user(user_id)
+        if request_users is not None:
+            request_users[user_id] = user
+        return user
+
+    def get_cached_user(self, user_id):
+        if not user_id:
+            return super().get_user(user_id)
+
+        start = time.perf_counter()
+        version = cache.get(USER_CACHE_KEY.format(id=user_id))
+        local_cache = self.get_local_cache()
+        if version is not None:
+            local_user = local_cache.get(user_id)
+            if local_user is not None and local_user[0] == version:
+                event, cached_user = "local_hit", local_user[1]
+            else:
+                event, cached_user = "hit", cache.get(USER_CACHE_DATA_KEY.format(id=user_id, version=version))
+                if cached_user is not None:
+                    local_cache.set(user_id, (version, cached_user))
+            # User is cached with compact model codec. Anything else (e.g. an older pickled instance) is a cache miss
+            # Each caller gets its own instance, so cached one can't be modified
+            user = model_codec.loads(cached_user) if isinstance(cached_user, bytes) else None
+            if user:
+                record_cache_event("users", "user", event, duration=time.perf_counter() - start, size=len(cached_user))
+                return user
+
+        user = super().get_user(user_id)
+        record_cache_event("users", "user", "miss", duration=time.perf_counter() - start)
+        if user:
+            try:
+                cached_user = model_codec.dumps(user)
+            except model_codec.ModelCodecError:
+                # user model has values codec can't store, so it isn't cached
+                return user
+            version = uuid.uuid4().hex
+            cache.set_many(
+                {
+                    USER_CACHE_DATA_KEY.format(id=user_id, version=version): cached_user,
+                    USER_CACHE_KEY.format(id=user_id): version,
+                }
+            )
+            local_cache.set(user_id, (version, cached_user))
         return user
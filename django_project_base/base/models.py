@@ -1,6 +1,6 @@
 import uuid
 
-from typing import List
+from typing import Any, List, Optional
 
 import svgwrite
 import swapper
@@ -18,6 +18,11 @@ from rest_framework.exceptions import ErrorDetail, PermissionDenied
 from taggit.models import GenericTaggedItemBase, TagBase
 
 from django_project_base.base.fields import HexColorField
+from django_project_base.base.project_settings_snapshot import (
+    get_project_settings,
+    invalidate_project_settings,
+    ProjectSettingsSnapshot,
+)
 
 
 class BaseProject(models.Model):
@@ -224,10 +229,47 @@ class MergeUserGroup(BaseMergeUserGroup):
         swappable = swapper.swappable_setting("django_project_base", "MergeUserGroup")
 
 
+class ProjectSettingValueCoercer:
+    """
+    Converts setting values of one value type to python. Field doing the conversion is created only once
+    """
+
+    def __init__(self, field: Optional[models.Field] = None, python_type: Optional[type] = None):
+        """
+        :param field: model field converting the value. Without it, values are returned as they are
+        :param python_type: values already of this exact type are returned without conversion
+        """
+        self.to_python = field.to_python if field is not None else None
+        self.python_type = python_type
+
+    def __call__(self, value: Any) -> Any:
+        if self.to_python is None or type(value) is self.python_type:
+            return value
+        return self.to_python(value)
+
+
 class ProjectSettingsQs(models.query.QuerySet):
     def delete(self):
         raise PermissionDenied
 
+    def update(self, **kwargs):
+        project_slugs: set = set(self.values_list("project__slug", flat=True))
+        updated: int = super().update(**kwargs)
+        invalidate_project_settings(project_slugs)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        project_ids: set = {obj.project_id for obj in objs}
+        invalidate_project_settings(
+            swapper.load_model("django_project_base", "Project")
+            .objects.filter(pk__in=project_ids)
+            .values_list("slug", flat=True)
+            if project_ids
+            else ()
+        )
+        return objs
+
 
 class BaseProjectSettings(models.Model):
     VALUE_TYPE_INTEGER = "integer"
@@ -247,26 +289,44 @@ class BaseProjectSettings(models.Model):
 
     objects = ProjectSettingsQs.as_manager()
 
-    value_validators = {
-        VALUE_TYPE_INTEGER: lambda val: models.IntegerField().to_python(val),
-        VALUE_TYPE_FLOAT: lambda val: models.FloatField().to_python(val),
-        VALUE_TYPE_BOOL: lambda val: models.BooleanField().to_python(val),
-        VALUE_TYPE_CHAR: lambda val: models.TextField().to_python(val),
-        VALUE_TYPE_CUSTOM: lambda val: val,
+    value_coercers = {
+        VALUE_TYPE_INTEGER: ProjectSettingValueCoercer(models.IntegerField(), int),
+        VALUE_TYPE_FLOAT: ProjectSettingValueCoercer(models.FloatField(), float),
+        VALUE_TYPE_BOOL: ProjectSettingValueCoercer(models.BooleanField(), bool),
+        VALUE_TYPE_CHAR: ProjectSettingValueCoercer(models.TextField(), str),
+        VALUE_TYPE_CUSTOM: ProjectSettingValueCoercer(),
     }
+    # coercers are callable, so code using validators keeps working
+    value_validators = value_coercers
+
+    @classmethod
+    def get_snapshot(cls, project) -> ProjectSettingsSnapshot:
+        """
+        Returns cached snapshot of all settings of given project (instance or slug)
+        """
+        return get_project_settings(project)
+
+    def get_coerced_value(self, value: Any, cache_attr: str) -> Any:
+        # converted value is kept on the instance until value or its type changes
+        key: tuple = (self.value_type, type(value), value)
+        cached: Optional[tuple] = self.__dict__.get(cache_attr)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        coerced: Any = self.value_coercers[self.value_type](value)
+        self.__dict__[cache_attr] = (key, coerced)
+        return coerced
 
     @property
     def python_value(self):
-        return self.value_validators[self.value_type](self.value)
+        return self.get_coerced_value(self.value, "_python_value_cache")
 
     @property
     def python_pending_value(self):
-        return self.value_validators[self.value_type](self.pending_value)
+        return self.get_coerced_value(self.pending_value, "_python_pending_value_cache")
 
     def clean(self):
-        validator = self.value_validators[self.value_type]
         try:
-            validator(self.value)
+            self.python_value
         except ValidationError as ve:
             from rest_framework.serializers import ValidationError as DrfValidationError
 
@@ -292,15 +352,15 @@ class BaseProjectSettings(models.Model):
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         self.full_clean()
-        validator = self.value_validators[self.value_type]
-        self.value = validator(self.value)
+        self.value = self.python_value
         if self.pending_value is not None:
-            self.pending_value = validator(self.pending_value)
+            self.pending_value = self.python_pending_value
         if self.action_required:
             from django_project_base.base.event import ProjectSettingActionRequiredEvent
 
             ProjectSettingActionRequiredEvent(user=None).trigger(payload=self)
         super().save(force_insert, force_update, using, update_fields)
+        invalidate_project_settings([self.project.slug])
 
     def delete(self, using=None, keep_parents=False):
         raise PermissionDenied
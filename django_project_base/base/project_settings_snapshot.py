@@ -0,0 +1,132 @@
+import uuid
+
+from typing import Any, Iterable, Optional
+
+import swapper
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from django_project_base.caching.local_cache import LocalCache
+from django_project_base.settings import PROJECT_SETTINGS_CACHE_DATA_KEY, PROJECT_SETTINGS_CACHE_KEY
+
+
+class ProjectSettingsSnapshot:
+    """
+    Read-only view of all settings of a project. Values are converted to python types when a setting is first read, so
+    a malformed value only fails reads of its own setting
+    """
+
+    def __init__(self, project_slug: str, values: dict):
+        """
+        :param values: dict of setting name: (value type, value, pending value) as stored in database
+        """
+        self.project_slug = project_slug
+        self.values = values
+        # setting name: (python value, python pending value)
+        self.python_values = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.values
+
+    def __getitem__(self, name: str) -> Any:
+        """
+        Returns python value of setting. Like ProjectSettings.objects.get, raises DoesNotExist for missing settings
+        """
+        if name not in self.values:
+            raise swapper.load_model("django_project_base", "ProjectSettings").DoesNotExist(
+                "Project %s has no setting %s" % (self.project_slug, name)
+            )
+        return self.get_python_values(name)[0]
+
+    def get_python_values(self, name: str) -> tuple:
+        python_values: Optional[tuple] = self.python_values.get(name)
+        if python_values is None:
+            value_type, value, pending_value = self.values[name]
+            coercer = swapper.load_model("django_project_base", "ProjectSettings").value_coercers[value_type]
+            python_values = self.python_values[name] = (
+                coercer(value),
+                coercer(pending_value) if pending_value is not None else None,
+            )
+        return python_values
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.get_python_values(name)[0] if name in self.values else default
+
+    def get_pending(self, name: str, default: Any = None) -> Any:
+        pending_value: Any = self.get_python_values(name)[1] if name in self.values else None
+        return pending_value if pending_value is not None else default
+
+    def get_value_type(self, name: str) -> Optional[str]:
+        setting: Optional[tuple] = self.values.get(name)
+        return setting[0] if setting else None
+
+    def items(self) -> Iterable:
+        return ((name, self.get_python_values(name)[0]) for name in self.values)
+
+
+def get_local_cache() -> LocalCache:
+    return LocalCache.get_local_cache(
+        "project_settings",
+        max_size=getattr(settings, "PROJECT_SETTINGS_CACHE_LOCAL_SIZE", 100),
+        timeout=getattr(settings, "PROJECT_SETTINGS_CACHE_LOCAL_TIMEOUT", 60),
+    )
+
+
+def load_project_settings(project_slug: str) -> ProjectSettingsSnapshot:
+    """
+    Loads all settings of a project with a single query
+    """
+    model = swapper.load_model("django_project_base", "ProjectSettings")
+    values: dict = {
+        name: (value_type, value, pending_value)
+        for name, value_type, value, pending_value in model.objects.filter(project__slug=project_slug).values_list(
+            "name", "value_type", "value", "pending_value"
+        )
+    }
+    return ProjectSettingsSnapshot(project_slug, values)
+
+
+def get_project_settings(project) -> ProjectSettingsSnapshot:
+    """
+    Returns settings snapshot of given project (instance or slug).
+
+    Snapshots are cached like users (see UsersCachingBackend): shared cache holds a version stamp per project and the
+    snapshot for that version, a per-process cache keeps snapshots for as long as their version is current. Saving a
+    setting drops the version stamp
+    """
+    project_slug: str = project if isinstance(project, str) else project.slug
+    version: Optional[str] = cache.get(PROJECT_SETTINGS_CACHE_KEY.format(slug=project_slug))
+    local_cache: LocalCache = get_local_cache()
+    if version is not None:
+        local_snapshot: Optional[tuple] = local_cache.get(project_slug)
+        if local_snapshot is not None and local_snapshot[0] == version:
+            return local_snapshot[1]
+        values: Optional[dict] = cache.get(PROJECT_SETTINGS_CACHE_DATA_KEY.format(slug=project_slug, version=version))
+        if values is not None:
+            snapshot = ProjectSettingsSnapshot(project_slug, values)
+            local_cache.set(project_slug, (version, snapshot))
+            return snapshot
+
+    snapshot = load_project_settings(project_slug)
+    version = uuid.uuid4().hex
+    timeout: int = getattr(settings, "PROJECT_SETTINGS_CACHE_TIMEOUT", 3600)
+    cache.set_many(
+        {
+            PROJECT_SETTINGS_CACHE_DATA_KEY.format(slug=project_slug, version=version): snapshot.values,
+            PROJECT_SETTINGS_CACHE_KEY.format(slug=project_slug): version,
+        },
+        timeout=timeout,
+    )
+    local_cache.set(project_slug, (version, snapshot))
+    return snapshot
+
+
+def invalidate_project_settings(project_slugs: Iterable[str]):
+    keys: list = [PROJECT_SETTINGS_CACHE_KEY.format(slug=project_slug) for project_slug in project_slugs]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # snapshot may have been reloaded from database by another process before the transaction was committed
+    transaction.on_commit(lambda: cache.delete_many(keys))
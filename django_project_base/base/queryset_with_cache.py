@@ -1,20 +1,44 @@
-import hashlib
-import pickle
+import math
+import random
+import time
 
-from typing import Any
+from typing import Any, Callable, NamedTuple, Optional
 
 from django.core.cache import cache
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
 from django.db.models import Model
+from django.db.models.query import ModelIterable
+
+from django_project_base.caching import CacheCounter, model_codec
+from django_project_base.caching.instrumentation import get_key_prefix, record_cache_event
+from django_project_base.caching.local_cache import LocalCache
+from django_project_base.caching.lookup_key import get_lookup_key
+
+
+class CachedEntry(NamedTuple):
+    value: Any
+    # time when entry should be recomputed. Entry is kept in cache for cache_stale_timeout longer
+    expires: float
+    # seconds it took to compute the value
+    compute_time: float
 
 
 class QuerySetWithCache(models.query.QuerySet):
-    def cache_delete_pattern(self, pattern: str):
-        if getattr(cache, "delete_pattern", None):
-            cache.delete_pattern(pattern)
-        else:
-            # TODO: handle this !!!!!
-            pass
+    """
+    Cache keys are namespaced with a generation number kept in cache for each base cache key. Writes through this
+    queryset invalidate all cached data of the base key by bumping the generation, so no keyspace scans are needed.
+    Entries of old generations are never read again and simply expire.
+
+    Optionally, a per-process LRU cache is kept in front of the shared cache (see local_cache_timeout). Hits there
+    skip the network and unpickling, so callers must not modify returned instances.
+
+    Only one worker recomputes an expired entry (cache_get_or_compute), others get the stale value meanwhile.
+    Entries are also refreshed early with probability rising towards expiry, so they rarely expire under load.
+    """
+
+    # Higher values make early refresh more eager
+    cache_early_refresh_beta = 1.0
+    cache_refresh_poll_interval = 0.05
 
     @property
     def cache_timeout(self) -> int:
@@ -24,39 +48,291 @@ class QuerySetWithCache(models.query.QuerySet):
     def base_cache_key(self) -> str:
         return self.model.__name__.lower()
 
+    @property
+    def cache_stale_timeout(self) -> int:
+        """
+        Seconds for which an expired entry is still served while one worker recomputes it
+        """
+        return 60
+
+    @property
+    def cache_refresh_lock_timeout(self) -> int:
+        """
+        Max seconds one worker may take to recompute an entry before another one is allowed to
+        """
+        return 30
+
+    @property
+    def local_cache_size(self) -> int:
+        return 1000
+
+    @property
+    def local_cache_timeout(self) -> int:
+        """
+        Seconds for which generation is trusted in per-process cache. Writes in other processes may therefore be
+        seen this much later. 0 disables per-process cache
+        """
+        return 0
+
+    def get_local_cache(self) -> Optional[LocalCache]:
+        if not self.local_cache_timeout:
+            return None
+        return LocalCache.get_local_cache(
+            "queryset.%s" % self.base_cache_key, max_size=self.local_cache_size, timeout=self.local_cache_timeout
+        )
+
+    @property
+    def cache_stats_prefix(self) -> str:
+        return get_key_prefix(self.base_cache_key)
+
+    def encode_cache_value(self, value: Any) -> Any:
+        # model instances in cached entries are stored in shared cache with compact codec instead of pickle
+        if isinstance(value, CachedEntry):
+            try:
+                encoded: bytes = model_codec.dumps(value.value)
+            except model_codec.ModelCodecError:
+                # values codec doesn't know are left to cache backend's serializer
+                return value
+            record_cache_event("queryset", self.cache_stats_prefix, "set", size=len(encoded))
+            return value._replace(value=encoded)
+        return value
+
+    def decode_cache_value(self, value: Any) -> Any:
+        if isinstance(value, CachedEntry) and type(value.value) is bytes:
+            decoded: Any = model_codec.loads(value.value)
+            # entries written with another model schema are a cache miss
+            return None if decoded is None else value._replace(value=decoded)
+        return value
+
+    def cache_get(self, key: str) -> Any:
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        if local_cache is not None:
+            value: Any = local_cache.get(key)
+            if value is not None:
+                return value
+        value = self.decode_cache_value(cache.get(key))
+        if value is not None and local_cache is not None:
+            local_cache.set(key, value, timeout=self.cache_timeout + self.cache_stale_timeout)
+        return value
+
+    def cache_set(self, key: str, value: Any):
+        timeout: int = self.cache_timeout + self.cache_stale_timeout
+        cache.set(key, self.encode_cache_value(value), timeout=timeout)
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        if local_cache is not None:
+            local_cache.set(key, value, timeout=timeout)
+
+    def cache_get_many(self, keys: list) -> dict:
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        values: dict = dict()
+        if local_cache is not None:
+            values = {key: value for key in keys if (value := local_cache.get(key)) is not None}
+            keys = [key for key in keys if key not in values]
+        if keys:
+            shared_values: dict = {key: self.decode_cache_value(value) for key, value in cache.get_many(keys).items()}
+            shared_values = {key: value for key, value in shared_values.items() if value is not None}
+            if local_cache is not None:
+                for key, value in shared_values.items():
+                    local_cache.set(key, value, timeout=self.cache_timeout + self.cache_stale_timeout)
+            values.update(shared_values)
+        return values
+
+    def cache_set_many(self, data: dict):
+        timeout: int = self.cache_timeout + self.cache_stale_timeout
+        cache.set_many({key: self.encode_cache_value(value) for key, value in data.items()}, timeout=timeout)
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        if local_cache is not None:
+            for key, value in data.items():
+                local_cache.set(key, value, timeout=timeout)
+
+    def get_cached_entry(self, key: str) -> Optional[CachedEntry]:
+        entry: Any = self.cache_get(key)
+        return entry if isinstance(entry, CachedEntry) else None
+
+    def is_cached_entry_fresh(self, entry: CachedEntry) -> bool:
+        # probabilistic early expiration: the closer to expiry and the longer recomputation takes, the more likely
+        # it is that this call recomputes the entry
+        early: float = -entry.compute_time * self.cache_early_refresh_beta * math.log(1 - random.random())
+        return time.time() + early < entry.expires
+
+    def cache_get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Returns cached value for key, calling compute when it has to be (re)computed. Only one worker at a time
+        computes value for a key, others get the stale value or wait for the computed one if there is none
+        """
+        lock_key: str = "%s__refresh" % key
+        lookup_start: float = time.perf_counter()
+        entry: Optional[CachedEntry] = self.get_cached_entry(key)
+        if entry is not None and self.is_cached_entry_fresh(entry):
+            record_cache_event("queryset", self.cache_stats_prefix, "hit", duration=time.perf_counter() - lookup_start)
+            return entry.value
+
+        wait_until: float = time.time() + self.cache_refresh_lock_timeout
+        while not cache.add(lock_key, True, timeout=self.cache_refresh_lock_timeout):
+            if entry is not None:
+                # another worker is recomputing the entry
+                record_cache_event(
+                    "queryset", self.cache_stats_prefix, "stale", duration=time.perf_counter() - lookup_start
+                )
+                return entry.value
+            if time.time() > wait_until:  # pragma: no cover
+                # refresh lock wasn't released in time, computing it ourselves
+                return compute()
+            time.sleep(self.cache_refresh_poll_interval)
+            entry = self.get_cached_entry(key)
+            if entry is not None:
+                # worker holding the lock has computed the value
+                record_cache_event(
+                    "queryset", self.cache_stats_prefix, "hit", duration=time.perf_counter() - lookup_start
+                )
+                return entry.value
+
+        try:
+            if entry is None:
+                # value may have been computed and the lock released between our lookup and taking the lock
+                entry = self.get_cached_entry(key)
+                if entry is not None:
+                    record_cache_event(
+                        "queryset", self.cache_stats_prefix, "hit", duration=time.perf_counter() - lookup_start
+                    )
+                    return entry.value
+            start: float = time.time()
+            value: Any = compute()
+            end: float = time.time()
+            self.cache_set(key, CachedEntry(value, end + self.cache_timeout, end - start))
+            record_cache_event("queryset", self.cache_stats_prefix, "miss", duration=end - start)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    @property
+    def generation_cache_key(self) -> str:
+        return "%s__generation" % self.base_cache_key
+
+    def get_cache_generation(self) -> int:
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        generation: Optional[int] = None
+        if local_cache is not None:
+            generation = local_cache.get(self.generation_cache_key)
+        if generation is None:
+            generation = cache.get(self.generation_cache_key)
+            if generation is None:
+                generation = self.invalidate_cache()
+            elif local_cache is not None:
+                local_cache.set(self.generation_cache_key, generation)
+        return generation
+
+    def invalidate_cache(self) -> int:
+        # generation starts at current time, so entries of previous generations can't be hit again if the
+        # generation key gets evicted from cache
+        counter = CacheCounter.get_cache_counter(self.generation_cache_key, timeout=None)
+        generation: int = counter.incr(start=int(time.time() * 1000))
+        local_cache: Optional[LocalCache] = self.get_local_cache()
+        if local_cache is not None:
+            local_cache.set(self.generation_cache_key, generation)
+        return generation
+
+    @property
+    def versioned_base_cache_key(self) -> str:
+        return "%s__g%s" % (self.base_cache_key, self.get_cache_generation())
+
     def get_base_cache_key_item(self, pk: object) -> str:
-        return "%s__pk__%s" % (self.base_cache_key, str(pk))
+        return "%s__pk__%s" % (self.versioned_base_cache_key, str(pk))
+
+    def get_object_cache_key(self, pk: object, versioned_base_cache_key: Optional[str] = None) -> str:
+        return "%s__obj__%s" % (versioned_base_cache_key or self.versioned_base_cache_key, str(pk))
 
     def hash_args_kwargs(self, *args, **kwargs) -> str:
-        return hashlib.md5(pickle.dumps((args, sorted(kwargs.items())))).hexdigest()
+        return get_lookup_key(*args, **kwargs)
 
     def update(self, **kwargs):
         updated: Any = super().update(**kwargs)
-        self.cache_delete_pattern("%s*" % self.base_cache_key)
+        self.invalidate_cache()
         return updated
 
+    def delete(self):
+        deleted: tuple = super().delete()
+        self.invalidate_cache()
+        return deleted
+
     def get(self, *args, **kwargs):
-        ck: str = self.get_base_cache_key_item(self.hash_args_kwargs(args, kwargs))
-        cached_item: Model = cache.get(ck)
-        if cached_item:
-            return cached_item
-        item: Model = super().get(*args, **kwargs)
-        cache.set(ck, item, timeout=self.cache_timeout)
-        return item
+        ck: str = self.get_base_cache_key_item(self.hash_args_kwargs(*args, **kwargs))
+        return self.cache_get_or_compute(ck, lambda: super(QuerySetWithCache, self).get(*args, **kwargs))
+
+    def is_plain_queryset(self) -> bool:
+        """
+        Returns True if queryset returns whole model instances of all rows from default database, as cached by get_many
+        """
+        query = self.query
+        return (
+            self._iterable_class is ModelIterable
+            and not query.has_filters()
+            and not query.annotations
+            and not query.extra
+            and query.deferred_loading == (frozenset(), True)
+            and not query.select_related
+            and not query.is_sliced
+            and not self._prefetch_related_lookups
+            and self.db == DEFAULT_DB_ALIAS
+        )
+
+    def get_many(self, pks) -> dict:
+        """
+        Returns dict of pk: instance for given pks. Cached instances are read with a single cache read, the rest
+        with a single query, after which they are cached as well. Pks that don't exist are left out
+        """
+        if not self.is_plain_queryset():
+            # cached instances are shared by all querysets of the model, so they can't honour filters, annotations,
+            # deferred fields or other database
+            return super().in_bulk(pks)
+
+        versioned_base_cache_key: str = self.versioned_base_cache_key
+        keys: dict = {self.get_object_cache_key(pk, versioned_base_cache_key): pk for pk in pks}
+        now: float = time.time()
+        result: dict = dict()
+        for key, entry in self.cache_get_many(list(keys)).items():
+            if isinstance(entry, CachedEntry) and entry.expires > now:
+                result[entry.value.pk] = entry.value
+                del keys[key]
+
+        missing: list = list(keys.values())
+        if result:
+            record_cache_event("queryset", self.cache_stats_prefix, "hit", count=len(result))
+        if missing:
+            start: float = time.time()
+            items: list = list(super().filter(pk__in=missing))
+            end: float = time.time()
+            compute_time: float = (end - start) / max(len(items), 1)
+            self.cache_set_many(
+                {
+                    self.get_object_cache_key(item.pk, versioned_base_cache_key): CachedEntry(
+                        item, end + self.cache_timeout, compute_time
+                    )
+                    for item in items
+                }
+            )
+            result.update((item.pk, item) for item in items)
+            record_cache_event("queryset", self.cache_stats_prefix, "miss", duration=compute_time, count=len(missing))
+        return result
+
+    def in_bulk(self, id_list=None, *, field_name="pk"):
+        if id_list is None or field_name != "pk":
+            return super().in_bulk(id_list, field_name=field_name)
+        return self.get_many(id_list)
 
     def create(self, **kwargs):
         item: Model = super().create(**kwargs)
-        self.cache_delete_pattern("%s*" % self.base_cache_key)
+        self.invalidate_cache()
         return item
 
+    def bulk_create(self, *args, **kwargs):
+        items: list = super().bulk_create(*args, **kwargs)
+        self.invalidate_cache()
+        return items
+
     def filter(self, *args, **kwargs):
         return super().filter(*args, **kwargs)
 
     def list(self, *args, **kwargs):
-        ck: str = "%s_%s_%s" % (self.base_cache_key, "filter", self.hash_args_kwargs(args, kwargs))
-        cached_data: list = cache.get(ck)
-        if cached_data is not None:
-            return cached_data
-        _data: list = list(super().filter(*args, **kwargs))
-        cache.set(ck, _data, timeout=self.cache_timeout)
-        return _data
+        ck: str = "%s_%s_%s" % (self.versioned_base_cache_key, "filter", self.hash_args_kwargs(*args, **kwargs))
+        return self.cache_get_or_compute(ck, lambda: list(super(QuerySetWithCache, self).filter(*args, **kwargs)))
@@ -1,15 +1,31 @@
+import atexit
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+from django_project_base.caching.instrumentation import instrument_methods
 
 
 class CacheCounter:
     cache = None
     key = None
     timeout = None
+    buffered = False
 
-    def __init__(self, key, cache_name="default", timeout=-1):
+    def __init__(self, key, cache_name="default", timeout=-1, buffered=False):
+        """
+        :param buffered: if True, increments are accumulated in-process and written to cache in batches by
+            CacheCounterBuffer. incr then returns None, because the current value is not known. Use it for
+            metrics-style counters where caller doesn't need the value
+        """
+        self.cache_name = cache_name
         self.cache = caches[cache_name]
         self.set_timeout(timeout)
         self.key = key
+        self.buffered = buffered
 
     def get_default_timeout(self):
         return self.cache.default_timeout
@@ -27,7 +43,19 @@ class CacheCounter:
                 return
         self.cache.touch(self.key, self.timeout)
 
+    async def aupdate_timeout(self):
+        # touch with timeout None persists the key, also on django_redis which has no async persist
+        await self.cache.atouch(self.key, self.timeout)
+
+    def get_buffer(self):
+        return CacheCounterBuffer.get_buffer(self.cache_name)
+
     def incr(self, step=1, start=0):
+        if self.buffered:
+            buffer = self.get_buffer()
+            if buffer.add(self.key, step, start, self.timeout):
+                buffer.flush()
+            return None
         while True:
             try:
                 self.cache.add(self.key, start)
@@ -37,3 +65,120 @@ class CacheCounter:
             except ValueError:  # pragma: no cover
                 # This happens if another thread just deleted the cache entry after our .add and before our .incr
                 pass
+
+    async def aincr(self, step=1, start=0):
+        if self.buffered:
+            buffer = self.get_buffer()
+            if buffer.add(self.key, step, start, self.timeout):
+                await sync_to_async(buffer.flush)()
+            return None
+        if type(self.cache).aincr is BaseCache.aincr:
+            # Django's default aincr is a non-atomic get & set, so we fall back to backend's atomic incr
+            return await sync_to_async(self.incr)(step, start)
+        while True:
+            try:
+                await self.cache.aadd(self.key, start)
+                ret = await self.cache.aincr(self.key, step)
+                await self.aupdate_timeout()
+                return ret
+            except ValueError:  # pragma: no cover
+                # This happens if another task just deleted the cache entry after our .aadd and before our .aincr
+                pass
+
+    @classmethod
+    def incr_many(cls, steps, cache_name="default", timeout=-1, start=0):
+        """
+        Increments multiple counters
+        :param steps: dict of counter key: step
+        :return: dict of counter key: new value
+        """
+        return {key: cls(key, cache_name=cache_name, timeout=timeout).incr(step, start) for key, step in steps.items()}
+
+    @staticmethod
+    def get_cache_counter_class(cache_name="default"):
+        from django_project_base.caching.cache_queue import CacheQueue
+
+        # Redis-optimised counter only needs django_redis, not a particular redis server version
+        if CacheQueue.resolve_cache_backend(cache_name).redis_version is not None:
+            from django_project_base.caching.cache_counter_redis import CacheCounterRedis
+
+            return CacheCounterRedis
+        return CacheCounter
+
+    @staticmethod
+    def get_cache_counter(key, cache_name="default", timeout=-1, buffered=False):
+        return CacheCounter.get_cache_counter_class(cache_name)(
+            key, cache_name=cache_name, timeout=timeout, buffered=buffered
+        )
+
+
+instrument_methods(CacheCounter, "counter", ("incr", "aincr"))
+
+
+class CacheCounterBuffer:
+    """
+    Process-level write-behind buffer for buffered CacheCounters of one cache.
+
+    Increments are summed per key and written out when flush_interval seconds have passed since the first pending
+    increment or when flush_size increments are pending, whichever comes first. Each flush is a single incr_many, so
+    on redis all keys are written in one round trip.
+    Pending increments are also flushed on process exit.
+    """
+
+    _buffers = dict()
+    _buffers_lock = threading.Lock()
+
+    def __init__(self, cache_name="default"):
+        self.cache_name = cache_name
+        self.flush_interval = getattr(settings, "CACHE_COUNTER_FLUSH_INTERVAL", 1)
+        self.flush_size = getattr(settings, "CACHE_COUNTER_FLUSH_SIZE", 1000)
+        self.lock = threading.Lock()
+        self.deltas = dict()
+        self.pending = 0
+        self.timer = None
+
+    @classmethod
+    def get_buffer(cls, cache_name="default"):
+        buffer = cls._buffers.get(cache_name)
+        if buffer is None:
+            with cls._buffers_lock:
+                if not cls._buffers:
+                    atexit.register(cls.flush_all)
+                buffer = cls._buffers.setdefault(cache_name, cls(cache_name))
+        return buffer
+
+    @classmethod
+    def flush_all(cls):
+        for buffer in list(cls._buffers.values()):
+            buffer.flush()
+
+    def add(self, key, step, start, timeout):
+        """
+        Adds increment to the buffer
+        :return: True if buffer is full and should be flushed
+        """
+        with self.lock:
+            delta = self.deltas.get(key, (0,))[0]
+            self.deltas[key] = (delta + step, start, timeout)
+            self.pending += 1
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            return self.pending >= self.flush_size
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas, self.pending = self.deltas, dict(), 0
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        # increments that cancelled out don't need a write
+        groups = dict()
+        for key, (delta, start, timeout) in deltas.items():
+            if delta:
+                groups.setdefault((start, timeout), dict())[key] = delta
+
+        counter_class = CacheCounter.get_cache_counter_class(self.cache_name)
+        for (start, timeout), steps in groups.items():
+            counter_class.incr_many(steps, cache_name=self.cache_name, timeout=timeout, start=start)
@@ -0,0 +1,39 @@
+import asyncio
+import weakref
+
+# redis.asyncio clients can't be shared between event loops, so we keep one client per loop and cache name
+_connections = weakref.WeakKeyDictionary()
+
+# Connection parameters copied from the synchronous connection pool. Others are specific to the sync client
+CONNECTION_KWARGS = (
+    "host",
+    "port",
+    "path",
+    "db",
+    "username",
+    "password",
+    "socket_timeout",
+    "socket_connect_timeout",
+    "client_name",
+    "ssl_keyfile",
+    "ssl_certfile",
+    "ssl_cert_reqs",
+    "ssl_ca_certs",
+)
+
+
+def get_async_redis_connection(cache_name="default"):
+    """
+    Returns redis.asyncio client connected to the same server as django_redis cache with given name
+    """
+    loop = asyncio.get_running_loop()
+    connections = _connections.setdefault(loop, dict())
+    if cache_name not in connections:
+        from django_redis import get_redis_connection
+        from redis.asyncio import connection, ConnectionPool, Redis
+
+        sync_pool = get_redis_connection(cache_name).connection_pool
+        connection_class = getattr(connection, sync_pool.connection_class.__name__, connection.Connection)
+        kwargs = {key: value for key, value in sync_pool.connection_kwargs.items() if key in CONNECTION_KWARGS}
+        connections[cache_name] = Redis(connection_pool=ConnectionPool(connection_class=connection_class, **kwargs))
+    return connections[cache_name]
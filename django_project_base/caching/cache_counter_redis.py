@@ -0,0 +1,50 @@
+from django_redis import get_redis_connection
+
+from django_project_base.caching import CacheCounter
+from django_project_base.caching.instrumentation import instrument_methods
+
+# Initialises the counter if it doesn't exist, increments it and updates its timeout in a single atomic call
+INCR_SCRIPT = """
+redis.call("set", KEYS[1], ARGV[2], "nx")
+local value = redis.call("incrby", KEYS[1], ARGV[1])
+if ARGV[3] == "" then
+    redis.call("persist", KEYS[1])
+else
+    redis.call("pexpire", KEYS[1], ARGV[3])
+end
+return value
+"""
+
+
+class CacheCounterRedis(CacheCounter):
+    @property
+    def redis_key(self):
+        return self.cache.make_key(self.key)
+
+    def get_script_args(self, step, start):
+        return [step, start, "" if self.timeout is None else int(self.timeout * 1000)]
+
+    def incr(self, step=1, start=0, client=None):
+        if self.buffered:
+            return super().incr(step, start)
+        incr_script = get_redis_connection(self.cache_name).register_script(INCR_SCRIPT)
+        return incr_script(keys=[self.redis_key], args=self.get_script_args(step, start), client=client)
+
+    async def aincr(self, step=1, start=0):
+        if self.buffered:
+            return await super().aincr(step, start)
+        from django_project_base.caching.async_redis import get_async_redis_connection
+
+        incr_script = get_async_redis_connection(self.cache_name).register_script(INCR_SCRIPT)
+        return await incr_script(keys=[self.redis_key], args=self.get_script_args(step, start))
+
+    @classmethod
+    def incr_many(cls, steps, cache_name="default", timeout=-1, start=0):
+        # All counters are incremented in a single round trip
+        pipe = get_redis_connection(cache_name).pipeline(transaction=False)
+        for key, step in steps.items():
+            cls(key, cache_name=cache_name, timeout=timeout).incr(step, start, client=pipe)
+        return dict(zip(steps.keys(), pipe.execute()))
+
+
+instrument_methods(CacheCounterRedis, "counter", ("incr", "aincr"))
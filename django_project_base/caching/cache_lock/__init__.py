@@ -0,0 +1,57 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from django.core.cache import caches
+
+
+class CacheLockBackend(ABC):
+    key = None
+    cache = None
+    django_cache = None
+
+    def __init__(self, key, cache_name="default"):
+        self.cache_name = cache_name
+        self.django_cache = caches[self.cache_name]
+        self.set_cache()
+        self.key = key
+
+    @abstractmethod
+    def set_cache(self):
+        """Set cache client"""
+
+    @abstractmethod
+    def acquire(self) -> bool:
+        """Try to acquire the lock once. Returns True if lock was acquired"""
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float] = None):
+        """Block until the lock was (probably) released or timeout (in seconds) elapsed"""
+
+    @abstractmethod
+    def release(self):
+        """Release the lock"""
+
+    @abstractmethod
+    async def aacquire(self) -> bool:
+        """Try to acquire the lock once. Returns True if lock was acquired"""
+
+    @abstractmethod
+    async def await_release(self, timeout: Optional[float] = None):
+        """Block until the lock was (probably) released or timeout (in seconds) elapsed"""
+
+    @abstractmethod
+    async def arelease(self):
+        """Release the lock"""
+
+    @staticmethod
+    def get_cache_lock_backend(key, cache_name="default"):
+        from django_project_base.caching.cache_queue import CacheQueue
+
+        if CacheQueue.is_redis_cache_backend(cache_name):
+            from django_project_base.caching.cache_lock.cache_lock_redis import CacheLockRedis
+
+            return CacheLockRedis(key, cache_name=cache_name)
+        else:
+            from django_project_base.caching.cache_lock.cache_lock_other import CacheLockOther
+
+            return CacheLockOther(key, cache_name=cache_name)
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from typing import Optional
+
+from django_project_base.caching import CacheCounter
+from django_project_base.caching.cache_lock import CacheLockBackend
+
+
+class CacheLockOther(CacheLockBackend):
+    poll_interval = 0.1
+
+    def set_cache(self):
+        self.cache = self.django_cache
+
+    def acquire(self) -> bool:
+        return CacheCounter.get_cache_counter(self.key, cache_name=self.cache_name, timeout=None).incr() == 1
+
+    def get_poll_time(self, timeout: Optional[float] = None):
+        # Generic cache backends have no way of notifying waiters, so we just poll
+        if timeout is None:
+            timeout = self.poll_interval
+        return max(0, min(self.poll_interval, timeout))
+
+    def wait(self, timeout: Optional[float] = None):
+        time.sleep(self.get_poll_time(timeout))
+
+    def release(self):
+        self.cache.delete(self.key)
+
+    async def aacquire(self) -> bool:
+        return await CacheCounter.get_cache_counter(self.key, cache_name=self.cache_name, timeout=None).aincr() == 1
+
+    async def await_release(self, timeout: Optional[float] = None):
+        await asyncio.sleep(self.get_poll_time(timeout))
+
+    async def arelease(self):
+        await self.cache.adelete(self.key)
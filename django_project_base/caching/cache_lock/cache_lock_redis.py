@@ -0,0 +1,101 @@
+import uuid
+
+from typing import Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from django_project_base.caching.cache_lock import CacheLockBackend
+
+# Deletes the lock only if we are still its owner and wakes up one waiter
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("del", KEYS[1])
+    redis.call("del", KEYS[2])
+    redis.call("rpush", KEYS[2], 1)
+    redis.call("pexpire", KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class CacheLockRedis(CacheLockBackend):
+    # Waiters re-check the lock at least this often (seconds), e.g. when the lease of a dead owner expired
+    max_wait_interval = 1
+    # How long (milliseconds) a wake-up notification is kept for a waiter that hasn't started waiting yet
+    notify_timeout = 1000
+
+    token = None
+    release_script = None
+
+    def __init__(self, key, cache_name="default"):
+        super().__init__(key, cache_name)
+        # Lock is released automatically after this many seconds in case the owner died without releasing it. None
+        # keeps it until it is released, like locks on other cache backends
+        self.lease_timeout = getattr(settings, "CACHE_LOCK_LEASE_TIMEOUT", 3600)
+
+    def set_cache(self):
+        self.cache = get_redis_connection(self.cache_name)
+        self.release_script = self.cache.register_script(RELEASE_SCRIPT)
+
+    @property
+    def async_cache(self):
+        from django_project_base.caching.async_redis import get_async_redis_connection
+
+        return get_async_redis_connection(self.cache_name)
+
+    @property
+    def redis_key(self):
+        # same key prefix and version as the rest of the cache, so sites sharing redis database don't share locks
+        return self.django_cache.make_key(self.key)
+
+    @property
+    def notify_key(self):
+        return self.django_cache.make_key(f"{self.key}.notify")
+
+    @property
+    def lease_timeout_ms(self):
+        return None if self.lease_timeout is None else int(self.lease_timeout * 1000)
+
+    def get_wait_time(self, timeout: Optional[float] = None):
+        if timeout is None or timeout > self.max_wait_interval:
+            timeout = self.max_wait_interval
+        return timeout
+
+    def acquire(self) -> bool:
+        token = uuid.uuid4().hex
+        if self.cache.set(self.redis_key, token, nx=True, px=self.lease_timeout_ms):
+            self.token = token
+            return True
+        return False
+
+    def wait(self, timeout: Optional[float] = None):
+        timeout = self.get_wait_time(timeout)
+        if timeout > 0:
+            self.cache.blpop([self.notify_key], timeout=timeout)
+
+    def release(self):
+        if self.token is None:
+            return
+        self.release_script(keys=[self.redis_key, self.notify_key], args=[self.token, self.notify_timeout])
+        self.token = None
+
+    async def aacquire(self) -> bool:
+        token = uuid.uuid4().hex
+        if await self.async_cache.set(self.redis_key, token, nx=True, px=self.lease_timeout_ms):
+            self.token = token
+            return True
+        return False
+
+    async def await_release(self, timeout: Optional[float] = None):
+        timeout = self.get_wait_time(timeout)
+        if timeout > 0:
+            await self.async_cache.blpop([self.notify_key], timeout=timeout)
+
+    async def arelease(self):
+        if self.token is None:
+            return
+        release_script = self.async_cache.register_script(RELEASE_SCRIPT)
+        await release_script(keys=[self.redis_key, self.notify_key], args=[self.token, self.notify_timeout])
+        self.token = None
@@ -1,8 +1,25 @@
+import threading
+
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from django.conf import settings
-from django.core.cache import cache, caches
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from django_project_base.caching.instrumentation import instrument_methods
+
+
+class CacheBackendInfo(NamedTuple):
+    backend_class: type
+    redis_version: Optional[str]
+    is_redis_backend: bool
+
+
+# Process-level registry of resolved cache backends, keyed by cache name
+_cache_backends = dict()
+_cache_backends_lock = threading.Lock()
 
 
 class CacheQueue(ABC):
@@ -10,13 +27,43 @@ class CacheQueue(ABC):
     cache = None
     timeout = None
     django_cache = None
+    max_length = None
 
-    def __init__(self, key, cache_name, timeout):
+    def __init__(self, key, cache_name, timeout, max_length=None):
+        """
+        :param max_length: if set, queue is bounded. Pushes drop oldest items (from the opposite end of queue) to keep
+            queue at max_length. Number of dropped items is available in get_dropped_count
+        """
         self.cache_name = cache_name
         self.django_cache = caches[self.cache_name]
         self.set_cache()
         self.key = key
         self.set_timeout(timeout)
+        self.max_length = max_length
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every backend implementation reports its queue operations to cache statistics
+        instrument_methods(
+            cls,
+            "queue",
+            (
+                "rpush",
+                "lpush",
+                "lpop",
+                "rpop",
+                "blpop",
+                "brpop",
+                "lrange",
+                "ltrim",
+                "arpush",
+                "alpush",
+                "alpop",
+                "arpop",
+                "alrange",
+                "altrim",
+            ),
+        )
 
     @abstractmethod
     def set_cache(self):
@@ -46,6 +93,60 @@ class CacheQueue(ABC):
     def ltrim(self, count=None):
         """Remove data from start of queue"""
 
+    @abstractmethod
+    def blpop(self, timeout: float = 0, count: Optional[int] = None):
+        """
+        Get and remove data from start of queue, waiting for data if queue is empty
+        :param timeout: max seconds to wait. 0 means wait forever. Returns None if nothing arrived in time
+        """
+
+    @abstractmethod
+    def brpop(self, timeout: float = 0, count: Optional[int] = None):
+        """
+        Get and remove data from end of queue, waiting for data if queue is empty
+        :param timeout: max seconds to wait. 0 means wait forever. Returns None if nothing arrived in time
+        """
+
+    def consume(self, batch_size: int = 100, max_wait: Optional[float] = None):
+        """
+        Generator yielding lists of up to batch_size items from start of queue as they arrive.
+        :param max_wait: generator stops when no data arrives in max_wait seconds. None means wait forever, 0 means
+            only data already in queue is consumed, without waiting
+        """
+        while True:
+            if max_wait == 0:
+                batch = self.lpop(batch_size if batch_size > 1 else None)
+            else:
+                # blocking timeout 0 waits forever
+                batch = self.blpop(timeout=max_wait or 0, count=batch_size)
+            if batch is None:
+                return
+            yield batch if batch_size > 1 else [batch]
+
+    @abstractmethod
+    async def arpush(self, *values):
+        """Add data to end of queue"""
+
+    @abstractmethod
+    async def alpush(self, *values):
+        """Add data to start of queue"""
+
+    @abstractmethod
+    async def alpop(self, count: Optional[int] = None):
+        """Get and remove data from start of queue"""
+
+    @abstractmethod
+    async def arpop(self, count: Optional[int] = None):
+        """Get and remove data from end of queue"""
+
+    @abstractmethod
+    async def alrange(self, count=None):
+        """Get data from start of queue"""
+
+    @abstractmethod
+    async def altrim(self, count=None):
+        """Remove data from start of queue"""
+
     def get_default_timeout(self):
         return self.django_cache.default_timeout
 
@@ -54,65 +155,169 @@ class CacheQueue(ABC):
             timeout = self.get_default_timeout()
         self.timeout = timeout
 
+    @property
+    def dropped_key(self):
+        return f"{self.key}.dropped"
+
+    @abstractmethod
+    def get_dropped_count(self) -> int:
+        """Number of items dropped from bounded queue because of max_length"""
+
     @abstractmethod
     def update_timeout(self):
         """Update timeout of cached key"""
 
+    @abstractmethod
+    async def aupdate_timeout(self):
+        """Update timeout of cached key"""
+
+    @classmethod
+    def flush_batch(cls, cache_name, pushes):
+        """
+        Execute pushes collected by CacheQueueBatch
+        :param pushes: list of (command, key, values, timeout, max_length) tuples
+        """
+        # Consecutive pushes of same kind to same queue are merged into one call
+        merged = []
+        for command, key, values, timeout, max_length in pushes:
+            if merged and merged[-1][:2] == (command, key) and merged[-1][3:] == (timeout, max_length):
+                merged[-1][2].extend(values)
+            else:
+                merged.append((command, key, list(values), timeout, max_length))
+        for command, key, values, timeout, max_length in merged:
+            getattr(cls(key, cache_name=cache_name, timeout=timeout, max_length=max_length), command)(*values)
+
     @staticmethod
-    def is_redis_cache_backend(cache_name):
-        cache_key = f"redis_cache_backend_{cache_name}"
-        is_redis_backend = cache.get(cache_key, None)
-        if is_redis_backend is None:
-            import warnings
+    def resolve_cache_backend(cache_name):
+        """
+        Resolves backend class and redis server version for given cache. Result is kept in process-level registry,
+        so this is only done once per cache name (until refresh_cache_backend is called)
+        """
+        backend_info = _cache_backends.get(cache_name)
+        if backend_info is None:
+            with _cache_backends_lock:
+                backend_info = _cache_backends.get(cache_name)
+                if backend_info is None:
+                    backend_info = CacheQueue._resolve_cache_backend(cache_name)
+                    _cache_backends[cache_name] = backend_info
+        return backend_info
 
-            from django.utils.module_loading import import_string
-            from django_redis.cache import RedisCache
+    @staticmethod
+    def _resolve_cache_backend(cache_name):
+        import warnings
+
+        from django.utils.module_loading import import_string
 
-            backend_path = settings.CACHES[cache_name]["BACKEND"]
-            backend_class = import_string(backend_path)
-            is_redis_backend = issubclass(backend_class, RedisCache)
-
-            if is_redis_backend:
-                try:
-                    from django_redis import get_redis_connection
-                    from packaging import version
-
-                    conn = get_redis_connection(cache_name)
-
-                    # Execute the INFO command
-                    info = conn.info()
-
-                    # Get the Redis version
-                    redis_version = info.get("redis_version")
-
-                    if version.parse(redis_version) < version.parse("6.2"):
-                        # we need django_redis installed and redis server must be greater than 6.2.0
-                        warnings.warn(
-                            "You are using redis cache and have django-redis package installed, "
-                            "but redis server version is older than 6.2.0 which is needed for redis-optimised queue. "
-                            "We will be using a non-optimised queue instead."
-                        )
-                        return False
-                except ModuleNotFoundError:
-                    warnings.warn(
-                        "You are using redis cache, but django-redis package is not installed. "
-                        "If it were installed, we would be using redis-optimised Queue"
-                    )
-                    return False
+        backend_class = import_string(settings.CACHES[cache_name]["BACKEND"])
+        backend_info = CacheBackendInfo(backend_class=backend_class, redis_version=None, is_redis_backend=False)
+
+        try:
+            from django_redis.cache import RedisCache
+        except ModuleNotFoundError:
+            if backend_class.__module__.startswith("django.core.cache.backends.redis"):
+                warnings.warn(
+                    "You are using redis cache, but django-redis package is not installed. "
+                    "If it were installed, we would be using redis-optimised Queue"
+                )
             else:
                 warnings.warn("Cache backend is not RedisCache. We will be using a non-optimised queue.")
+            return backend_info
+
+        if not issubclass(backend_class, RedisCache):
+            warnings.warn("Cache backend is not RedisCache. We will be using a non-optimised queue.")
+            return backend_info
+
+        from django_redis import get_redis_connection
 
-            cache.set(cache_key, is_redis_backend)
+        try:
+            from packaging import version
+        except ModuleNotFoundError:
+            warnings.warn(
+                "You are using redis cache, but packaging package is not installed, so we can't check redis server "
+                "version. If it were installed, we would be using redis-optimised Queue"
+            )
+            return backend_info
 
-        return is_redis_backend
+        redis_version = get_redis_connection(cache_name).info().get("redis_version")
+        backend_info = backend_info._replace(redis_version=redis_version)
+        if version.parse(redis_version) < version.parse("6.2"):
+            # we need django_redis installed and redis server must be greater than 6.2.0
+            warnings.warn(
+                "You are using redis cache and have django-redis package installed, "
+                "but redis server version is older than 6.2.0 which is needed for redis-optimised queue. "
+                "We will be using a non-optimised queue instead."
+            )
+            return backend_info
+        return backend_info._replace(is_redis_backend=True)
 
     @staticmethod
-    def get_cache_queue(key, cache_name="default", timeout=-1):
+    def refresh_cache_backend(cache_name=None):
+        """
+        Drops resolved backend information so it is resolved again on next use, e.g. after redis server was upgraded
+        :param cache_name: cache to refresh. If None, all caches are refreshed
+        """
+        with _cache_backends_lock:
+            if cache_name is None:
+                _cache_backends.clear()
+            else:
+                _cache_backends.pop(cache_name, None)
+
+    @staticmethod
+    def is_redis_cache_backend(cache_name):
+        return CacheQueue.resolve_cache_backend(cache_name).is_redis_backend
+
+    @staticmethod
+    def get_cache_queue_class(cache_name="default"):
         if CacheQueue.is_redis_cache_backend(cache_name):
             from django_project_base.caching.cache_queue.cache_queue_redis import CacheQueueRedis
 
-            return CacheQueueRedis(key, cache_name=cache_name, timeout=timeout)
+            return CacheQueueRedis
         else:
             from django_project_base.caching.cache_queue.cache_queue_other import CacheQueueOther
 
-            return CacheQueueOther(key, cache_name=cache_name, timeout=timeout)
+            return CacheQueueOther
+
+    @staticmethod
+    def get_cache_queue(key, cache_name="default", timeout=-1, max_length=None):
+        return CacheQueue.get_cache_queue_class(cache_name)(
+            key, cache_name=cache_name, timeout=timeout, max_length=max_length
+        )
+
+
+class CacheQueueBatch:
+    """
+    Collects pushes to one or more queues and sends them to cache together.
+    On redis all pushes (and their timeout updates) are sent in a single round trip.
+
+    with CacheQueueBatch() as batch:
+        batch.rpush("queue1", "a", "b", timeout=3600)
+        batch.lpush("queue2", "c")
+    """
+
+    def __init__(self, cache_name="default"):
+        self.cache_name = cache_name
+        self.pushes = []
+
+    def rpush(self, key, *values, timeout=-1, max_length=None):
+        self.pushes.append(("rpush", key, values, timeout, max_length))
+
+    def lpush(self, key, *values, timeout=-1, max_length=None):
+        self.pushes.append(("lpush", key, values, timeout, max_length))
+
+    def flush(self):
+        pushes, self.pushes = self.pushes, []
+        if pushes:
+            CacheQueue.get_cache_queue_class(self.cache_name).flush_batch(self.cache_name, pushes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+
+@receiver(setting_changed)
+def refresh_cache_backends(setting, **kwargs):
+    if setting == "CACHES":
+        CacheQueue.refresh_cache_backend()
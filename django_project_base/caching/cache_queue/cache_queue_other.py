@@ -1,10 +1,39 @@
+import threading
+import time
+
 from typing import Optional
 
+from django_project_base.caching import CacheCounter
 from django_project_base.caching.cache_queue import CacheQueue
 from django_project_base.serialization import CacheLock
 
+# Blocking pops are woken up by pushes from the same process immediately. Pushes from other processes are noticed by
+#  polling. Conditions are only created for queues that someone waited on
+push_conditions = dict()
+
 
 class CacheQueueOther(CacheQueue):
+    """
+    Queue for cache backends without native list support (memcached, locmem, db, ...)
+
+    Queue is stored in fixed size chunks, each under its own cache key. Head and tail chunk numbers are kept in
+    CacheCounters so that push and pop only need to read and write the chunk at the respective end of the queue.
+    Cost of an operation therefore doesn't depend on queue length.
+
+    Chunks are written with queue timeout, but only the chunk that is changed gets its timeout refreshed. A chunk that
+    expired before the rest of the queue is treated as empty.
+    """
+
+    # Number of items stored in a single chunk
+    chunk_size = 100
+    # Number of chunks lrange fetches in a single cache call
+    lrange_page_size = 10
+    # Initial value for head and tail pointers. Memcached can't decrement counters below zero, so we start high
+    pointer_start = 1 << 32
+    # Blocking pops poll the cache with exponential backoff between these intervals (seconds)
+    min_poll_interval = 0.01
+    max_poll_interval = 0.5
+
     def set_cache(self):
         self.cache = self.django_cache
 
@@ -17,64 +46,322 @@ class CacheQueueOther(CacheQueue):
 
         return [_get_byte_value(item) for item in values]
 
+    @property
+    def head_key(self):
+        return f"{self.key}.head"
+
+    @property
+    def tail_key(self):
+        return f"{self.key}.tail"
+
+    def get_chunk_key(self, chunk: int):
+        return f"{self.key}.chunk{chunk}"
+
+    def get_pointers(self):
+        pointers = self.cache.get_many([self.head_key, self.tail_key])
+        return pointers.get(self.head_key, self.pointer_start), pointers.get(self.tail_key, self.pointer_start)
+
+    async def aget_pointers(self):
+        pointers = await self.cache.aget_many([self.head_key, self.tail_key])
+        return pointers.get(self.head_key, self.pointer_start), pointers.get(self.tail_key, self.pointer_start)
+
+    def get_length(self, head: int, tail: int, chunks: dict) -> int:
+        """
+        Queue length from head and tail chunks only: chunks between them are always full
+        :param chunks: dict containing (at least) head and tail chunk
+        """
+        head_length = len(chunks.get(self.get_chunk_key(head), []))
+        if head == tail:
+            return head_length
+        return head_length + len(chunks.get(self.get_chunk_key(tail), [])) + (tail - head - 1) * self.chunk_size
+
+    def get_pointer_counter(self, key):
+        return CacheCounter.get_cache_counter(key, cache_name=self.cache_name, timeout=self.timeout)
+
+    def get_dropped_counter(self):
+        return CacheCounter.get_cache_counter(self.dropped_key, cache_name=self.cache_name, timeout=self.timeout)
+
+    def get_dropped_count(self) -> int:
+        return self.cache.get(self.dropped_key, 0)
+
+    def move_pointer(self, key, step):
+        if step:
+            self.get_pointer_counter(key).incr(step, start=self.pointer_start)
+
+    async def amove_pointer(self, key, step):
+        if step:
+            await self.get_pointer_counter(key).aincr(step, start=self.pointer_start)
+
+    def save_chunks(self, chunks: dict):
+        empty = [key for key, chunk in chunks.items() if not chunk]
+        if empty:
+            self.cache.delete_many(empty)
+        chunks = {key: chunk for key, chunk in chunks.items() if chunk}
+        if chunks:
+            self.cache.set_many(chunks, timeout=self.timeout)
+
+    async def asave_chunks(self, chunks: dict):
+        empty = [key for key, chunk in chunks.items() if not chunk]
+        if empty:
+            await self.cache.adelete_many(empty)
+        chunks = {key: chunk for key, chunk in chunks.items() if chunk}
+        if chunks:
+            await self.cache.aset_many(chunks, timeout=self.timeout)
+
+    def add_to_chunks(self, chunk_number: int, chunk: list, values: tuple, at_start: bool) -> dict:
+        """
+        Adds values to head (at_start) or tail chunk of queue, spilling into new chunks when it is full
+        :return: dict of changed chunks (chunk key: chunk)
+        """
+        chunk_key = self.get_chunk_key(chunk_number)
+        chunks = {chunk_key: chunk}
+        for value in self.get_byte_values(values):
+            if len(chunks[chunk_key]) >= self.chunk_size:
+                chunk_key = self.get_chunk_key(chunk_number + (-len(chunks) if at_start else len(chunks)))
+                chunks[chunk_key] = []
+            if at_start:
+                chunks[chunk_key].insert(0, value)
+            else:
+                chunks[chunk_key].append(value)
+        return chunks
+
+    # noinspection PyMethodMayBeStatic
+    def take_from_chunk(self, chunk: list, count: int, from_start: bool):
+        """
+        :return: tuple (taken items in pop order, remaining chunk)
+        """
+        take = min(count, len(chunk))
+        if from_start:
+            return chunk[:take], chunk[take:]
+        return list(reversed(chunk[len(chunk) - take :])), chunk[: len(chunk) - take]
+
+    # noinspection PyMethodMayBeStatic
+    def get_pop_result(self, ret: list, count: int):
+        if not ret:
+            return None
+        if count > 1:
+            return ret
+        else:
+            return ret[0]
+
+    def get_lrange_pages(self, head: int, tail: int):
+        while head <= tail:
+            page_end = min(head + self.lrange_page_size, tail + 1)
+            yield [self.get_chunk_key(chunk) for chunk in range(head, page_end)]
+            head = page_end
+
+    def notify_push(self):
+        condition = push_conditions.get((self.cache_name, self.key))
+        if condition is not None:
+            with condition:
+                condition.notify_all()
+
+    def is_empty(self):
+        head, tail = self.get_pointers()
+        return head == tail and not self.cache.get(self.get_chunk_key(head))
+
     def rpush(self, *values):
         with CacheLock(self.key):
-            cache_list = self.cache.get(self.key, [])
-            cache_list.extend(self.get_byte_values(values))
-            self.cache.set(self.key, cache_list)
+            head, tail = self.get_pointers()
+            chunk_key = self.get_chunk_key(tail)
+            chunks = self.add_to_chunks(tail, self.cache.get(chunk_key, []), values, False)
+            self.save_chunks(chunks)
+            self.move_pointer(self.tail_key, len(chunks) - 1)
             self.update_timeout()
+            self.enforce_max_length(True)
+        self.notify_push()
 
     def lpush(self, *values):
         with CacheLock(self.key):
-            cache_list = self.cache.get(self.key, [])
-            cache_list[:0] = reversed(self.get_byte_values(values))
-            self.cache.set(self.key, cache_list)
+            head, tail = self.get_pointers()
+            chunk_key = self.get_chunk_key(head)
+            chunks = self.add_to_chunks(head, self.cache.get(chunk_key, []), values, True)
+            self.save_chunks(chunks)
+            self.move_pointer(self.head_key, 1 - len(chunks))
             self.update_timeout()
+            self.enforce_max_length(False)
+        self.notify_push()
+
+    def _pop(self, count: int, from_start: bool):
+        with CacheLock(self.key):
+            return self._pop_locked(count, from_start)
+
+    def _pop_locked(self, count: int, from_start: bool):
+        ret = []
+        start_head, start_tail = head, tail = self.get_pointers()
+        chunks = {}
+        while len(ret) < count and head <= tail:
+            chunk_key = self.get_chunk_key(head if from_start else tail)
+            taken, chunks[chunk_key] = self.take_from_chunk(self.cache.get(chunk_key, []), count - len(ret), from_start)
+            ret.extend(taken)
+            if chunks[chunk_key] or head == tail:
+                break
+            if from_start:
+                head += 1
+            else:
+                tail -= 1
+        self.save_chunks(chunks)
+        self.move_pointer(self.head_key, head - start_head)
+        self.move_pointer(self.tail_key, tail - start_tail)
+        self.update_timeout()
+        return ret
+
+    def enforce_max_length(self, from_start: bool):
+        """Drops items over max_length from start or end of queue"""
+        if not self.max_length:
+            return
+        head, tail = self.get_pointers()
+        chunks = self.cache.get_many([self.get_chunk_key(head), self.get_chunk_key(tail)])
+        dropped = self.get_length(head, tail, chunks) - self.max_length
+        if dropped > 0:
+            self._pop_locked(dropped, from_start)
+            self.get_dropped_counter().incr(dropped)
 
     def lpop(self, count: Optional[int] = None):
         if not count or count <= 0:
             count = 1
-        with CacheLock(self.key):
-            cache_list = self.cache.get(self.key, [])
-            ret = cache_list[:count]
-            cache_list = cache_list[count:]
-            self.cache.set(self.key, cache_list)
-            self.update_timeout()
-        if not ret:
-            return None
-        if count > 1:
-            return ret
-        else:
-            return ret[0]
+        return self.get_pop_result(self._pop(count, True), count)
 
     def rpop(self, count: Optional[int] = None):
         if not count or count <= 0:
             count = 1
-        with CacheLock(self.key):
-            cache_list = self.cache.get(self.key, [])
-            ret = cache_list[-count:]
-            cache_list = cache_list[:-count]
-            self.cache.set(self.key, cache_list)
-            self.update_timeout()
-        if not ret:
-            return None
-        if count > 1:
-            ret.reverse()
-            return ret
-        else:
-            return ret[0]
+        return self.get_pop_result(self._pop(count, False), count)
+
+    def _bpop(self, timeout: float, count: Optional[int], from_start: bool):
+        if not count or count <= 0:
+            count = 1
+        deadline = time.monotonic() + timeout if timeout else None
+        poll_interval = self.min_poll_interval
+        condition = push_conditions.setdefault((self.cache_name, self.key), threading.Condition())
+        # Condition is held while checking the queue, so a push from this process can't slip in before we wait
+        with condition:
+            while True:
+                if not self.is_empty():
+                    ret = self._pop(count, from_start)
+                    if ret:
+                        return self.get_pop_result(ret, count)
+                wait = poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return None
+                if not condition.wait(wait):
+                    poll_interval = min(poll_interval * 2, self.max_poll_interval)
+
+    def blpop(self, timeout: float = 0, count: Optional[int] = None):
+        return self._bpop(timeout, count, True)
+
+    def brpop(self, timeout: float = 0, count: Optional[int] = None):
+        return self._bpop(timeout, count, False)
 
     def lrange(self, count=None):
         if count is not None:
             count = count + 1
-        return self.cache.get(self.key, [])[0:count]
+        ret = []
+        for chunk_keys in self.get_lrange_pages(*self.get_pointers()):
+            chunks = self.cache.get_many(chunk_keys)
+            for chunk_key in chunk_keys:
+                ret.extend(chunks.get(chunk_key, []))
+            if count is not None and len(ret) >= count:
+                break
+        return ret[0:count]
 
     def ltrim(self, count=None):
-        with CacheLock(self.key):
-            cache_list = self.cache.get(self.key, [])
-            cache_list = cache_list[count:None]
-            self.cache.set(self.key, cache_list)
-            self.update_timeout()
+        if count is not None and count < 0:
+            count = max(len(self.lrange()) + count, 0)
+        if count:
+            self._pop(count, True)
 
     def update_timeout(self):
-        self.cache.touch(self.key, self.timeout)
+        self.cache.touch(self.head_key, self.timeout)
+        self.cache.touch(self.tail_key, self.timeout)
+
+    async def arpush(self, *values):
+        async with CacheLock(self.key):
+            head, tail = await self.aget_pointers()
+            chunk_key = self.get_chunk_key(tail)
+            chunks = self.add_to_chunks(tail, await self.cache.aget(chunk_key, []), values, False)
+            await self.asave_chunks(chunks)
+            await self.amove_pointer(self.tail_key, len(chunks) - 1)
+            await self.aupdate_timeout()
+            await self.aenforce_max_length(True)
+        self.notify_push()
+
+    async def alpush(self, *values):
+        async with CacheLock(self.key):
+            head, tail = await self.aget_pointers()
+            chunk_key = self.get_chunk_key(head)
+            chunks = self.add_to_chunks(head, await self.cache.aget(chunk_key, []), values, True)
+            await self.asave_chunks(chunks)
+            await self.amove_pointer(self.head_key, 1 - len(chunks))
+            await self.aupdate_timeout()
+            await self.aenforce_max_length(False)
+        self.notify_push()
+
+    async def _apop(self, count: int, from_start: bool):
+        async with CacheLock(self.key):
+            return await self._apop_locked(count, from_start)
+
+    async def _apop_locked(self, count: int, from_start: bool):
+        ret = []
+        start_head, start_tail = head, tail = await self.aget_pointers()
+        chunks = {}
+        while len(ret) < count and head <= tail:
+            chunk_key = self.get_chunk_key(head if from_start else tail)
+            taken, chunks[chunk_key] = self.take_from_chunk(
+                await self.cache.aget(chunk_key, []), count - len(ret), from_start
+            )
+            ret.extend(taken)
+            if chunks[chunk_key] or head == tail:
+                break
+            if from_start:
+                head += 1
+            else:
+                tail -= 1
+        await self.asave_chunks(chunks)
+        await self.amove_pointer(self.head_key, head - start_head)
+        await self.amove_pointer(self.tail_key, tail - start_tail)
+        await self.aupdate_timeout()
+        return ret
+
+    async def aenforce_max_length(self, from_start: bool):
+        if not self.max_length:
+            return
+        head, tail = await self.aget_pointers()
+        chunks = await self.cache.aget_many([self.get_chunk_key(head), self.get_chunk_key(tail)])
+        dropped = self.get_length(head, tail, chunks) - self.max_length
+        if dropped > 0:
+            await self._apop_locked(dropped, from_start)
+            await self.get_dropped_counter().aincr(dropped)
+
+    async def alpop(self, count: Optional[int] = None):
+        if not count or count <= 0:
+            count = 1
+        return self.get_pop_result(await self._apop(count, True), count)
+
+    async def arpop(self, count: Optional[int] = None):
+        if not count or count <= 0:
+            count = 1
+        return self.get_pop_result(await self._apop(count, False), count)
+
+    async def alrange(self, count=None):
+        if count is not None:
+            count = count + 1
+        ret = []
+        for chunk_keys in self.get_lrange_pages(*(await self.aget_pointers())):
+            chunks = await self.cache.aget_many(chunk_keys)
+            for chunk_key in chunk_keys:
+                ret.extend(chunks.get(chunk_key, []))
+            if count is not None and len(ret) >= count:
+                break
+        return ret[0:count]
+
+    async def altrim(self, count=None):
+        if count is not None and count < 0:
+            count = max(len(await self.alrange()) + count, 0)
+        if count:
+            await self._apop(count, True)
+
+    async def aupdate_timeout(self):
+        await self.cache.atouch(self.head_key, self.timeout)
+        await self.cache.atouch(self.tail_key, self.timeout)
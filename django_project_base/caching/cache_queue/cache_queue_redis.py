@@ -4,38 +4,147 @@ from django_redis import get_redis_connection
 
 from django_project_base.caching.cache_queue import CacheQueue
 
+# Push to bounded queue: trims the queue to max_length, counts dropped items and updates timeouts
+BOUNDED_PUSH_SCRIPT = """
+local length = redis.call(ARGV[1], KEYS[1], unpack(ARGV, 4))
+local dropped = length - tonumber(ARGV[2])
+if dropped > 0 then
+    if ARGV[1] == "rpush" then
+        redis.call("ltrim", KEYS[1], dropped, -1)
+    else
+        redis.call("ltrim", KEYS[1], 0, tonumber(ARGV[2]) - 1)
+    end
+    redis.call("incrby", KEYS[2], dropped)
+end
+for _, key in ipairs(KEYS) do
+    if ARGV[3] == "" then
+        redis.call("persist", key)
+    else
+        redis.call("expire", key, ARGV[3])
+    end
+end
+return math.max(dropped, 0)
+"""
+
 
 class CacheQueueRedis(CacheQueue):
     def set_cache(self):
         self.cache = get_redis_connection(self.cache_name)
 
+    @property
+    def async_cache(self):
+        from django_project_base.caching.async_redis import get_async_redis_connection
+
+        return get_async_redis_connection(self.cache_name)
+
+    def execute(self, command, *args):
+        # Command and timeout update are sent to redis in a single MULTI / EXEC round trip
+        pipe = self.cache.pipeline()
+        getattr(pipe, command)(self.key, *args)
+        self.update_timeout(pipe)
+        return pipe.execute()[0]
+
+    async def aexecute(self, command, *args):
+        pipe = self.async_cache.pipeline()
+        getattr(pipe, command)(self.key, *args)
+        self.update_timeout(pipe)
+        return (await pipe.execute())[0]
+
+    def get_bounded_push_args(self, command, values):
+        return dict(
+            keys=[self.key, self.dropped_key],
+            args=[command, self.max_length, "" if self.timeout is None else self.timeout, *values],
+        )
+
+    def push(self, command, *values, client=None):
+        if not self.max_length:
+            if client is None:
+                self.execute(command, *values)
+            else:
+                getattr(client, command)(self.key, *values)
+                self.update_timeout(client)
+            return
+        bounded_push = self.cache.register_script(BOUNDED_PUSH_SCRIPT)
+        bounded_push(client=client, **self.get_bounded_push_args(command, values))
+
+    async def apush(self, command, *values):
+        if not self.max_length:
+            await self.aexecute(command, *values)
+            return
+        bounded_push = self.async_cache.register_script(BOUNDED_PUSH_SCRIPT)
+        await bounded_push(**self.get_bounded_push_args(command, values))
+
     def rpush(self, *values):
-        self.cache.rpush(self.key, *values)
-        self.update_timeout()
+        self.push("rpush", *values)
 
     def lpush(self, *values):
-        self.cache.lpush(self.key, *values)
-        self.update_timeout()
+        self.push("lpush", *values)
 
     def rpop(self, count: Optional[int] = None):
-        ret = self.cache.rpop(self.key, count)
-        self.update_timeout()
-        return ret
+        return self.execute("rpop", count)
 
     def lpop(self, count: Optional[int] = None):
-        ret = self.cache.lpop(self.key, count)
-        self.update_timeout()
-        return ret
+        return self.execute("lpop", count)
+
+    def _bpop(self, blocking_command, command, timeout: float, count: Optional[int]):
+        ret = getattr(self.cache, blocking_command)([self.key], timeout=timeout)
+        if ret is None:
+            return None
+        if not count or count <= 1:
+            self.update_timeout()
+            return ret[1]
+        # Once there is data, we take the rest of the batch without blocking
+        return [ret[1]] + (self.execute(command, count - 1) or [])
+
+    def blpop(self, timeout: float = 0, count: Optional[int] = None):
+        return self._bpop("blpop", "lpop", timeout, count)
+
+    def brpop(self, timeout: float = 0, count: Optional[int] = None):
+        return self._bpop("brpop", "rpop", timeout, count)
 
     def lrange(self, count=-1):
         return self.cache.lrange(self.key, 0, count)
 
     def ltrim(self, count=0):
-        self.cache.ltrim(self.key, count, -1)
-        self.update_timeout()
+        self.execute("ltrim", count, -1)
 
-    def update_timeout(self):
+    async def arpush(self, *values):
+        await self.apush("rpush", *values)
+
+    async def alpush(self, *values):
+        await self.apush("lpush", *values)
+
+    async def arpop(self, count: Optional[int] = None):
+        return await self.aexecute("rpop", count)
+
+    async def alpop(self, count: Optional[int] = None):
+        return await self.aexecute("lpop", count)
+
+    async def alrange(self, count=-1):
+        return await self.async_cache.lrange(self.key, 0, count)
+
+    async def altrim(self, count=0):
+        await self.aexecute("ltrim", count, -1)
+
+    def get_dropped_count(self) -> int:
+        return int(self.cache.get(self.dropped_key) or 0)
+
+    def update_timeout(self, client=None):
+        client = client or self.cache
         if self.timeout is None:
-            self.cache.persist(self.key)
+            client.persist(self.key)
         else:
-            self.cache.expire(self.key, self.timeout)
+            client.expire(self.key, self.timeout)
+
+    async def aupdate_timeout(self):
+        if self.timeout is None:
+            await self.async_cache.persist(self.key)
+        else:
+            await self.async_cache.expire(self.key, self.timeout)
+
+    @classmethod
+    def flush_batch(cls, cache_name, pushes):
+        pipe = get_redis_connection(cache_name).pipeline(transaction=False)
+        for command, key, values, timeout, max_length in pushes:
+            cls(key, cache_name=cache_name, timeout=timeout, max_length=max_length).push(command, *values, client=pipe)
+        pipe.execute()
@@ -0,0 +1,259 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+# Upper bounds (seconds) of latency histogram buckets. Last bucket holds everything slower
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STATS_QUEUE_KEY = "cache_stats"
+
+# Events counted as cache hits and misses when calculating hit rate
+HIT_EVENTS = ("hit", "local_hit", "request_hit", "stale")
+MISS_EVENTS = ("miss",)
+
+# Numbers and hashes in keys are replaced, so that e.g. all user keys are reported under the same prefix
+_key_variable_parts = re.compile(r"[0-9a-f]{32}|\d+")
+
+_suppressed = threading.local()
+
+# Object whose instrumented method is currently running. Calls it makes to its own instrumented methods (e.g. a
+# subclass calling super().incr or aincr falling back to incr) are part of the same operation and aren't recorded
+_instrumented_call = contextvars.ContextVar("instrumented_call", default=None)
+
+
+def get_key_prefix(key) -> str:
+    return _key_variable_parts.sub("#", str(key))
+
+
+def get_latency_bucket(duration: float) -> int:
+    for bucket, upper_bound in enumerate(LATENCY_BUCKETS):
+        if duration <= upper_bound:
+            return bucket
+    return len(LATENCY_BUCKETS)
+
+
+class CacheStats:
+    """
+    Process-level collector of cache statistics: per component and key prefix it counts events (hits, misses, ...)
+    and keeps latency histograms and payload sizes for them.
+
+    Statistics are aggregated in-process and pushed to a bounded CacheQueue in batches, every flush_interval
+    seconds. get_cache_stats merges batches of all processes.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.enabled = getattr(settings, "CACHE_STATS_ENABLED", True)
+        self.flush_interval = getattr(settings, "CACHE_STATS_FLUSH_INTERVAL", 10)
+        self.max_batches = getattr(settings, "CACHE_STATS_MAX_BATCHES", 10000)
+        self.timeout = getattr(settings, "CACHE_STATS_TIMEOUT", 3600)
+        self.lock = threading.Lock()
+        self.data = dict()
+        self.timer = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    atexit.register(cls._instance.flush)
+        return cls._instance
+
+    def record(self, component, prefix, event, duration=None, size=None, count=1):
+        if not self.enabled or getattr(_suppressed, "value", False):
+            return
+        name = "%s|%s" % (component, prefix)
+        with self.lock:
+            stats = self.data.get(name)
+            if stats is None:
+                stats = self.data[name] = dict(events=dict(), latency=dict(), size=dict())
+            stats["events"][event] = stats["events"].get(event, 0) + count
+            if duration is not None:
+                latency = stats["latency"].get(event)
+                if latency is None:
+                    latency = stats["latency"][event] = [0, 0.0, [0] * (len(LATENCY_BUCKETS) + 1)]
+                latency[0] += count
+                latency[1] += duration * count
+                latency[2][get_latency_bucket(duration)] += count
+            if size is not None:
+                sizes = stats["size"].get(event)
+                if sizes is None:
+                    sizes = stats["size"][event] = [0, 0, 0]
+                sizes[0] += count
+                sizes[1] += size * count
+                sizes[2] = max(sizes[2], size)
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def get_queue(self):
+        from django_project_base.caching.cache_queue import CacheQueue
+
+        return CacheQueue.get_cache_queue(STATS_QUEUE_KEY, timeout=self.timeout, max_length=self.max_batches)
+
+    def flush(self):
+        with self.lock:
+            data, self.data = self.data, dict()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not data:
+            return
+        batch = dict(timestamp=time.time(), host=socket.gethostname(), pid=os.getpid(), stats=data)
+        # pushing the batch would otherwise record statistics of its own, keeping idle processes flushing forever
+        _suppressed.value = True
+        try:
+            self.get_queue().rpush(json.dumps(batch))
+        finally:
+            _suppressed.value = False
+
+    def get_batches(self, since=None, until=None):
+        batches = [json.loads(batch) for batch in self.get_queue().lrange()]
+        if since is not None:
+            batches = [batch for batch in batches if batch["timestamp"] >= since]
+        if until is not None:
+            batches = [batch for batch in batches if batch["timestamp"] <= until]
+        return batches
+
+
+def record_cache_event(component, prefix, event, duration=None, size=None, count=1):
+    """
+    Records a cache event, e.g. record_cache_event("users", "user", "hit", duration=0.0002)
+    :param duration: seconds the operation took. Kept in latency histogram of the event
+    :param size: payload size in bytes
+    :param count: number of identical events, e.g. hits of a batched read
+    """
+    CacheStats.get_instance().record(component, prefix, event, duration, size, count)
+
+
+def instrument_methods(cls, component, methods, get_prefix=lambda self: get_key_prefix(self.key)):
+    """
+    Records count and latency of given methods defined on cls. Both plain and async methods are supported.
+    Only the outermost instrumented call on an object is recorded, so overrides calling super() count once
+    """
+
+    def _instrument(method):
+        event = method.__name__
+
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def _async_wrapper(self, *args, **kwargs):
+                if _instrumented_call.get() is self:
+                    return await method(self, *args, **kwargs)
+                token = _instrumented_call.set(self)
+                start = time.perf_counter()
+                try:
+                    return await method(self, *args, **kwargs)
+                finally:
+                    _instrumented_call.reset(token)
+                    record_cache_event(component, get_prefix(self), event, duration=time.perf_counter() - start)
+
+            return _async_wrapper
+
+        @functools.wraps(method)
+        def _wrapper(self, *args, **kwargs):
+            if _instrumented_call.get() is self:
+                return method(self, *args, **kwargs)
+            token = _instrumented_call.set(self)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _instrumented_call.reset(token)
+                record_cache_event(component, get_prefix(self), event, duration=time.perf_counter() - start)
+
+        return _wrapper
+
+    for method_name in methods:
+        if method_name in cls.__dict__:
+            setattr(cls, method_name, _instrument(cls.__dict__[method_name]))
+
+
+def get_percentile(buckets, count, percentile) -> float:
+    """
+    Returns upper bound (ms) of histogram bucket holding given percentile. Values slower than the last bucket are
+    reported as the last bucket's bound
+    """
+    threshold = count * percentile
+    total = 0
+    for bucket, bucket_count in enumerate(buckets):
+        total += bucket_count
+        if total >= threshold and bucket_count:
+            return LATENCY_BUCKETS[min(bucket, len(LATENCY_BUCKETS) - 1)] * 1000
+    return 0
+
+
+def get_cache_stats(since=None, until=None) -> list:
+    """
+    Returns statistics merged from flushed batches of all processes
+    :param since: only batches flushed after this timestamp are included
+    :param until: only batches flushed before this timestamp are included
+    :return: list of dicts, one per component, prefix and event. Latencies are in ms, hit rate is for the whole
+        component and prefix
+    """
+    merged = dict()
+    for batch in CacheStats.get_instance().get_batches(since, until):
+        for name, stats in batch["stats"].items():
+            for event, count in stats["events"].items():
+                row = merged.get((name, event))
+                if row is None:
+                    component, prefix = name.split("|", 1)
+                    row = merged[(name, event)] = dict(
+                        component=component,
+                        prefix=prefix,
+                        event=event,
+                        count=0,
+                        latency_count=0,
+                        latency_sum=0.0,
+                        latency_buckets=[0] * (len(LATENCY_BUCKETS) + 1),
+                        size_count=0,
+                        size_sum=0,
+                        size_max=0,
+                    )
+                row["count"] += count
+                latency = stats["latency"].get(event)
+                if latency:
+                    row["latency_count"] += latency[0]
+                    row["latency_sum"] += latency[1]
+                    row["latency_buckets"] = [a + b for a, b in zip(row["latency_buckets"], latency[2])]
+                size = stats["size"].get(event)
+                if size:
+                    row["size_count"] += size[0]
+                    row["size_sum"] += size[1]
+                    row["size_max"] = max(row["size_max"], size[2])
+
+    hits, misses = dict(), dict()
+    for (name, event), row in merged.items():
+        if event in HIT_EVENTS:
+            hits[name] = hits.get(name, 0) + row["count"]
+        elif event in MISS_EVENTS:
+            misses[name] = misses.get(name, 0) + row["count"]
+
+    rows = []
+    for (name, event), row in merged.items():
+        lookups = hits.get(name, 0) + misses.get(name, 0)
+        latency_count = row["latency_count"]
+        row.update(
+            latency_avg=row["latency_sum"] * 1000 / latency_count if latency_count else None,
+            latency_p50=get_percentile(row["latency_buckets"], latency_count, 0.5) if latency_count else None,
+            latency_p99=get_percentile(row["latency_buckets"], latency_count, 0.99) if latency_count else None,
+            size_avg=row["size_sum"] / row["size_count"] if row["size_count"] else None,
+            hit_rate=hits.get(name, 0) / lookups if lookups else None,
+        )
+        rows.append(row)
+    rows.sort(key=lambda r: (r["component"], r["prefix"], r["event"]))
+    return rows
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class LocalCache:
+    """
+    Thread-safe in-process LRU cache with size and TTL limits. Values are stored as they are (not pickled), so
+    callers must not modify objects they get from it.
+    """
+
+    _caches = dict()
+    _caches_lock = threading.Lock()
+
+    def __init__(self, max_size=1000, timeout=5):
+        """
+        :param max_size: max number of entries. Least recently used entries are dropped first
+        :param timeout: seconds after which an entry expires
+        """
+        self.max_size = max_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    @classmethod
+    def get_local_cache(cls, name, max_size=1000, timeout=5):
+        """
+        Returns process-level cache with given name, creating it on first use
+        """
+        local_cache = cls._caches.get(name)
+        if local_cache is None:
+            with cls._caches_lock:
+                local_cache = cls._caches.setdefault(name, cls(max_size, timeout))
+        return local_cache
+
+    @classmethod
+    def clear_all(cls):
+        for local_cache in list(cls._caches.values()):
+            local_cache.clear()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        """
+        :param timeout: overrides cache's timeout for this entry
+        """
+        expires = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self.lock:
+            self.data[key] = (expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+@receiver(setting_changed)
+def clear_local_caches(setting, **kwargs):
+    # local caches sit in front of shared caches, so they are stale when those change
+    if setting == "CACHES":
+        LocalCache.clear_all()
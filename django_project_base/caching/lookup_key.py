@@ -0,0 +1,87 @@
+import datetime
+import decimal
+import enum
+import functools
+import hashlib
+import pickle
+import uuid
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Model, Q, QuerySet
+
+# Values with a stable repr that identifies them together with their type
+PRIMITIVE_TYPES = (
+    str,
+    int,
+    float,
+    bool,
+    bytes,
+    type(None),
+    decimal.Decimal,
+    datetime.datetime,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+    uuid.UUID,
+)
+PRIMITIVE_TYPE_SET = frozenset(PRIMITIVE_TYPES)
+
+
+def encode_lookup_value(value) -> str:
+    """
+    Encodes lookup value into a string which is the same for logically identical values
+    """
+    value_type = type(value)
+    # fast paths for the most common values
+    if value_type in PRIMITIVE_TYPE_SET:
+        return repr(value)
+    if value_type is tuple or value_type is list:
+        return "(%s)" % ",".join([encode_lookup_value(item) for item in value])
+    if isinstance(value, PRIMITIVE_TYPES):
+        return repr(value)
+    if isinstance(value, enum.Enum):
+        return "%s.%s" % (type(value).__qualname__, value.name)
+    if isinstance(value, Model):
+        return "%s(%s)" % (value._meta.label, encode_lookup_value(value.pk))
+    if isinstance(value, Q):
+        # AND and OR don't depend on the order of their children
+        children = sorted([encode_lookup_value(child) for child in value.children])
+        return "%sQ(%s:%s)" % ("~" if value.negated else "", value.connector, ",".join(children))
+    if isinstance(value, QuerySet):
+        try:
+            sql, params = value.query.sql_with_params()
+        except EmptyResultSet:
+            sql, params = "", ()
+        return "%s[%s|%s]" % (value.model._meta.label, sql, encode_lookup_value(params))
+    if isinstance(value, (list, tuple)):
+        return "(%s)" % ",".join(encode_lookup_value(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return "{%s}" % ",".join(sorted(encode_lookup_value(item) for item in value))
+    if isinstance(value, dict):
+        items = sorted("%s:%s" % (encode_lookup_value(k), encode_lookup_value(v)) for k, v in value.items())
+        return "{%s}" % ",".join(items)
+    return "pickle:%s" % hashlib.md5(pickle.dumps(value)).hexdigest()
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_memoized_lookup_key(args, kwargs, types) -> str:
+    # types are part of memoization key, so that e.g. 1 and True don't share a key
+    return _get_lookup_key(args, dict(kwargs))
+
+
+def _get_lookup_key(args, kwargs) -> str:
+    encoded = "%s|%s" % (encode_lookup_value(args), encode_lookup_value(kwargs))
+    return hashlib.md5(encoded.encode()).hexdigest()
+
+
+def get_lookup_key(*args, **kwargs) -> str:
+    """
+    Returns canonical hash of lookup arguments, e.g. those passed to QuerySet.filter. Logically identical lookups
+    (also with Q objects, model instances and querysets) get the same key.
+    Keys of lookups with only primitive values are memoized
+    """
+    items = tuple(sorted(kwargs.items()))
+    types = (*map(type, args), *(type(value) for _, value in items))
+    if PRIMITIVE_TYPE_SET.issuperset(types):
+        return _get_memoized_lookup_key(args, items, types)
+    return _get_lookup_key(args, kwargs)
@@ -0,0 +1,184 @@
+"""
+Compact encoding of model instances for caching.
+
+Instance is stored as its concrete field values (no _state or related object caches) and rebuilt with Model.from_db.
+The payload carries a schema version and a fingerprint of model's fields, so entries written before a model or codec
+change decode as None, which callers treat as a cache miss.
+
+Payload is JSON, so it doesn't depend on the Python version and workers running different versions read each other's
+entries. Strings, numbers, booleans, None and lists are stored as they are, other values as single key objects
+{tag: data}, so tags can't be confused with field data. Field values of types the codec doesn't know are stored as
+strings of their model field, like Django's serializers do. Other values of unknown types raise ModelCodecError.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import uuid
+import zlib
+
+from typing import Any, Optional
+
+from django.apps import apps
+from django.db.models import Model
+from django.db.models.fields.files import FieldFile
+
+SCHEMA_VERSION = 2
+# Only exact types, their subclasses (e.g. enums) would be decoded as the base type
+PRIMITIVE_TYPES = frozenset((str, int, float, bool))
+# JSON types that need decoding, all others are stored as they are
+CONTAINER_TYPES = frozenset((list, dict))
+
+_model_fields = dict()
+_models = dict()
+
+
+class ModelCodecError(Exception):
+    """Raised when value can't be encoded or cached payload can't be decoded"""
+
+
+def get_model_fields(model) -> tuple:
+    """
+    Returns concrete fields of model, their attnames and fingerprint
+    """
+    fields = _model_fields.get(model)
+    if fields is None:
+        concrete_fields = tuple(model._meta.concrete_fields)
+        attnames = tuple(field.attname for field in concrete_fields)
+        fields = _model_fields[model] = (concrete_fields, attnames, zlib.crc32(",".join(attnames).encode()))
+    return fields
+
+
+def _encode_value(value) -> Any:
+    value_type = type(value)
+    if value is None or value_type in PRIMITIVE_TYPES:
+        return value
+    if value_type is list:
+        return [_encode_value(item) for item in value]
+    if isinstance(value, Model):
+        return {"model": _encode_model(value)}
+    if isinstance(value, FieldFile):
+        # file descriptor wraps the stored name again when field is accessed
+        return value.name
+    if value_type is tuple:
+        return {"tuple": [_encode_value(item) for item in value]}
+    if value_type is dict:
+        # keys are not necessarily strings
+        return {"dict": [[_encode_value(key), _encode_value(item)] for key, item in value.items()]}
+    if value_type is set:
+        return {"set": [_encode_value(item) for item in value]}
+    if value_type is frozenset:
+        return {"frozenset": [_encode_value(item) for item in value]}
+    if value_type is bytes:
+        return {"bytes": base64.b64encode(value).decode()}
+    if value_type is datetime.datetime:
+        return {"datetime": value.isoformat()}
+    if value_type is datetime.date:
+        return {"date": value.isoformat()}
+    if value_type is datetime.time:
+        return {"time": value.isoformat()}
+    if value_type is datetime.timedelta:
+        return {"timedelta": [value.days, value.seconds, value.microseconds]}
+    if value_type is decimal.Decimal:
+        return {"decimal": str(value)}
+    if value_type is uuid.UUID:
+        return {"uuid": value.hex}
+    raise ModelCodecError("Values of type %s can't be encoded" % value_type.__name__)
+
+
+def _decode_value(value) -> Any:
+    value_type = type(value)
+    if value_type not in CONTAINER_TYPES:
+        return value
+    if value_type is list:
+        return [_decode_value(item) for item in value]
+    ((tag, data),) = value.items()
+    if tag == "model":
+        return _decode_model(data)
+    if tag == "tuple":
+        return tuple(_decode_value(item) for item in data)
+    if tag == "dict":
+        return {_decode_value(key): _decode_value(item) for key, item in data}
+    if tag == "set":
+        return {_decode_value(item) for item in data}
+    if tag == "frozenset":
+        return frozenset(_decode_value(item) for item in data)
+    if tag == "bytes":
+        return base64.b64decode(data)
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(data)
+    if tag == "date":
+        return datetime.date.fromisoformat(data)
+    if tag == "time":
+        return datetime.time.fromisoformat(data)
+    if tag == "timedelta":
+        return datetime.timedelta(*data)
+    if tag == "decimal":
+        return decimal.Decimal(data)
+    if tag == "uuid":
+        return uuid.UUID(data)
+    raise ModelCodecError("Unknown value tag %s" % tag)
+
+
+def _encode_field_value(instance: Model, field, value) -> Any:
+    try:
+        return _encode_value(value)
+    except ModelCodecError:
+        return {"field": field.value_to_string(instance)}
+
+
+def _encode_model(instance: Model) -> list:
+    fields, attnames, fingerprint = get_model_fields(type(instance))
+    loaded = instance.__dict__
+    if all(attname in loaded for attname in attnames):
+        # all fields are loaded, so their names don't need to be stored
+        names = None
+        values = [_encode_field_value(instance, field, loaded[field.attname]) for field in fields]
+    else:
+        names = [attname for attname in attnames if attname in loaded]
+        values = [
+            _encode_field_value(instance, field, loaded[field.attname]) for field in fields if field.attname in loaded
+        ]
+    return [instance._meta.label, fingerprint, instance._state.db, names, values]
+
+
+def _decode_model(data: list) -> Model:
+    label, fingerprint, db, names, values = data
+    model = _models.get(label)
+    if model is None:
+        model = _models[label] = apps.get_model(label)
+    fields, attnames, model_fingerprint = get_model_fields(model)
+    if fingerprint != model_fingerprint:
+        raise ModelCodecError("Fields of model %s changed" % label)
+    if names is not None:
+        fields = [field for field in fields if field.attname in names]
+    decoded = []
+    for field, value in zip(fields, values):
+        if type(value) in CONTAINER_TYPES:
+            # values of unknown types were stored as strings of their field
+            is_field_string = type(value) is dict and "field" in value
+            value = field.to_python(value["field"]) if is_field_string else _decode_value(value)
+        decoded.append(value)
+    return model.from_db(db, names or attnames, decoded)
+
+
+def dumps(value) -> bytes:
+    """
+    Encodes value. Model instances anywhere in it (e.g. in a list) are encoded compactly
+    :raises ModelCodecError: if value (other than a model field value) has a type the codec doesn't know
+    """
+    return json.dumps([SCHEMA_VERSION, _encode_value(value)], separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: bytes) -> Optional[Any]:
+    """
+    Decodes value encoded with dumps. Returns None if it was encoded with another schema
+    """
+    try:
+        version, value = json.loads(data)
+        if version != SCHEMA_VERSION:
+            return None
+        return _decode_value(value)
+    except (ModelCodecError, LookupError, ValueError, TypeError):
+        return None
@@ -1,3 +1,5 @@
+import time
+
 from typing import List, Optional
 
 import requests
@@ -7,6 +9,8 @@ from django.utils.translation import gettext_lazy as _
 from requests import Timeout
 from rest_framework import status
 
+from django_project_base.caching.instrumentation import record_cache_event
+
 holidays_api_url: str = "https://date.nager.at/Api/v2/PublicHolidays/%d/%s"
 
 
@@ -21,12 +25,15 @@ def get_holidays(country_alpha_2_code: str, year: int) -> List[dict]:
         )
         assert isinstance(year, int) and year > 1900, _("Not a valid year")
         ck: str = f"country-holidays-{year}-{country_alpha_2_code}"
+        start: float = time.perf_counter()
         cached_data: Optional[List[dict]] = cache.get(ck)
         if cached_data is not None:
+            record_cache_event("holidays", "country-holidays", "hit", duration=time.perf_counter() - start)
             return cached_data
         response: requests.Response = requests.get(holidays_api_url % (year, country_alpha_2_code.upper()), timeout=6)
         assert response.status_code == status.HTTP_200_OK, _("Error retrieving data")
         holidays_data: List[dict] = response.json()
+        record_cache_event("holidays", "country-holidays", "miss", duration=time.perf_counter() - start)
         cache.set(ck, holidays_data, timeout=None)
         return holidays_data
     except (AssertionError, Timeout) as e:
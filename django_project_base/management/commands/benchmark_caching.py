@@ -0,0 +1,348 @@
+"""
+Benchmarks of caching primitives (queues, counters and locks) on different cache backends.
+
+Each benchmark runs its operations from several threads or processes at once on the same key, so results include
+contention. Results are reported per operation as ops/s and p50 / p99 latency.
+
+Benchmarks replace the default cache of the process for the time of each run, so they are only run by this command,
+in a process of their own.
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import threading
+import time
+
+from typing import Callable, List, NamedTuple, Optional
+
+import django
+
+from django.core.management import BaseCommand, call_command
+from django.db import connections
+from django.test import override_settings
+
+BENCHMARK_CACHE_TABLE = "django_project_base_benchmark_cache"
+# Seconds a run may take after its deadline before it is reported as timed out, e.g. because a lock got stuck
+BENCHMARK_GRACE_PERIOD = 10
+
+
+class BenchmarkBackend(NamedTuple):
+    name: str
+    # CACHES entry for the backend
+    config: dict
+    # False if cache lives in process memory, so processes can't contend on it
+    shared: bool
+    redis_version: Optional[str] = None
+
+
+class BenchmarkResult(NamedTuple):
+    benchmark: str
+    backend: str
+    mode: str
+    concurrency: int
+    operation: str
+    ops: int
+    errors: int
+    ops_per_second: float
+    latency_p50_ms: float
+    latency_p99_ms: float
+    timed_out: bool
+
+
+def get_benchmark_backends(redis_url: Optional[str] = None) -> List[BenchmarkBackend]:
+    """
+    Returns backends to benchmark: locmem, file and DB cache, fakeredis if installed and redis server at redis_url
+    """
+    backends = [
+        BenchmarkBackend(
+            "locmem", dict(BACKEND="django.core.cache.backends.locmem.LocMemCache", LOCATION="benchmark"), False
+        ),
+        BenchmarkBackend(
+            "file",
+            dict(
+                BACKEND="django.core.cache.backends.filebased.FileBasedCache",
+                LOCATION=os.path.join(tempfile.gettempdir(), "django_project_base_benchmark_cache"),
+            ),
+            True,
+        ),
+        BenchmarkBackend(
+            "db", dict(BACKEND="django.core.cache.backends.db.DatabaseCache", LOCATION=BENCHMARK_CACHE_TABLE), True
+        ),
+    ]
+    try:
+        import fakeredis
+
+        # fakeredis server lives in process memory and doesn't implement INFO, so its version is given here
+        backends.append(
+            BenchmarkBackend(
+                "fakeredis",
+                dict(
+                    BACKEND="django_redis.cache.RedisCache",
+                    LOCATION="redis://fakeredis:6379/0",
+                    OPTIONS=dict(CONNECTION_POOL_KWARGS=dict(connection_class=fakeredis.FakeConnection)),
+                ),
+                False,
+                redis_version="7.0.0",
+            )
+        )
+    except ModuleNotFoundError:
+        pass
+    if redis_url:
+        backends.append(
+            BenchmarkBackend("redis", dict(BACKEND="django_redis.cache.RedisCache", LOCATION=redis_url), True)
+        )
+    return backends
+
+
+def _queue_benchmark(queue_class: type) -> Callable:
+    def _benchmark(key: str, worker: int) -> list:
+        queue = queue_class(key, cache_name="default", timeout=None)
+        return [("rpush", lambda: queue.rpush(worker)), ("lpop", queue.lpop)]
+
+    return _benchmark
+
+
+def queue_other_benchmark(key: str, worker: int) -> list:
+    from django_project_base.caching.cache_queue.cache_queue_other import CacheQueueOther
+
+    return _queue_benchmark(CacheQueueOther)(key, worker)
+
+
+def queue_redis_benchmark(key: str, worker: int) -> list:
+    from django_project_base.caching.cache_queue.cache_queue_redis import CacheQueueRedis
+
+    return _queue_benchmark(CacheQueueRedis)(key, worker)
+
+
+def counter_benchmark(key: str, worker: int) -> list:
+    from django_project_base.caching import CacheCounter
+
+    counter = CacheCounter.get_cache_counter(key, timeout=None)
+    return [("incr", counter.incr)]
+
+
+def lock_benchmark(key: str, worker: int) -> list:
+    from django_project_base.serialization import CacheLock
+
+    lock = None
+
+    def _acquire():
+        nonlocal lock
+        lock = CacheLock(key)
+        lock.__enter__()
+
+    return [("acquire", _acquire), ("release", lambda: lock.__exit__(None, None, None))]
+
+
+# name: (benchmark, its operations, needs redis backend)
+BENCHMARKS = dict(
+    queue_other=(queue_other_benchmark, ("rpush", "lpop"), False),
+    queue_redis=(queue_redis_benchmark, ("rpush", "lpop"), True),
+    counter=(counter_benchmark, ("incr",), False),
+    lock=(lock_benchmark, ("acquire", "release"), False),
+)
+
+
+def _run_worker(benchmark_name: str, key: str, worker: int, iterations: int, deadline: float, results=None) -> dict:
+    """
+    Runs benchmark operations iterations times or until deadline
+    :param results: dict to fill, so that results are available also if worker gets stuck
+    :return: dict of operation name: [list of latencies, number of errors]
+    """
+    operations = BENCHMARKS[benchmark_name][0](key, worker)
+    results = results if results is not None else dict()
+    results.update({name: [[], 0] for name, _ in operations})
+    for _ in range(iterations):
+        if time.time() > deadline:
+            break
+        for name, operation in operations:
+            start = time.perf_counter()
+            try:
+                operation()
+            except Exception:
+                results[name][1] += 1
+                continue
+            results[name][0].append(time.perf_counter() - start)
+    return results
+
+
+def _run_process_worker(args) -> dict:
+    return _run_worker(*args)
+
+
+def get_percentile(latencies: list, percentile: float) -> float:
+    """
+    Returns percentile (ms) of sorted latencies
+    """
+    if not latencies:
+        return 0
+    return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)] * 1000
+
+
+def run_benchmark(
+    benchmark_name: str,
+    backend: BenchmarkBackend,
+    mode: str = "threads",
+    concurrency: int = 1,
+    iterations: int = 1000,
+    max_duration: float = 60,
+) -> List[BenchmarkResult]:
+    """
+    Runs benchmark on given backend from concurrency threads or processes, each doing iterations of benchmark's
+    operations on the same key
+    :param mode: "threads" or "processes". Processes are forked, so they are only available on platforms with fork
+    :param max_duration: seconds after which workers stop. Runs which don't finish BENCHMARK_GRACE_PERIOD seconds
+        later are reported as timed out. Stuck threads are left running, stuck processes are terminated
+    """
+    from django_project_base.caching.cache_queue import _cache_backends, CacheBackendInfo
+    from django_project_base.caching.instrumentation import CacheStats
+
+    key = "benchmark_%s_%d" % (benchmark_name, time.time_ns())
+    deadline = time.time() + max_duration
+    timed_out = False
+    stats = CacheStats.get_instance()
+    stats_enabled = stats.enabled
+    previous_backend_info = _cache_backends.pop("default", None)
+    with override_settings(CACHES=dict(default=backend.config)):
+        if backend.redis_version:
+            from django_redis.cache import RedisCache
+
+            _cache_backends["default"] = CacheBackendInfo(RedisCache, backend.redis_version, True)
+        if backend.config["BACKEND"].endswith("DatabaseCache"):
+            call_command("createcachetable", verbosity=0)
+        # benchmarks measure the primitives, not statistics of them which would be flushed into the measured cache
+        stats.enabled = False
+        try:
+            start = time.perf_counter()
+            if mode == "processes":
+                # forked processes must not share parent's database connections
+                connections.close_all()
+                with multiprocessing.get_context("fork").Pool(concurrency) as pool:
+                    async_result = pool.map_async(
+                        _run_process_worker,
+                        [(benchmark_name, key, worker, iterations, deadline) for worker in range(concurrency)],
+                    )
+                    try:
+                        worker_results = async_result.get(timeout=max_duration + BENCHMARK_GRACE_PERIOD)
+                    except multiprocessing.TimeoutError:
+                        # results of processes are only available once all of them finish
+                        timed_out, worker_results = True, []
+            else:
+                worker_results = [dict() for _ in range(concurrency)]
+
+                def _thread_worker(worker):
+                    try:
+                        _run_worker(benchmark_name, key, worker, iterations, deadline, worker_results[worker])
+                    finally:
+                        connections.close_all()
+
+                threads = [
+                    threading.Thread(target=_thread_worker, args=(worker,), daemon=True)
+                    for worker in range(concurrency)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(max(deadline + BENCHMARK_GRACE_PERIOD - time.time(), 0))
+                timed_out = any(thread.is_alive() for thread in threads)
+            elapsed = time.perf_counter() - start
+        finally:
+            stats.enabled = stats_enabled
+    # registry is cleared when CACHES change back, info of the real default cache is put back as it was
+    if previous_backend_info is not None:
+        _cache_backends["default"] = previous_backend_info
+
+    results = []
+    for operation in BENCHMARKS[benchmark_name][1]:
+        latencies = sorted(latency for result in worker_results for latency in result.get(operation, [[]])[0])
+        errors = sum(result.get(operation, [[], 0])[1] for result in worker_results)
+        results.append(
+            BenchmarkResult(
+                benchmark=benchmark_name,
+                backend=backend.name,
+                mode=mode,
+                concurrency=concurrency,
+                operation=operation,
+                ops=len(latencies),
+                errors=errors,
+                ops_per_second=len(latencies) / elapsed if elapsed else 0,
+                latency_p50_ms=get_percentile(latencies, 0.5),
+                latency_p99_ms=get_percentile(latencies, 0.99),
+                timed_out=timed_out,
+            )
+        )
+    return results
+
+
+def run_benchmarks(
+    backends: List[BenchmarkBackend],
+    benchmarks: Optional[List[str]] = None,
+    modes: tuple = ("threads", "processes"),
+    concurrency: tuple = (1, 4),
+    iterations: int = 1000,
+    max_duration: float = 60,
+) -> dict:
+    """
+    Runs benchmarks on all given backends, modes and concurrency levels. Combinations that don't apply (redis queue
+    on other backends, processes on backends in process memory) are skipped
+    :return: dict with environment info and list of results
+    """
+    results = []
+    for backend in backends:
+        for benchmark_name in benchmarks or BENCHMARKS:
+            if BENCHMARKS[benchmark_name][2] and not backend.config["BACKEND"].startswith("django_redis"):
+                continue
+            for mode in modes:
+                if mode == "processes" and not backend.shared:
+                    continue
+                for workers in concurrency:
+                    results.extend(run_benchmark(benchmark_name, backend, mode, workers, iterations, max_duration))
+    return dict(
+        timestamp=time.time(),
+        python=platform.python_version(),
+        django=django.get_version(),
+        platform=platform.platform(),
+        iterations=iterations,
+        results=[result._asdict() for result in results],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks cache queues, counters and locks under thread and process contention on locmem, file, DB cache, "
+        "fakeredis and redis (with --redis-url). Results are written as JSON. "
+        "Example: python manage.py benchmark_caching --backends locmem db --concurrency 1 8 --output bench.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", nargs="*", help="Backends to benchmark, all available by default")
+        parser.add_argument("--benchmarks", nargs="*", choices=list(BENCHMARKS), help="Benchmarks to run")
+        parser.add_argument("--modes", nargs="*", choices=("threads", "processes"), default=("threads", "processes"))
+        parser.add_argument("--concurrency", nargs="*", type=int, default=(1, 4), help="Numbers of threads/processes")
+        parser.add_argument("--iterations", type=int, default=1000, help="Iterations per thread/process")
+        parser.add_argument(
+            "--max-duration", type=float, default=60, help="Seconds after which a run is stopped and reported"
+        )
+        parser.add_argument("--redis-url", help="Redis server to benchmark, e.g. redis://127.0.0.1:6379/15")
+        parser.add_argument("--output", help="File to write results to. Standard output by default")
+
+    def handle(self, *args, **options):
+        backends = get_benchmark_backends(options["redis_url"])
+        if options["backends"]:
+            backends = [backend for backend in backends if backend.name in options["backends"]]
+        report = run_benchmarks(
+            backends,
+            benchmarks=options["benchmarks"],
+            modes=tuple(options["modes"]),
+            concurrency=tuple(options["concurrency"]),
+            iterations=options["iterations"],
+            max_duration=options["max_duration"],
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management import BaseCommand
+
+from django_project_base.profiling.request_stats import get_request_stats_summary, RequestStatsRing
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows requests recorded by all workers on this host in the shared request statistics buffer, summarised per "
+        "path. Example: python manage.py request_stats --since 600 --path rest/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=float, default=3600, help="Only requests of the last N seconds")
+        parser.add_argument("--path", help="Only paths containing this text")
+        parser.add_argument("--records", action="store_true", help="Output individual requests instead of summary")
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        records = RequestStatsRing.get_ring().read(since=time.time() - options["since"])
+        if options["path"]:
+            records = [record for record in records if options["path"] in record.path]
+
+        if options["records"]:
+            rows = [record._asdict() for record in records]
+        else:
+            rows = get_request_stats_summary(records)
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        if options["records"]:
+            for row in rows:
+                self.stdout.write(
+                    "%s %6d %3d %8d ms %8d ms cpu %4d queries %s"
+                    % (
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["timestamp"])),
+                        row["pid"],
+                        row["status"],
+                        row["wall_time"],
+                        row["user_time"] + row["sys_time"],
+                        row["query_count"],
+                        row["path"],
+                    )
+                )
+            return
+
+        self.stdout.write(
+            "%8s %6s %12s %10s %10s %8s  %s" % ("count", "errors", "total ms", "avg ms", "avg cpu", "queries", "path")
+        )
+        for row in rows:
+            self.stdout.write(
+                "%8d %6d %12d %10.1f %10.1f %8.1f  %s"
+                % (
+                    row["count"],
+                    row["errors"],
+                    row["wall_time"],
+                    row["wall_avg"],
+                    row["cpu_avg"],
+                    row["queries_avg"],
+                    row["path"],
+                )
+            )
@@ -63,11 +63,9 @@ class ProviderIntegration(ABC):
 
     def get_send_notification_sms_text(self, notification: DjangoProjectBaseNotification, host_url: str) -> str:
         if notification.send_notification_sms:
-            template: str = (
-                swapper.load_model("django_project_base", "ProjectSettings")
-                .objects.get(name=SEND_NOTIFICATION_SMS, project__slug=notification.project_slug)
-                .python_value
-            )
+            template: str = swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(
+                notification.project_slug
+            )[SEND_NOTIFICATION_SMS]
             return template.replace(
                 "__LINK__",
                 f"{host_url.rstrip('/')}"
@@ -332,27 +332,20 @@ class T2(ProviderIntegration):
         if project_slug and (
             project := swapper.load_model("django_project_base", "Project").objects.filter(slug=project_slug).first()
         ):
-            project_settings_model = swapper.load_model("django_project_base", "ProjectSettings")
+            project_settings = swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(project)
 
-            username_setting = project_settings_model.objects.filter(
-                name=self.delivery_report_username_setting_name, project=project
-            ).first()
-
-            password_setting = project_settings_model.objects.filter(
-                name=self.delivery_report_password_setting_name, project=project
-            ).first()
-
-            assert username_setting
-            assert password_setting
+            assert self.delivery_report_username_setting_name in project_settings
+            assert self.delivery_report_password_setting_name in project_settings
+            username: str = project_settings[self.delivery_report_username_setting_name]
 
             user, user_created = get_user_model().objects.get_or_create(
-                username=username_setting.python_value,
+                username=username,
                 email="klemen.spruk@velis.si",
-                first_name=username_setting.python_value,
-                last_name=username_setting.python_value,
+                first_name=username,
+                last_name=username,
             )
             if user_created:
-                user.set_password(password_setting.python_value)
+                user.set_password(project_settings[self.delivery_report_password_setting_name])
                 user.save()
 
             ProjectMember = swapper.load_model("django_project_base", "ProjectMember")
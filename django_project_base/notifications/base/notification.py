@@ -103,9 +103,9 @@ class Notification(QueableNotificationMixin, DuplicateNotificationMixin):
         notification.recipients_original_payload_search = None
         notification.sender = Notification._get_sender_config(notification.project_slug)
         mail_fallback: bool = (
-            swapper.load_model("django_project_base", "ProjectSettings")
-            .objects.get(name=USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER, project__slug=notification.project_slug)
-            .python_value
+            swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(notification.project_slug)[
+                USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER
+            ]
             if notification.project_slug
             else False
         )
@@ -136,19 +136,12 @@ class Notification(QueableNotificationMixin, DuplicateNotificationMixin):
         from django_project_base.notifications.base.channels.mail_channel import MailChannel
         from django_project_base.notifications.base.channels.sms_channel import SmsChannel
 
-        if project_slug and (
-            project := swapper.load_model("django_project_base", "Project").objects.filter(slug=project_slug).first()
-        ):
-            project_settings_model = swapper.load_model("django_project_base", "ProjectSettings")
-            mail_settings = project_settings_model.objects.filter(
-                name=EMAIL_SENDER_ID_SETTING_NAME, project=project
-            ).first()
-            sms_settings = project_settings_model.objects.filter(
-                name=SMS_SENDER_ID_SETTING_NAME, project=project
-            ).first()
+        if project_slug:
+            # settings of a project that doesn't exist are empty
+            project_settings = swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(project_slug)
             return {
-                MailChannel.name: mail_settings.python_value if mail_settings else "",
-                SmsChannel.name: sms_settings.python_value if sms_settings else "",
+                MailChannel.name: project_settings.get(EMAIL_SENDER_ID_SETTING_NAME, ""),
+                SmsChannel.name: project_settings.get(SMS_SENDER_ID_SETTING_NAME, ""),
             }
         return {
             MailChannel.name: "",
@@ -220,9 +213,9 @@ class Notification(QueableNotificationMixin, DuplicateNotificationMixin):
             if not self.persist:
                 raise Exception("Delayed notification must be persisted")
             mail_fallback: bool = (
-                swapper.load_model("django_project_base", "ProjectSettings")
-                .objects.get(name=USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER, project__slug=notification.project_slug)
-                .python_value
+                swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(notification.project_slug)[
+                    USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER
+                ]
                 if notification.project_slug
                 else False
             )
@@ -273,9 +266,9 @@ class Notification(QueableNotificationMixin, DuplicateNotificationMixin):
         mail_fallback = False
         if not self._extra_data.get("a_sender"):
             mail_fallback: bool = (
-                swapper.load_model("django_project_base", "ProjectSettings")
-                .objects.get(name=USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER, project__slug=notification.project_slug)
-                .python_value
+                swapper.load_model("django_project_base", "ProjectSettings").get_snapshot(notification.project_slug)[
+                    USE_EMAIL_IF_RECIPIENT_HAS_NO_PHONE_NUMBER
+                ]
                 if notification.project_slug
                 else False
             )
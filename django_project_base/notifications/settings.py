@@ -4,6 +4,12 @@ NOTIFICATIONS_SETTINGS = (
         "default": 30,
         "description": "Cache timeout for maintenance type notifications in UsersMaintenanceNotificationViewset",
     },
+    {
+        "name": "MAINTENANCE_NOTIFICATIONS_LOCAL_CACHE_TIMEOUT",
+        "default": 5,
+        "description": "Seconds for which maintenance notifications are served from per-process cache without "
+        "checking shared cache for changes. 0 disables per-process cache.",
+    },
     {
         "name": "MAINTENANCE_NOTIFICATIONS_CACHE_KEY",
         "default": "current_maintenance_notifications",
@@ -1,2 +1,2 @@
 from .middleware import profile_middleware #noqa
-from .views import app_debug_view #noqa
+from .views import app_debug_cache_stats_view, app_debug_data_view, app_debug_view #noqa
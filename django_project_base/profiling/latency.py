@@ -0,0 +1,262 @@
+import atexit
+import os
+import threading
+import time
+
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+LATENCY_CACHE_KEY = "profiler_latency{minute}"
+
+# Values below 2 * SUB_BUCKETS are kept exactly, larger ones in buckets 1 / SUB_BUCKETS .. 1 / (2 * SUB_BUCKETS) of
+# their value wide (log-linear buckets like in HDR histogram)
+SUB_BUCKETS = 16
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def get_bucket(value: int) -> int:
+    shift = max(value.bit_length() - 5, 0)
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def get_bucket_value(bucket: int) -> float:
+    """
+    Returns middle of values kept in bucket
+    """
+    shift = max(bucket // SUB_BUCKETS - 1, 0)
+    lower = (bucket - shift * SUB_BUCKETS) << shift
+    return lower + ((1 << shift) - 1) / 2
+
+
+class LatencySketch:
+    """
+    Mergeable histogram of non-negative integer values (ms, number of queries). Its size depends on the range of
+    values, not on their number, and sketches of different processes and periods merge by adding bucket counts.
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        # count, sum and max of values, dict of bucket: count
+        data = data or dict(count=0, sum=0, max=0, buckets=dict())
+        self.count: float = data["count"]
+        self.sum: float = data["sum"]
+        self.max: int = data["max"]
+        self.buckets: Dict[int, float] = data["buckets"]
+
+    def add(self, value: int, weight: float = 1):
+        value = max(int(value), 0)
+        bucket = get_bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + weight
+        self.count += weight
+        self.sum += value * weight
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencySketch"):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        if not self.count:
+            return None
+        threshold = self.count * percentile
+        total = 0
+        for bucket in sorted(self.buckets):
+            total += self.buckets[bucket]
+            if total >= threshold:
+                return min(get_bucket_value(bucket), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return dict(count=self.count, sum=self.sum, max=self.max, buckets=self.buckets)
+
+
+class PathLatency:
+    """
+    Sketches of wall time, CPU time and number of queries of requests to one path, plus user and sys time totals
+    """
+
+    metrics = ("wall", "cpu", "queries")
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data or dict()
+        self.sketches = {metric: LatencySketch(data.get(metric)) for metric in self.metrics}
+        self.user_time: float = data.get("user_time", 0)
+        self.sys_time: float = data.get("sys_time", 0)
+
+    def add(self, wall_time: int, user_time: int, sys_time: int, query_count: int, weight: float = 1):
+        self.sketches["wall"].add(wall_time, weight)
+        self.sketches["cpu"].add(user_time + sys_time, weight)
+        self.sketches["queries"].add(query_count, weight)
+        self.user_time += user_time * weight
+        self.sys_time += sys_time * weight
+
+    def merge(self, other: "PathLatency"):
+        for metric in self.metrics:
+            self.sketches[metric].merge(other.sketches[metric])
+        self.user_time += other.user_time
+        self.sys_time += other.sys_time
+
+    def to_dict(self) -> dict:
+        data = {metric: sketch.to_dict() for metric, sketch in self.sketches.items()}
+        data.update(user_time=self.user_time, sys_time=self.sys_time)
+        return data
+
+
+class LatencyStats:
+    """
+    Process-level collector of per path latency sketches. Requests are added to sketches of the minute they ended
+    in, every flush_interval seconds sketches are merged into the shared cache, one key per minute holding all paths.
+    Storage per path and minute is bounded, regardless of traffic.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.flush_interval = getattr(settings, "PROFILER_LATENCY_FLUSH_INTERVAL", 10)
+        self.timeout = getattr(settings, "PROFILER_LATENCY_TIMEOUT", 86400)
+        self.lock = threading.Lock()
+        # minute: path: PathLatency
+        self.data: Dict[int, Dict[str, PathLatency]] = dict()
+        self.timer = None
+
+    @classmethod
+    def get_instance(cls) -> "LatencyStats":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    atexit.register(cls._instance.flush)
+        return cls._instance
+
+    @classmethod
+    def reset_after_fork(cls):
+        # pending sketches are parent's to flush, its timer doesn't run in the child
+        if cls._instance is not None:
+            cls._instance.lock = threading.Lock()
+            cls._instance.data = dict()
+            cls._instance.timer = None
+
+    def record(
+        self,
+        path: str,
+        wall_time: int,
+        user_time: int,
+        sys_time: int,
+        query_count: int,
+        timestamp: Optional[float] = None,
+        weight: float = 1,
+    ):
+        """
+        Adds a request. Times are in ms
+        :param weight: number of requests this one stands for, e.g. 1 / sample rate
+        """
+        minute = int((timestamp or time.time()) // 60)
+        with self.lock:
+            paths = self.data.get(minute)
+            if paths is None:
+                paths = self.data[minute] = dict()
+            path_latency = paths.get(path)
+            if path_latency is None:
+                path_latency = paths[path] = PathLatency()
+            path_latency.add(wall_time, user_time, sys_time, query_count, weight)
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        from django_project_base.serialization import CacheLock
+
+        with self.lock:
+            data, self.data = self.data, dict()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        for minute, paths in data.items():
+            key = LATENCY_CACHE_KEY.format(minute=minute)
+            merged = False
+            with CacheLock(key, timeout=5, silence_object_lock_timeout=True) as lock:
+                lock()
+                shared = cache.get(key) or dict()
+                for path, path_latency in paths.items():
+                    shared_latency = PathLatency(shared.get(path))
+                    shared_latency.merge(path_latency)
+                    shared[path] = shared_latency.to_dict()
+                cache.set(key, shared, timeout=self.timeout)
+                merged = True
+            if not merged:
+                # lock timed out, sketches are merged on next flush
+                with self.lock:
+                    for path, path_latency in paths.items():
+                        pending = self.data.setdefault(minute, dict()).setdefault(path, PathLatency())
+                        pending.merge(path_latency)
+
+
+def record_request_latency(
+    path: str, wall_time: int, user_time: int, sys_time: int, query_count: int, timestamp: Optional[float] = None
+):
+    LatencyStats.get_instance().record(path, wall_time, user_time, sys_time, query_count, timestamp)
+
+
+def get_latency_stats(since: float, until: Optional[float] = None, path: Optional[str] = None) -> list:
+    """
+    Returns per path statistics of requests merged from all processes, ordered by total wall time
+    :param since: timestamp of the start of the period. Sketches are kept per minute, so the whole first minute is
+        included. Periods longer than PROFILER_LATENCY_TIMEOUT are shortened to it
+    :param until: timestamp of the end of the period, now by default
+    :param path: only paths containing this text
+    :return: list of dicts with count, totals and averages (ms) and p50 / p95 / p99 of wall time, CPU time and
+        number of queries
+    """
+    until = until or time.time()
+    # sketches older than their timeout are gone, so keys for them are never requested
+    since = max(since, until - getattr(settings, "PROFILER_LATENCY_TIMEOUT", 86400))
+    keys = [LATENCY_CACHE_KEY.format(minute=minute) for minute in range(int(since // 60), int(until // 60) + 1)]
+    merged: Dict[str, PathLatency] = dict()
+    for minute_data in cache.get_many(keys).values():
+        for name, data in minute_data.items():
+            if path and path not in name:
+                continue
+            path_latency = merged.get(name)
+            if path_latency is None:
+                path_latency = merged[name] = PathLatency()
+            path_latency.merge(PathLatency(data))
+
+    period = max(until - since, 1)
+    rows = []
+    for name, path_latency in merged.items():
+        wall, cpu, queries = (path_latency.sketches[metric] for metric in PathLatency.metrics)
+        if not wall.count:
+            continue
+        row = dict(
+            path=name,
+            count=round(wall.count),
+            wall_time=round(wall.sum),
+            user_time=round(path_latency.user_time),
+            sys_time=round(path_latency.sys_time),
+            cpu_time=round(cpu.sum),
+            wall_avg=int(wall.sum / wall.count),
+            cpu_avg=int(cpu.sum / wall.count),
+            queries_avg=queries.sum / wall.count,
+            wall_max=wall.max,
+            # CPU cores used on average during the period
+            core_usage=int(cpu.sum / period) / 1000.0,
+        )
+        for metric, sketch in (("wall", wall), ("cpu", cpu), ("queries", queries)):
+            for percentile in PERCENTILES:
+                row["%s_p%d" % (metric, percentile * 100)] = sketch.get_percentile(percentile)
+        rows.append(row)
+    rows.sort(key=lambda r: r["wall_time"], reverse=True)
+    return rows
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=LatencyStats.reset_after_fork)
@@ -0,0 +1,134 @@
+import atexit
+import collections
+import glob
+import json
+import os
+import threading
+
+from django.conf import settings
+
+DEFAULT_LOG_PATH = "/tmp/wsgi_performance.txt"
+MAX_DATA_LOGGING_FILE_SIZE = 3000000
+ERROR_LOG_PATH = "/tmp/wsgi_performance_error.txt"
+
+
+def log_profiler_error(exc: Exception):
+    try:
+        if os.path.exists(ERROR_LOG_PATH) and os.path.getsize(ERROR_LOG_PATH) > MAX_DATA_LOGGING_FILE_SIZE:
+            os.remove(ERROR_LOG_PATH)
+        with open(ERROR_LOG_PATH, "a") as fe:
+            fe.write(str(exc) + "\n")
+    except Exception:
+        pass
+
+
+class ProfileLogSink:
+    """
+    Per-process sink of profiled requests. Requests only append records to an in-memory buffer, a background thread
+    writes them to log files in batches, every flush_interval seconds or as soon as flush_size records are pending.
+
+    Records are written as JSON lines to numbered files (path.1, path.2, ...). When the newest file grows over
+    max_file_size, a new one is started and only the newest max_files files are kept.
+    If the writer falls behind, buffer keeps the newest max_buffered records.
+    """
+
+    _sinks = dict()
+    _sinks_lock = threading.Lock()
+
+    def __init__(self, path: str = DEFAULT_LOG_PATH):
+        self.path = path
+        self.flush_interval = getattr(settings, "PROFILER_LOG_FLUSH_INTERVAL", 1)
+        self.flush_size = getattr(settings, "PROFILER_LOG_FLUSH_SIZE", 1000)
+        self.max_file_size = getattr(settings, "PROFILER_LOG_MAX_FILE_SIZE", MAX_DATA_LOGGING_FILE_SIZE)
+        self.max_files = getattr(settings, "PROFILER_LOG_MAX_FILES", 3)
+        # deque appends and pops are thread safe, so request threads don't need to take a lock
+        self.buffer = collections.deque(maxlen=getattr(settings, "PROFILER_LOG_MAX_BUFFERED", 100000))
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def get_sink(cls, path: str = DEFAULT_LOG_PATH) -> "ProfileLogSink":
+        sink = cls._sinks.get(path)
+        if sink is None:
+            with cls._sinks_lock:
+                sink = cls._sinks.get(path)
+                if sink is None:
+                    sink = cls._sinks[path] = cls(path)
+                    atexit.register(sink.flush)
+        return sink
+
+    @classmethod
+    def reset_after_fork(cls):
+        # writer threads don't survive fork, child processes start their own. Buffered records are parent's to write
+        for sink in cls._sinks.values():
+            sink.buffer.clear()
+            sink.thread = None
+            sink.flush_lock = threading.Lock()
+
+    def add(self, record: dict):
+        self.buffer.append(record)
+        if self.thread is None:
+            self.start()
+        if len(self.buffer) >= self.flush_size:
+            self.wakeup.set()
+
+    def start(self):
+        with self._sinks_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="profile-log-sink", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def get_file_name(self, number: int) -> str:
+        return "%s.%d" % (self.path, number)
+
+    def get_file_numbers(self) -> list:
+        numbers = []
+        for file_name in glob.glob(glob.escape(self.path) + ".*"):
+            suffix = file_name.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    def rotate(self) -> str:
+        """
+        Returns file to write to, starting a new one and dropping the oldest ones as needed
+        """
+        numbers = self.get_file_numbers()
+        current = numbers[-1] if numbers else 1
+        is_full = bool(numbers) and os.path.getsize(self.get_file_name(current)) > self.max_file_size
+        if is_full:
+            current += 1
+        if current > self.max_files:
+            # newest files are renumbered from 1, so numbers don't grow forever
+            keep_count = self.max_files - 1 if is_full else self.max_files
+            kept = numbers[-keep_count:] if keep_count else []
+            for number in numbers[: len(numbers) - len(kept)]:
+                os.remove(self.get_file_name(number))
+            for new_number, number in enumerate(kept, start=1):
+                if new_number != number:
+                    os.rename(self.get_file_name(number), self.get_file_name(new_number))
+            current = len(kept) + 1 if is_full else len(kept)
+        return self.get_file_name(current)
+
+    def flush(self):
+        with self.flush_lock:
+            # records added meanwhile are left for the next flush
+            lines = [json.dumps(self.buffer.popleft()) + "\n" for _ in range(len(self.buffer))]
+            if not lines:
+                return
+            try:
+                with open(self.rotate(), "a") as f:
+                    f.writelines(lines)
+            except Exception as exc:
+                log_profiler_error(exc)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ProfileLogSink.reset_after_fork)
@@ -1,6 +1,4 @@
-import glob
 import importlib
-import json
 import os
 import re
 import socket
@@ -14,10 +12,12 @@ from django.core.cache import cache
 from django.db import connections
 
 from django_project_base.caching import CacheCounter
-from django_project_base.caching.cache_queue import CacheQueue
+from django_project_base.profiling.latency import record_request_latency
+from django_project_base.profiling.log_sink import log_profiler_error, ProfileLogSink
+from django_project_base.profiling.request_stats import RequestStatsRing
+from django_project_base.profiling.sampling import ProfileSampler
 
 DEFAULT_MAX_LOG_FILE_SIZE = 10000000
-MAX_DATA_LOGGING_FILE_SIZE = 3000000
 
 MATCH_DETAIL_QUERIES = re.compile(
     r"(rest/\w+)/((?:[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12})|" r"(?:(?:[0-9a-f]{2}:){5}[0-9a-f]{2})|\d+)(/.*)?"
@@ -110,6 +110,11 @@ class ProfileRequest(object):
         except Exception as e:
             return ["exception getting queries: " + str(e)]
 
+    def _get_query_count(self) -> int:
+        # queries are only logged with DEBUG or force_debug_cursor (set by _get_queries), otherwise count is 0
+        # connections.all(initialized_only=True) needs Django 4.1, connections which were not used have no connection
+        return sum(len(con.queries_log) for con in connections.all() if con.connection is not None)
+
     def _do_profile(self, response, start_time, end_time):
         try:
             locs = locals()
@@ -120,6 +125,17 @@ class ProfileRequest(object):
                 )
                 if path_info:
                     duration = (end_time[0] - start_time[0], end_time[1] - start_time[1], end_time[2] - start_time[2])
+                    query_count = self._get_query_count()
+                    if getattr(settings, "PROFILER_STATS_RING_ENABLED", True):
+                        # failing shared memory buffer must not stop the rest of profiling
+                        try:
+                            RequestStatsRing.get_ring().write(
+                                path_info, getattr(response, "status_code", 0), *duration, query_count
+                            )
+                        except Exception as exc:
+                            log_profiler_error(exc)
+                    record_request_latency(path_info, *duration, query_count, timestamp=end_time[0] / 1000)
+                    # long running requests are always recorded, they are what the debug view is for
                     if hasattr(settings, "PROFILER_LONG_RUNNING_TASK_THRESHOLD"):
                         if duration[0] > settings.PROFILER_LONG_RUNNING_TASK_THRESHOLD:
                             queries = self._get_queries(response)
@@ -128,21 +144,23 @@ class ProfileRequest(object):
                                 "duration": duration[0],
                                 "queries": queries,
                                 "PATH_INFO": path_info,
+                                "sample_rate": 1,
                             }
                             r_data.update(
                                 {i: str(self._settings[i]) for i in ("HTTP_HOST", "REQUEST_METHOD", "QUERY_STRING")}
                             )
-                            cache_ptr = CacheCounter("long_running_cmds_pointer", timeout=86400).incr(start=-1) % 50
+                            cache_ptr_counter = CacheCounter.get_cache_counter(
+                                "long_running_cmds_pointer", timeout=86400
+                            )
+                            cache_ptr = cache_ptr_counter.incr(start=-1) % 50
 
                             cache.set("long_running_cmds_data%d" % cache_ptr, r_data, timeout=86400)
 
-                        r_data = [path_info, duration[0], duration[1], duration[2]]
-                        last_hour_running_cmds_key = f"last_hour_running_cmds{int(time.time()) // 10}"
-                        last_hour_running_cmds_queue = CacheQueue.get_cache_queue(
-                            last_hour_running_cmds_key, timeout=3600
-                        )
-                        last_hour_running_cmds_queue.rpush(json.dumps(r_data))
-
+                    # shared memory record, in-process sketches and long running requests above are recorded for
+                    # every request, the log is sampled
+                    sample_rate = ProfileSampler.get_sampler().get_sample_rate(duration[0])
+                    if not sample_rate:
+                        return
                     req_data = dict(
                         code=getattr(response, "status_code", None),
                         method=self._settings["REQUEST_METHOD"],
@@ -151,45 +169,11 @@ class ProfileRequest(object):
                         path_info=path_info,
                         pid=os.getpid(),
                         raw_path_info=self._settings.get("PATH_INFO", None),
+                        sample_rate=sample_rate,
                     )
-                    files = glob.glob("/tmp/wsgi_performance.txt.*")
-                    if not files:
-                        with open("/tmp/wsgi_performance.txt.1", "a") as f:
-                            f.write(json.dumps(req_data) + "\n")
-                        files = ["/tmp/wsgi_performance.txt.1"]
-                    file_num_array = list(map(lambda r: int(r.split(".")[-1]), files))
-                    max_file = max(file_num_array)
-                    min_file = min(file_num_array)
-                    if max_file > 3:
-                        if os.path.exists("/tmp/wsgi_performance.txt.1"):
-                            os.remove("/tmp/wsgi_performance.txt.1")
-                        if os.path.exists("/tmp/wsgi_performance.txt.2"):
-                            os.remove("/tmp/wsgi_performance.txt.2")
-                        os.rename("/tmp/wsgi_performance.txt.%d" % max_file, "/tmp/wsgi_performance.txt.1")
-                        os.rename("/tmp/wsgi_performance.txt.%d" % (max_file - 1), "/tmp/wsgi_performance.txt.2")
-                        for ff in filter(lambda f: f and int(f.split(".")[-1]) not in [1, 2], files):
-                            if os.path.exists(ff):
-                                os.remove(ff)
-                        files = glob.glob("/tmp/wsgi_performance.txt.*")
-                    if not files:
-                        with open("/tmp/wsgi_performance.txt.1", "a") as f:
-                            f.write(json.dumps(req_data) + "\n")
-                    else:
-                        if os.path.getsize("/tmp/wsgi_performance.txt.%d" % max_file) > MAX_DATA_LOGGING_FILE_SIZE:
-                            with open("/tmp/wsgi_performance.txt.%d" % (max_file + 1), "a") as f:
-                                f.write(json.dumps(req_data) + "\n")
-                        else:
-                            with open("/tmp/wsgi_performance.txt.%d" % max_file, "a") as f:
-                                f.write(json.dumps(req_data) + "\n")
+                    ProfileLogSink.get_sink().add(req_data)
         except Exception as exc:
-            try:
-                error_file = "/tmp/wsgi_performance_error.txt"
-                if os.path.exists(error_file) and os.path.getsize(error_file) > MAX_DATA_LOGGING_FILE_SIZE:
-                    os.remove(error_file)
-                with open(error_file, "a") as fe:
-                    fe.write(str(exc) + "\n")
-            except Exception:
-                pass
+            log_profiler_error(exc)
 
 
 def profile_middleware(get_response):
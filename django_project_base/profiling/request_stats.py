@@ -0,0 +1,337 @@
+"""
+Request statistics of all workers on a host, kept in a shared memory ring buffer.
+
+The buffer is a memory mapped file with one region per worker process. Layout (number of regions, records and path
+names) is part of the file name, so processes configured differently never share a file. A worker claims a free region (or one of a
+process that no longer exists) once, under a file lock, and from then on writes its records into it without any
+locking between processes. Each region holds a ring of fixed size records and a table of path names, records refer to
+paths by id.
+
+Readers may skip records that are being overwritten while they read.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+
+from django_project_base.profiling.log_sink import log_profiler_error
+
+MAGIC = b"DPBRQST1"
+# magic, number of worker regions, records per region, path names per region
+HEADER = struct.Struct("<8sIII")
+HEADER_SIZE = 64
+# pid of the owner, number of records written
+REGION_HEADER = struct.Struct("<qQ")
+REGION_HEADER_SIZE = 64
+# path id, name length, name
+PATH_ENTRY = struct.Struct("<IH122s")
+# sequence number (index + 1), timestamp, path id, status code, wall, user and sys time (ms), number of queries
+RECORD = struct.Struct("<QdIHIIII")
+
+MAX_UINT32 = 2**32 - 1
+
+
+class RequestStatsRecord(NamedTuple):
+    timestamp: float
+    path: str
+    status: int
+    wall_time: int
+    user_time: int
+    sys_time: int
+    query_count: int
+    pid: int
+
+
+def get_default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # projects on the same host get their own buffers
+    project = "%s|%s" % (getattr(settings, "SETTINGS_MODULE", ""), getattr(settings, "BASE_DIR", ""))
+    return os.path.join(directory, "django_project_base_request_stats_%08x" % zlib.crc32(project.encode()))
+
+
+def get_path_id(path: str) -> int:
+    return zlib.crc32(path.encode())
+
+
+def _clamp(value) -> int:
+    return min(max(int(value or 0), 0), MAX_UINT32)
+
+
+class RequestStatsRing:
+    """
+    Shared memory ring buffer of request statistics. Use get_ring to get the one configured with settings:
+    PROFILER_STATS_RING_FILE, PROFILER_STATS_RING_WORKERS (max number of worker processes, default 64),
+    PROFILER_STATS_RING_RECORDS (records kept per worker, default 4096) and PROFILER_STATS_RING_PATHS (path names kept
+    per worker, default 512)
+    """
+
+    _rings = dict()
+    _rings_lock = threading.Lock()
+
+    def __init__(self, file_name: str, workers: int = 64, records: int = 4096, paths: int = 512):
+        self.file_name = file_name
+        self.workers = workers
+        self.records = records
+        self.paths = paths
+        self.region_size = REGION_HEADER_SIZE + paths * PATH_ENTRY.size + records * RECORD.size
+        self.size = HEADER_SIZE + workers * self.region_size
+        self.path = "%s.%dx%dx%d" % (file_name, workers, records, paths)
+        self.lock = threading.Lock()
+        self.mm = None
+        self.reset_region()
+
+    @classmethod
+    def get_ring(cls) -> "RequestStatsRing":
+        file_name = getattr(settings, "PROFILER_STATS_RING_FILE", None) or get_default_path()
+        ring = cls._rings.get(file_name)
+        if ring is None:
+            with cls._rings_lock:
+                ring = cls._rings.get(file_name)
+                if ring is None:
+                    ring = cls._rings[file_name] = cls(
+                        file_name,
+                        workers=getattr(settings, "PROFILER_STATS_RING_WORKERS", 64),
+                        records=getattr(settings, "PROFILER_STATS_RING_RECORDS", 4096),
+                        paths=getattr(settings, "PROFILER_STATS_RING_PATHS", 512),
+                    )
+        return ring
+
+    @classmethod
+    def reset_after_fork(cls):
+        # forked worker must claim its own region
+        for ring in cls._rings.values():
+            ring.lock = threading.Lock()
+            ring.reset_region()
+
+    def reset_region(self):
+        self.region_offset = None
+        self.records_offset = None
+        # False when no region could be claimed, so this process doesn't write
+        self.enabled = True
+        self.write_index = 0
+        self.path_ids = dict()
+        self.free_path_entries = self.paths
+
+    def open(self, writable: bool = True) -> mmap.mmap:
+        """
+        Maps the file, creating it first if it doesn't exist or doesn't match configured layout
+        """
+        if not writable:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            while os.fstat(fd).st_ino != os.stat(self.path).st_ino:
+                # another process replaced the file while we waited for the lock
+                os.close(fd)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            if not size:
+                # new file isn't mapped by anyone yet
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, HEADER.pack(*self.get_header()), 0)
+            elif size != self.size or HEADER.unpack(os.pread(fd, HEADER.size, 0)) != self.get_header():
+                # other processes may have the file mapped, so it is never shrunk, but replaced with a new one
+                self.replace_file()
+                os.close(fd)
+                fd = os.open(self.path, os.O_RDWR)
+            # mmap keeps a duplicate of fd, which would keep the lock
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def replace_file(self):
+        temp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, HEADER.pack(*self.get_header()), 0)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, self.path)
+
+    def get_header(self) -> tuple:
+        return MAGIC, self.workers, self.records, self.paths
+
+    def claim_region(self) -> bool:
+        if self.mm is None:
+            self.mm = self.open()
+        pid = os.getpid()
+        with open(self.path, "rb") as f:
+            # claims are serialised between processes, writes are not
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                for worker in range(self.workers):
+                    offset = HEADER_SIZE + worker * self.region_size
+                    owner, write_index = REGION_HEADER.unpack_from(self.mm, offset)
+                    if owner and owner != pid and self.is_alive(owner):
+                        continue
+                    REGION_HEADER.pack_into(self.mm, offset, pid, write_index)
+                    self.region_offset = offset
+                    self.records_offset = offset + REGION_HEADER_SIZE + self.paths * PATH_ENTRY.size
+                    self.write_index = write_index
+                    # names of previous owner stay, path ids don't depend on the process
+                    for entry in range(self.paths):
+                        path_id, length, name = PATH_ENTRY.unpack_from(self.mm, self.get_path_entry_offset(entry))
+                        if length:
+                            self.path_ids[name[:length].decode(errors="replace")] = path_id
+                            self.free_path_entries -= 1
+                    return True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+    @staticmethod
+    def is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def get_path_entry_offset(self, entry: int) -> int:
+        return self.region_offset + REGION_HEADER_SIZE + entry * PATH_ENTRY.size
+
+    def register_path(self, path: str) -> int:
+        path_id = get_path_id(path)
+        if self.free_path_entries:
+            name = path.encode()[: PATH_ENTRY.size - 6]
+            entry = self.paths - self.free_path_entries
+            PATH_ENTRY.pack_into(self.mm, self.get_path_entry_offset(entry), path_id, len(name), name)
+            self.free_path_entries -= 1
+        # paths that don't fit into the table are still recorded, readers just don't know their names
+        self.path_ids[path] = path_id
+        return path_id
+
+    def write(self, path: str, status: int, wall_time: int, user_time: int, sys_time: int, query_count: int):
+        """
+        Records a request. Times are in ms
+        """
+        with self.lock:
+            if self.region_offset is None:
+                if not self.enabled:
+                    return
+                try:
+                    self.enabled = self.claim_region()
+                except Exception as exc:
+                    # e.g. missing directory or file of another user. Process doesn't retry, so it reports this once
+                    self.enabled = False
+                    log_profiler_error(exc)
+                if not self.enabled:
+                    return
+            path_id = self.path_ids.get(path)
+            if path_id is None:
+                path_id = self.register_path(path)
+            index = self.write_index
+            RECORD.pack_into(
+                self.mm,
+                self.records_offset + (index % self.records) * RECORD.size,
+                index + 1,
+                time.time(),
+                path_id,
+                min(max(int(status or 0), 0), 65535),
+                _clamp(wall_time),
+                _clamp(user_time),
+                _clamp(sys_time),
+                _clamp(query_count),
+            )
+            self.write_index = index + 1
+            # count is updated after the record, so readers never see a record before it is written
+            struct.pack_into("<Q", self.mm, self.region_offset + 8, self.write_index)
+
+    def read(self, since: Optional[float] = None) -> List[RequestStatsRecord]:
+        """
+        Returns records of all workers, oldest first
+        :param since: only records with timestamp after this are returned
+        """
+        if not os.path.exists(self.path):
+            return []
+        mm = self.open(writable=False)
+        try:
+            if len(mm) != self.size or HEADER.unpack_from(mm, 0) != self.get_header():
+                return []
+            records_offset = REGION_HEADER_SIZE + self.paths * PATH_ENTRY.size
+            names = dict()
+            raw_records = []
+            for worker in range(self.workers):
+                offset = HEADER_SIZE + worker * self.region_size
+                owner, write_index = REGION_HEADER.unpack_from(mm, offset)
+                if not write_index:
+                    continue
+                for entry in range(self.paths):
+                    path_id, length, name = PATH_ENTRY.unpack_from(
+                        mm, offset + REGION_HEADER_SIZE + entry * PATH_ENTRY.size
+                    )
+                    if not length:
+                        break
+                    names[path_id] = name[:length].decode(errors="replace")
+                # oldest record may be overwritten by the writer while we read it
+                for index in range(max(write_index - self.records + 1, 0), write_index):
+                    record = RECORD.unpack_from(mm, offset + records_offset + (index % self.records) * RECORD.size)
+                    if record[0] != index + 1 or (since is not None and record[1] < since):
+                        continue
+                    raw_records.append((owner, record))
+        finally:
+            mm.close()
+
+        records = [
+            RequestStatsRecord(
+                timestamp=timestamp,
+                path=names.get(path_id, "#%08x" % path_id),
+                status=status,
+                wall_time=wall_time,
+                user_time=user_time,
+                sys_time=sys_time,
+                query_count=query_count,
+                pid=owner,
+            )
+            for owner, (_, timestamp, path_id, status, wall_time, user_time, sys_time, query_count) in raw_records
+        ]
+        records.sort(key=lambda record: record.timestamp)
+        return records
+
+
+def get_request_stats_summary(records: List[RequestStatsRecord]) -> List[dict]:
+    """
+    Aggregates records per path, ordered by total wall time
+    """
+    totals = dict()
+    for record in records:
+        total = totals.get(record.path)
+        if total is None:
+            total = totals[record.path] = dict(
+                path=record.path, count=0, errors=0, wall_time=0, user_time=0, sys_time=0, query_count=0
+            )
+        total["count"] += 1
+        total["errors"] += record.status >= 500
+        total["wall_time"] += record.wall_time
+        total["user_time"] += record.user_time
+        total["sys_time"] += record.sys_time
+        total["query_count"] += record.query_count
+    for total in totals.values():
+        total["wall_avg"] = total["wall_time"] / total["count"]
+        total["cpu_avg"] = (total["user_time"] + total["sys_time"]) / total["count"]
+        total["queries_avg"] = total["query_count"] / total["count"]
+    return sorted(totals.values(), key=lambda total: total["wall_time"], reverse=True)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=RequestStatsRing.reset_after_fork)
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class ProfileSampler:
+    """
+    Decides which profiled requests are recorded in profiler's cache and log.
+
+    Requests are sampled with probability 1 / rate. Requests slower than always_above ms are always recorded. With
+    max_per_second set, probability is lowered further so that the process records about max_per_second sampled
+    requests per second, based on the number of requests in the previous second.
+
+    Recorded data keeps the probability a request was sampled with (sample_rate), aggregates count each record
+    1 / sample_rate times, so they estimate totals of all requests.
+    """
+
+    _sampler = None
+
+    def __init__(self, rate: int = 1, always_above: int = None, max_per_second: float = None):
+        self.rate = max(int(rate), 1)
+        self.always_above = always_above
+        self.max_per_second = max_per_second
+        self.probability = 1 / self.rate
+        self.window = int(time.time())
+        self.window_requests = 0
+
+    @classmethod
+    def get_sampler(cls) -> "ProfileSampler":
+        if cls._sampler is None:
+            cls._sampler = cls(
+                rate=getattr(settings, "PROFILER_SAMPLE_RATE", 1),
+                always_above=getattr(settings, "PROFILER_SAMPLE_ALWAYS_ABOVE", None),
+                max_per_second=getattr(settings, "PROFILER_SAMPLE_MAX_PER_SECOND", None),
+            )
+        return cls._sampler
+
+    def get_sample_rate(self, duration: int) -> float:
+        """
+        Returns probability the request was sampled with, 0 if it is not to be recorded
+        :param duration: wall time of the request in ms
+        """
+        if self.always_above is not None and duration > self.always_above:
+            return 1.0
+        if self.max_per_second:
+            self.update_probability()
+        probability = self.probability
+        if probability >= 1 or random.random() < probability:
+            return probability
+        return 0
+
+    def update_probability(self):
+        # counters are not locked, a lost update only makes the estimated request rate slightly off
+        now = int(time.time())
+        if now != self.window:
+            requests_per_second = self.window_requests / (now - self.window)
+            self.probability = (
+                min(1 / self.rate, self.max_per_second / requests_per_second) if requests_per_second else 1 / self.rate
+            )
+            self.window = now
+            self.window_requests = 0
+        self.window_requests += 1
+
+
+@receiver(setting_changed)
+def reset_sampler(setting, **kwargs):
+    if setting.startswith("PROFILER_SAMPLE_"):
+        ProfileSampler._sampler = None
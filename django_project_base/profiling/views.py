@@ -1,98 +1,188 @@
-import json
+import math
 import random
+import time
 
 from datetime import datetime
+from typing import Iterable, Optional
 
+from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
-from dynamicforms.struct import Struct
+from django.urls import NoReverseMatch, reverse
 
-from django_project_base.caching.cache_queue import CacheQueue
+from django_project_base.caching.instrumentation import get_cache_stats
+from django_project_base.profiling.latency import get_latency_stats
 from django_project_base.settings import PROFILER_LOG_LONG_REQUESTS_COUNT
 
+DEBUG_DATA_SECTIONS = ("debug_data", "spenders", "all_requests", "cache_stats")
+DEFAULT_WINDOW = 3600
+# latency sketches are kept for PROFILER_LATENCY_TIMEOUT, longer windows would only request keys that don't exist
+MAX_WINDOW = 86400
 
-def app_debug_view(request):
-    # if not getattr(request, 'user', None) or request.user.pk not in POWER_USERS:
-    if not getattr(request, "user", None):
-        raise PermissionError
-    return render(request, "app-debug/main.html", __get_debug_data())
 
+def app_debug_view(request):
+    __check_user(request)
+    try:
+        since, until, path = __get_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    try:
+        data_url = reverse("app-debug-data")
+    except NoReverseMatch:
+        data_url = None
+    # with the JSON api available, page loads long running requests and their queries from it after rendering
+    sections = [section for section in DEBUG_DATA_SECTIONS if section != "debug_data" or not data_url]
+    data = __get_debug_data(since, until, path, sections)
+    data.update(window=int(until - since), path=path or "", data_url=data_url)
+    return render(request, "app-debug/main.html", data)
+
+
+def app_debug_data_view(request):
+    """
+    Debug data in machine-readable form. Query parameters: window (seconds, default 3600), until (timestamp, default
+    now), path (only paths containing this text) and sections (comma separated debug_data, spenders, all_requests,
+    cache_stats, all by default)
+    """
+    __check_user(request)
+    try:
+        since, until, path = __get_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    sections = [section for section in request.GET.get("sections", "").split(",") if section in DEBUG_DATA_SECTIONS]
+    data = __get_debug_data(since, until, path, sections or DEBUG_DATA_SECTIONS)
+    data.update(since=since, until=until, path=path)
+    return JsonResponse(data)
+
+
+def app_debug_cache_stats_view(request):
+    """
+    Cache statistics in machine-readable form. Query parameters window (seconds, default 3600) and until
+    (timestamp, default now) set the period
+    """
+    __check_user(request)
+    try:
+        since, until, _ = __get_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return JsonResponse(
+        dict(window=int(until - since), until=until, cache_stats=get_cache_stats(since=since, until=until))
+    )
 
-def __get_debug_data():
-    import time
 
-    result_data = []
+def __check_user(request):
+    user = getattr(request, "user", None)
+    if not user or not user.is_authenticated or not user.is_staff:
+        raise PermissionDenied
+
+
+def get_max_window() -> int:
+    return min(getattr(settings, "PROFILER_LATENCY_TIMEOUT", MAX_WINDOW), MAX_WINDOW)
+
+
+def __get_filters(request) -> tuple:
+    """
+    Returns since, until and path from query parameters. Invalid window or until fall back to their defaults, window
+    longer than data is kept for raises ValueError
+    """
+    now = time.time()
+    try:
+        until = float(request.GET.get("until") or now)
+        if not math.isfinite(until):
+            raise ValueError
+    except ValueError:
+        until = now
+    max_window = get_max_window()
+    try:
+        window = int(request.GET.get("window") or 0)
+        if window <= 0:
+            raise ValueError
+    except ValueError:
+        window = min(DEFAULT_WINDOW, max_window)
+    if window > max_window:
+        raise ValueError("window can't be longer than %d seconds" % max_window)
+    return until - window, until, request.GET.get("path") or None
+
+
+def get_long_running_requests(
+    since: Optional[float] = None, until: Optional[float] = None, path: Optional[str] = None
+) -> list:
+    """
+    Returns recorded long running requests, read from cache in one round trip
+    :param path: only paths containing this text
+    """
+    keys = ["long_running_cmds_data%d" % cache_ptr for cache_ptr in range(PROFILER_LOG_LONG_REQUESTS_COUNT)]
     requests = []
-
-    for cache_ptr in range(PROFILER_LOG_LONG_REQUESTS_COUNT):
-        item = cache.get("long_running_cmds_data%d" % cache_ptr)
-        if item:
-            requests.append(item)
-
-    totals = {}
-    min_timestamp = time.time()
-
-    for req in requests:
-        queries_executed: list = req.get("queries", []) or []
-
-        num_of_queries: int = len(queries_executed)
-        num_of_distinct_queries: int = len(
-            set(map(lambda d: d["sql"], filter(lambda e: isinstance(e, dict), queries_executed)))
-        )
-        r = lambda: random.randint(0, 255)  # noqa: E731
-        item = dict(
-            r_data=dict(
-                num_of_duplicate_queries=num_of_queries - num_of_distinct_queries,
-                num_of_queries=num_of_queries,
-                duration=req.get("duration"),
-                path_info=req.get("PATH_INFO"),
-                host=req.get("HTTP_HOST"),
-                method=req.get("REQUEST_METHOD"),
-                timestamp=datetime.utcfromtimestamp(req["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-                if req.get("timestamp")
-                else None,
-                query_string=req.get("QUERY_STRING"),
-            ),
-            db_queries=queries_executed,
-            color="rgba(%d, %d, %d, 0.3)" % (r(), r(), r()),
-        )
-        item_data = item["r_data"]
-        totals.setdefault(item_data["path_info"], Struct(count=0, time=0, path=""))
-        total = totals[item_data["path_info"]]
-        total.count += 1
-        total.time += item_data["duration"]
-        total.path = item_data["path_info"]
-        min_timestamp = min(req["timestamp"], min_timestamp)
-        result_data.append(item)
-
-    result_data.sort(key=lambda f: f.get("r_data", {}).get("duration", 0) or 0, reverse=True)
-    spenders = list(sorted(totals.values(), key=lambda x: x.time, reverse=True))
-
-    totals = {}
-    for interval in range(int((time.time()) - 3600) // 10, int(time.time()) // 10 + 1):
-        last_hour_running_cmds_key = f"last_hour_running_cmds{interval}"
-        last_hour_running_cmds_queue = CacheQueue.get_cache_queue(last_hour_running_cmds_key, timeout=3600)
-
-        cache_ptr = last_hour_running_cmds_queue.lrange()
-        for item in [json.loads(item) for item in cache_ptr]:
-            totals.setdefault(item[0], Struct(count=0, wall_time=0, path="", user_time=0, sys_time=0, cpu_time=0))
-            total = totals[item[0]]
-            total.count += 1
-            total.wall_time += item[1]
-            total.user_time += item[2]
-            total.sys_time += item[3]
-            total.cpu_time += item[2] + item[3]
-            total.path = item[0]
-    for total in totals.values():
-        total.wall_avg = int(total.wall_time / total.count)
-        total.cpu_avg = int(total.cpu_time / total.count)
-        total.core_usage = int(total.cpu_time / 3600.0) / 1000.0
-
-    all_requests = list(sorted(totals.values(), key=lambda x: x.wall_time, reverse=True))
-
-    return dict(
-        debug_data=result_data,
-        spenders=spenders,
-        long_running_time=int(time.time() - min_timestamp),
-        all_requests=all_requests,
-    )
+    for req in cache.get_many(keys).values():
+        if not req:
+            continue
+        timestamp = req.get("timestamp") or 0
+        if (since is not None and timestamp < since) or (until is not None and timestamp > until):
+            continue
+        if path and path not in (req.get("PATH_INFO") or ""):
+            continue
+        requests.append(req)
+    return requests
+
+
+def __get_debug_data(
+    since: float, until: float, path: Optional[str] = None, sections: Iterable[str] = DEBUG_DATA_SECTIONS
+):
+    data = dict()
+
+    if "debug_data" in sections or "spenders" in sections:
+        result_data = []
+        totals = {}
+        min_timestamp = time.time()
+
+        for req in get_long_running_requests(since, until, path):
+            queries_executed: list = req.get("queries", []) or []
+
+            num_of_queries: int = len(queries_executed)
+            num_of_distinct_queries: int = len(
+                set(map(lambda d: d["sql"], filter(lambda e: isinstance(e, dict), queries_executed)))
+            )
+            r = lambda: random.randint(0, 255)  # noqa: E731
+            item = dict(
+                r_data=dict(
+                    num_of_duplicate_queries=num_of_queries - num_of_distinct_queries,
+                    num_of_queries=num_of_queries,
+                    duration=req.get("duration"),
+                    path_info=req.get("PATH_INFO"),
+                    host=req.get("HTTP_HOST"),
+                    method=req.get("REQUEST_METHOD"),
+                    timestamp=datetime.utcfromtimestamp(req["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+                    if req.get("timestamp")
+                    else None,
+                    query_string=req.get("QUERY_STRING"),
+                    sample_rate=req.get("sample_rate", 1),
+                ),
+                db_queries=queries_executed,
+                color="rgba(%d, %d, %d, 0.3)" % (r(), r(), r()),
+            )
+            item_data = item["r_data"]
+            total = totals.setdefault(item_data["path_info"], dict(count=0, time=0, path=item_data["path_info"]))
+            # sampled records stand for 1 / sample_rate requests
+            weight = 1 / item_data["sample_rate"]
+            total["count"] += weight
+            total["time"] += item_data["duration"] * weight
+            min_timestamp = min(req["timestamp"], min_timestamp)
+            result_data.append(item)
+
+        for total in totals.values():
+            total["count"] = round(total["count"])
+            total["time"] = round(total["time"])
+        result_data.sort(key=lambda f: f.get("r_data", {}).get("duration", 0) or 0, reverse=True)
+
+        data["long_running_time"] = int(time.time() - min_timestamp)
+        if "debug_data" in sections:
+            data["debug_data"] = result_data
+        if "spenders" in sections:
+            data["spenders"] = list(sorted(totals.values(), key=lambda x: x["time"], reverse=True))
+
+    if "all_requests" in sections:
+        data["all_requests"] = get_latency_stats(since=since, until=until, path=path)
+    if "cache_stats" in sections:
+        data["cache_stats"] = get_cache_stats(since=since, until=until)
+    return data
@@ -3,6 +3,8 @@ import time
 from django.core.cache import cache
 
 from django_project_base.caching import CacheCounter
+from django_project_base.caching.cache_lock import CacheLockBackend
+from django_project_base.caching.instrumentation import get_key_prefix, record_cache_event
 
 
 class ObjectLockTimeout(Exception):
@@ -50,6 +52,7 @@ class CacheLock(object):
         self.silence_object_lock_timeout = silence_object_lock_timeout
         self.raise_timeout_exception = False
         self.timeout_checked = False
+        self.lock_backend = CacheLockBackend.get_cache_lock_backend(self.name)
 
     # noinspection PyMethodMayBeStatic
     def append_waiting_key(self, key):
@@ -59,34 +62,60 @@ class CacheLock(object):
 
             CacheQueue.get_cache_queue("CacheLockKeys", timeout=None).rpush(key)
 
+    async def aappend_waiting_key(self, key):
+        if not await cache.ahas_key(f"Inserted.{key}"):
+            await cache.aset(f"Inserted.{key}", True, timeout=None)
+            from django_project_base.caching.cache_queue import CacheQueue
+
+            await CacheQueue.get_cache_queue("CacheLockKeys", timeout=None).arpush(key)
+
     def set_waiting(self, is_waiting):
         if is_waiting:
             if not self.is_waiting:
                 self.is_waiting = True
                 key = f"Waiting.{self.stats_name}"
-                self.waiting_counter = CacheCounter(key, timeout=None)
+                self.waiting_counter = CacheCounter.get_cache_counter(key, timeout=None, buffered=True)
                 self.waiting_counter.incr()
                 self.append_waiting_key(key)
         elif self.is_waiting and not is_waiting:
             self.waiting_counter.incr(step=-1)
 
+    async def aset_waiting(self, is_waiting):
+        if is_waiting:
+            if not self.is_waiting:
+                self.is_waiting = True
+                key = f"Waiting.{self.stats_name}"
+                self.waiting_counter = CacheCounter.get_cache_counter(key, timeout=None, buffered=True)
+                await self.waiting_counter.aincr()
+                await self.aappend_waiting_key(key)
+        elif self.is_waiting and not is_waiting:
+            await self.waiting_counter.aincr(step=-1)
+
+    def record_acquire(self, start_time):
+        record_cache_event(
+            "lock",
+            get_key_prefix(self.stats_name),
+            "timeout" if self.raise_timeout_exception else "acquire",
+            duration=time.time() - start_time,
+        )
+
     def __enter__(self):
         try:
             start_time = time.time()
             while True:
-                res = CacheCounter(self.name, timeout=None).incr()
-                if res == 1:
+                if self.lock_backend.acquire():
                     self.set_waiting(False)
                     break
                 elif self.timeout == -1:
                     self.raise_timeout_exception = True
                     break
                 self.set_waiting(True)
-                time.sleep(0.1)
+                self.lock_backend.wait(self.timeout - (time.time() - start_time) if self.timeout > 0 else None)
                 if 0 < self.timeout < time.time() - start_time:
                     self.raise_timeout_exception = True
                     self.set_waiting(False)
                     break
+            self.record_acquire(start_time)
             return self
         except Exception as e:  # pragma: no cover
             self.set_waiting(False)
@@ -94,12 +123,45 @@ class CacheLock(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.timeout != 0 and not self.timeout_checked:
-            cache.delete(self.name)
+            self.lock_backend.release()
+            raise NoTimeoutCheck()
+
+        if exc_type is ObjectLockTimeout:
+            return self.silence_object_lock_timeout
+        self.lock_backend.release()
+
+    async def __aenter__(self):
+        try:
+            start_time = time.time()
+            while True:
+                if await self.lock_backend.aacquire():
+                    await self.aset_waiting(False)
+                    break
+                elif self.timeout == -1:
+                    self.raise_timeout_exception = True
+                    break
+                await self.aset_waiting(True)
+                await self.lock_backend.await_release(
+                    self.timeout - (time.time() - start_time) if self.timeout > 0 else None
+                )
+                if 0 < self.timeout < time.time() - start_time:
+                    self.raise_timeout_exception = True
+                    await self.aset_waiting(False)
+                    break
+            self.record_acquire(start_time)
+            return self
+        except Exception as e:  # pragma: no cover
+            await self.aset_waiting(False)
+            raise e
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.timeout != 0 and not self.timeout_checked:
+            await self.lock_backend.arelease()
             raise NoTimeoutCheck()
 
         if exc_type is ObjectLockTimeout:
             return self.silence_object_lock_timeout
-        cache.delete(self.name)
+        await self.lock_backend.arelease()
 
     def __call__(self, *args, **kwargs):
         self.timeout_checked = True
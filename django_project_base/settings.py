@@ -79,6 +79,9 @@ DJANGO_PROJECT_BASE_SETTINGS = (
 )
 
 USER_CACHE_KEY = "django-user-{id}"
+USER_CACHE_DATA_KEY = "django-user-{id}-{version}"
+PROJECT_SETTINGS_CACHE_KEY = "project-settings-{slug}"
+PROJECT_SETTINGS_CACHE_DATA_KEY = "project-settings-{slug}-{version}"
 CACHE_IMPERSONATE_USER = "impersonate-user-%d"
 
 PROFILER_LOG_LONG_REQUESTS_COUNT = 50
@@ -1,12 +1,29 @@
+import json
+import uuid
+
+from decimal import Decimal
+from unittest.mock import patch
+
 from django.core.cache import cache
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from django_project_base.settings import USER_CACHE_KEY
+from django_project_base.base.auth_backends import (
+    finish_request_users,
+    start_request_users,
+    user_cache_invalidate_many,
+    UsersCachingBackend,
+)
+from django_project_base.caching import model_codec
+from django_project_base.settings import USER_CACHE_DATA_KEY, USER_CACHE_KEY
 from example.demo_django_base.models import UserProfile
 from tests.test_base import TestBase
 
 
+class EmailAddress(str):
+    pass
+
+
 class TestUsersCachingBackend(TestBase):
     def setUp(self):
         super().setUp()
@@ -34,3 +51,64 @@ class TestUsersCachingBackend(TestBase):
 
         response = self.api_client.put("/account/impersonate", {"username": "janez"}, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cached_user_codec(self):
+        self.assertTrue(self.api_client.login(username="miha", password="mihamiha"), "Not logged in")
+        self.api_client.put("/account/impersonate", {"username": "janez"}, format="json")
+
+        # user is cached compactly, without pickling the model instance
+        version = cache.get(USER_CACHE_KEY.format(id=1))
+        cached_user = cache.get(USER_CACHE_DATA_KEY.format(id=1, version=version))
+        self.assertIsInstance(cached_user, bytes)
+        user = model_codec.loads(cached_user)
+        db_user = UserProfile.objects.get(pk=1)
+        self.assertIsInstance(user, UserProfile)
+        self.assertFalse(user._state.adding)
+        for field in UserProfile._meta.concrete_fields:
+            self.assertEqual(getattr(db_user, field.attname), getattr(user, field.attname))
+
+        # deferred fields stay deferred, other values keep their types
+        deferred_user = model_codec.loads(model_codec.dumps(UserProfile.objects.only("username").get(pk=1)))
+        self.assertIn("email", deferred_user.get_deferred_fields())
+        value = [
+            deferred_user.username,
+            {"a": (1, Decimal("1.5"), None), 2: {"b", "c"}},
+            [db_user.date_joined, b"\x00\xff", uuid.UUID(int=1)],
+        ]
+        self.assertEqual(value, model_codec.loads(model_codec.dumps(value)))
+        # payload is JSON, it doesn't depend on python version
+        self.assertEqual(json.loads(model_codec.dumps(value))[0], model_codec.SCHEMA_VERSION)
+
+        # field values of unknown types are stored as strings of their field, other unknown values can't be encoded
+        db_user.email = EmailAddress(db_user.email)
+        self.assertEqual(model_codec.loads(model_codec.dumps(db_user)).email, db_user.email)
+        with self.assertRaises(model_codec.ModelCodecError):
+            model_codec.dumps([EmailAddress(db_user.email)])
+
+    def test_user_cache_levels(self):
+        backend = UsersCachingBackend()
+        user_cache_invalidate_many([1])
+        with self.assertNumQueries(1):
+            user = backend.get_user(1)
+
+        # process cache only needs the version stamp from shared cache
+        with self.assertNumQueries(0), patch.object(cache, "get", wraps=cache.get) as cache_get:
+            process_user = backend.get_user(1)
+            cache_get.assert_called_once_with(USER_CACHE_KEY.format(id=1))
+        self.assertEqual(user, process_user)
+        self.assertIsNot(user, process_user)
+
+        # within a request user is resolved only once
+        start_request_users()
+        try:
+            request_user = backend.get_user(1)
+            with patch.object(cache, "get") as cache_get:
+                self.assertIs(request_user, backend.get_user(1))
+                cache_get.assert_not_called()
+        finally:
+            finish_request_users()
+
+        # dropping the version stamp invalidates all levels
+        UserProfile.objects.filter(pk=1).update(first_name="Changed")
+        user_cache_invalidate_many([1])
+        self.assertEqual("Changed", backend.get_user(1).first_name)
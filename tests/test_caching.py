@@ -1,11 +1,29 @@
+import asyncio
+import sys
 import threading
 import time
 
+from unittest.mock import patch
+
+import fakeredis
+import fakeredis.aioredis
+
 from django.core.cache import cache, caches
+from django.db.models import Q
 from django.test import override_settings, SimpleTestCase
 
-from django_project_base.caching import CacheCounter
-from django_project_base.caching.cache_queue import CacheQueue
+from django_project_base.caching import CacheCounter, CacheCounterBuffer
+from django_project_base.caching.cache_counter_redis import CacheCounterRedis
+from django_project_base.caching.cache_queue import CacheBackendInfo, CacheQueue, CacheQueueBatch
+from django_project_base.caching.cache_queue.cache_queue_other import CacheQueueOther
+from django_project_base.caching.cache_queue.cache_queue_redis import CacheQueueRedis
+from django_project_base.caching.instrumentation import CacheStats, get_cache_stats, get_key_prefix, record_cache_event
+from django_project_base.caching.local_cache import LocalCache
+from django_project_base.caching.lookup_key import get_lookup_key
+from django_project_base.management.commands.benchmark_caching import get_benchmark_backends, run_benchmarks
+
+# Own server and location, so connections of these tests are not shared with fakeredis connections of benchmarks
+FAKE_REDIS_SERVER = fakeredis.FakeServer()
 
 
 def get_redis_cache_backend_name():
@@ -15,6 +33,35 @@ def get_redis_cache_backend_name():
         return "django.core.cache.backends.locmem.LocMemCache"
 
 
+def fake_redis_cache(test_func):
+    """
+    Runs the test on redis cache served by in-process fakeredis, so redis queues and counters are tested without a
+    redis server. Fakeredis doesn't implement INFO, so its version is given instead of being read from the server
+    """
+    from django_redis.cache import RedisCache
+
+    backend_info = CacheBackendInfo(backend_class=RedisCache, redis_version="7.0.0", is_redis_backend=True)
+    test_func = patch.object(CacheQueue, "_resolve_cache_backend", new=lambda cache_name: backend_info)(test_func)
+    test_func = patch(
+        "django_project_base.caching.async_redis.get_async_redis_connection",
+        new=lambda cache_name="default": fakeredis.aioredis.FakeRedis(server=FAKE_REDIS_SERVER),
+    )(test_func)
+    return override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://fakeredis-tests:6379/0",
+                "OPTIONS": {
+                    "CONNECTION_POOL_KWARGS": {
+                        "connection_class": fakeredis.FakeConnection,
+                        "server": FAKE_REDIS_SERVER,
+                    },
+                },
+            },
+        }
+    )(test_func)
+
+
 class TestCaching(SimpleTestCase):
     @override_settings(
         CACHES={
@@ -31,6 +78,11 @@ class TestCaching(SimpleTestCase):
         # Calling cache counter test for redis cache backend
         self._test_cache_counter()
 
+    @fake_redis_cache
+    def test_cache_counter_fakeredis_cache(self):
+        self.assertIs(CacheCounter.get_cache_counter_class(), CacheCounterRedis)
+        self._test_cache_counter()
+
     @override_settings(
         CACHES={
             "default": {
@@ -65,7 +117,7 @@ class TestCaching(SimpleTestCase):
             self.assertEqual(290, cache.get(f"cnt_{c + 1}", 0))
 
         # Checking if counter only lasts till timeout
-        cc = CacheCounter("timeout", timeout=2)
+        cc = CacheCounter.get_cache_counter("timeout", timeout=2)
         start = time.time()
         cc.incr()
         while cache.get("timeout", 0) and time.time() - start < 4:
@@ -85,12 +137,17 @@ class TestCaching(SimpleTestCase):
         duration = time.time() - start
         self.assertTrue(3 < duration < 4)
 
+        counter_class = CacheCounter.get_cache_counter_class()
+        self.assertEqual(counter_class.incr_many({"many_1": 1, "many_2": 5}, start=10), {"many_1": 11, "many_2": 15})
+        self.assertEqual(counter_class.incr_many({"many_1": -1, "many_2": 1}), {"many_1": 10, "many_2": 16})
+        self.assertEqual(cache.get("many_2"), 16)
+
     # noinspection PyMethodMayBeStatic
     def _change_counters(self, increase=True, start=0):
         def _increase_counter(key, value):
             from django.db import connection
 
-            counter = CacheCounter(key)
+            counter = CacheCounter.get_cache_counter(key)
             for _i in range(10):
                 params = dict()
                 if value != 1:
@@ -121,7 +178,7 @@ class TestCaching(SimpleTestCase):
         CACHES={
             "default": {
                 "BACKEND": get_redis_cache_backend_name(),
-                "LOCATION": f"redis://127.0.0.1:6379?db=1",
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
                 "OPTIONS": {
                     "CLIENT_CLASS": "django_redis.client.DefaultClient",
                 },
@@ -132,6 +189,11 @@ class TestCaching(SimpleTestCase):
         # Calling cache queue test for redis cache backend
         self._test_cache_queue()
 
+    @fake_redis_cache
+    def test_cache_queue_fakeredis_cache(self):
+        self.assertIs(CacheQueue.get_cache_queue_class(), CacheQueueRedis)
+        self._test_cache_queue()
+
     @override_settings(
         CACHES={
             "default": {
@@ -241,3 +303,463 @@ class TestCaching(SimpleTestCase):
             time.sleep(0.1)
         duration = time.time() - start
         self.assertTrue(2 < duration < 3)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    def test_cache_queue_other_chunks(self):
+        from django_project_base.caching.cache_queue.cache_queue_other import CacheQueueOther
+
+        caches["default"].clear()
+        cache_queue = CacheQueueOther("test_chunks", cache_name="default", timeout=None)
+        cache_queue.chunk_size = 3
+        cache_queue.lrange_page_size = 2
+
+        # pushing to both ends of queue spans multiple chunks
+        cache_queue.rpush(*[str(i) for i in range(5, 15)])
+        cache_queue.lpush(*[str(i) for i in reversed(range(5))])
+        self.assertEqual([item.decode("utf-8") for item in cache_queue.lrange()], [str(i) for i in range(15)])
+        self.assertEqual([item.decode("utf-8") for item in cache_queue.lrange(7)], [str(i) for i in range(8)])
+
+        # each chunk is stored under its own key and never holds more than chunk_size items
+        head, tail = cache_queue.get_pointers()
+        self.assertEqual(tail - head + 1, 6)
+        for chunk in range(head, tail + 1):
+            self.assertLessEqual(len(cache.get(cache_queue.get_chunk_key(chunk))), 3)
+
+        # popping across chunk boundaries removes emptied chunks
+        self.assertEqual([item.decode("utf-8") for item in cache_queue.lpop(4)], ["0", "1", "2", "3"])
+        self.assertEqual([item.decode("utf-8") for item in cache_queue.rpop(5)], ["14", "13", "12", "11", "10"])
+        self.assertIsNone(cache.get(cache_queue.get_chunk_key(head)))
+        self.assertIsNone(cache.get(cache_queue.get_chunk_key(tail)))
+
+        cache_queue.ltrim(2)
+        self.assertEqual([item.decode("utf-8") for item in cache_queue.lrange()], ["6", "7", "8", "9"])
+        self.assertEqual(cache_queue.lpop(10), [b"6", b"7", b"8", b"9"])
+        self.assertIsNone(cache_queue.rpop())
+        self.assertEqual(cache_queue.lrange(), [])
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": get_redis_cache_backend_name(),
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                },
+            },
+        }
+    )
+    def test_cache_queue_batch_redis_cache(self):
+        self._test_cache_queue_batch()
+
+    @fake_redis_cache
+    def test_cache_queue_batch_fakeredis_cache(self):
+        self._test_cache_queue_batch()
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    def test_cache_queue_batch_loc_mem_cache(self):
+        self._test_cache_queue_batch()
+
+    def _test_cache_queue_batch(self):
+        caches["default"].clear()
+
+        # pushes are only sent to cache when batch is flushed
+        with CacheQueueBatch() as batch:
+            batch.rpush("batch1", "1", timeout=None)
+            batch.rpush("batch2", "a", "b", timeout=None)
+            batch.rpush("batch1", "2", "3", timeout=None)
+            batch.lpush("batch1", "0", timeout=None)
+            self.assertEqual(CacheQueue.get_cache_queue("batch1").lrange(), [])
+        self.assertEqual(CacheQueue.get_cache_queue("batch1").lrange(), [b"0", b"1", b"2", b"3"])
+        self.assertEqual(CacheQueue.get_cache_queue("batch2").lrange(), [b"a", b"b"])
+
+        # batch is discarded if with block raises
+        with self.assertRaises(ValueError):
+            with CacheQueueBatch() as batch:
+                batch.rpush("batch2", "c")
+                raise ValueError()
+        self.assertEqual(CacheQueue.get_cache_queue("batch2").lrange(), [b"a", b"b"])
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": get_redis_cache_backend_name(),
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                },
+            },
+        }
+    )
+    async def test_cache_queue_async_redis_cache(self):
+        await self._test_cache_queue_async()
+
+    @fake_redis_cache
+    async def test_cache_queue_async_fakeredis_cache(self):
+        await self._test_cache_queue_async()
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    async def test_cache_queue_async_loc_mem_cache(self):
+        await self._test_cache_queue_async()
+
+    async def _test_cache_queue_async(self):
+        await caches["default"].aclear()
+        cache_queue = CacheQueue.get_cache_queue("test_async", timeout=None)
+
+        await cache_queue.arpush("2", "3", "4")
+        await cache_queue.alpush("1")
+        self.assertEqual(await cache_queue.alrange(), [b"1", b"2", b"3", b"4"])
+        self.assertEqual(await cache_queue.alrange(1), [b"1", b"2"])
+        self.assertEqual(await cache_queue.alpop(), b"1")
+        self.assertEqual(await cache_queue.arpop(2), [b"4", b"3"])
+        await cache_queue.altrim(1)
+        self.assertIsNone(await cache_queue.alpop())
+        self.assertEqual(await cache_queue.alrange(), [])
+
+        # async counter updates from concurrent tasks are all taken into account
+        await asyncio.gather(*[CacheCounter("cnt_async").aincr(i) for i in range(1, 11)])
+        self.assertEqual(await cache.aget("cnt_async"), 55)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": get_redis_cache_backend_name(),
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                },
+            },
+        }
+    )
+    def test_cache_queue_blocking_redis_cache(self):
+        self._test_cache_queue_blocking()
+
+    @fake_redis_cache
+    def test_cache_queue_blocking_fakeredis_cache(self):
+        self._test_cache_queue_blocking()
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    def test_cache_queue_blocking_loc_mem_cache(self):
+        self._test_cache_queue_blocking()
+
+    def _test_cache_queue_blocking(self):
+        caches["default"].clear()
+        cache_queue = CacheQueue.get_cache_queue("test_blocking", timeout=None)
+
+        # Blocking pop on empty queue returns None after timeout
+        start = time.time()
+        self.assertIsNone(cache_queue.blpop(timeout=0.3))
+        self.assertTrue(0.3 <= time.time() - start < 1)
+
+        # Blocking pop returns as soon as another thread pushes data
+        def _push_later():
+            time.sleep(0.3)
+            CacheQueue.get_cache_queue("test_blocking", timeout=None).rpush("1", "2")
+
+        producer = threading.Thread(target=_push_later)
+        start = time.time()
+        producer.start()
+        self.assertEqual(cache_queue.blpop(timeout=5), b"1")
+        self.assertTrue(time.time() - start < 1)
+        producer.join()
+        self.assertEqual(cache_queue.brpop(timeout=1, count=5), [b"2"])
+
+        # Consumer gets data in batches and stops when no data arrives in max_wait
+        cache_queue.rpush("1", "2", "3", "4", "5")
+        batches = list(cache_queue.consume(batch_size=2, max_wait=0.3))
+        self.assertEqual(batches, [[b"1", b"2"], [b"3", b"4"], [b"5"]])
+        cache_queue.rpush("6")
+        self.assertEqual(list(cache_queue.consume(batch_size=1, max_wait=0.3)), [[b"6"]])
+
+        # With max_wait 0 consumer takes what is already in queue and doesn't wait for more
+        batches = []
+        cache_queue.rpush("7", "8", "9")
+        consumer = threading.Thread(target=lambda: batches.extend(cache_queue.consume(batch_size=2, max_wait=0)))
+        consumer.daemon = True
+        consumer.start()
+        consumer.join(2)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(batches, [[b"7", b"8"], [b"9"]])
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": get_redis_cache_backend_name(),
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                },
+            },
+        }
+    )
+    def test_cache_queue_bounded_redis_cache(self):
+        self._test_cache_queue_bounded()
+
+    @fake_redis_cache
+    def test_cache_queue_bounded_fakeredis_cache(self):
+        self._test_cache_queue_bounded()
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    def test_cache_queue_bounded_loc_mem_cache(self):
+        self._test_cache_queue_bounded()
+
+    def _test_cache_queue_bounded(self):
+        caches["default"].clear()
+        cache_queue = CacheQueue.get_cache_queue("test_bounded", timeout=None, max_length=5)
+        if hasattr(cache_queue, "chunk_size"):
+            # so that trimming spans multiple chunks
+            cache_queue.chunk_size = 2
+
+        # rpush drops oldest items from start of queue
+        cache_queue.rpush("1", "2", "3", "4")
+        cache_queue.rpush("5", "6", "7")
+        self.assertEqual(cache_queue.lrange(), [b"3", b"4", b"5", b"6", b"7"])
+        self.assertEqual(cache_queue.get_dropped_count(), 2)
+
+        # lpush drops oldest items from end of queue
+        cache_queue.lpush("a", "b")
+        self.assertEqual(cache_queue.lrange(), [b"b", b"a", b"3", b"4", b"5"])
+        self.assertEqual(cache_queue.get_dropped_count(), 4)
+
+        # queue under max_length doesn't drop anything
+        cache_queue.lpop(3)
+        cache_queue.rpush("8")
+        self.assertEqual(cache_queue.lrange(), [b"4", b"5", b"8"])
+        self.assertEqual(cache_queue.get_dropped_count(), 4)
+
+        with CacheQueueBatch() as batch:
+            for i in range(10):
+                batch.rpush("test_bounded_batch", str(i), max_length=3)
+        cache_queue = CacheQueue.get_cache_queue("test_bounded_batch")
+        self.assertEqual(cache_queue.lrange(), [b"7", b"8", b"9"])
+        self.assertEqual(cache_queue.get_dropped_count(), 7)
+
+    def test_cache_backend_registry(self):
+        CacheQueue.refresh_cache_backend()
+        backend_info = CacheQueue.resolve_cache_backend("default")
+        self.assertIs(CacheQueue.resolve_cache_backend("default"), backend_info)
+
+        # queue construction doesn't touch the cache once backend is resolved
+        with patch.object(CacheQueue, "_resolve_cache_backend") as resolve:
+            CacheQueue.get_cache_queue("test_registry")
+            resolve.assert_not_called()
+
+        CacheQueue.refresh_cache_backend("default")
+        self.assertIsNot(CacheQueue.resolve_cache_backend("default"), backend_info)
+        self.assertEqual(CacheQueue.resolve_cache_backend("default"), backend_info)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://fakeredis-tests:6379/0",
+            },
+        }
+    )
+    def test_cache_backend_without_packaging(self):
+        # redis server version can't be checked, so non-optimised queue is used
+        with patch.dict(sys.modules, {"packaging": None}), self.assertWarnsMessage(UserWarning, "packaging"):
+            backend_info = CacheQueue.resolve_cache_backend("default")
+        self.assertFalse(backend_info.is_redis_backend)
+        self.assertIs(CacheQueue.get_cache_queue_class(), CacheQueueOther)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": get_redis_cache_backend_name(),
+                "LOCATION": "redis://127.0.0.1:6379?db=1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                },
+            },
+        }
+    )
+    def test_cache_counter_buffered_redis_cache(self):
+        self._test_cache_counter_buffered()
+
+    @fake_redis_cache
+    def test_cache_counter_buffered_fakeredis_cache(self):
+        self._test_cache_counter_buffered()
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "",
+            }
+        }
+    )
+    def test_cache_counter_buffered_loc_mem_cache(self):
+        self._test_cache_counter_buffered()
+
+    def _test_cache_counter_buffered(self):
+        caches["default"].clear()
+        buffer = CacheCounterBuffer.get_buffer("default")
+        buffer.flush()
+        flush_interval, flush_size = buffer.flush_interval, buffer.flush_size
+        try:
+            buffer.flush_interval, buffer.flush_size = 60, 5
+            counter = CacheCounter("test_buffered", timeout=None, buffered=True)
+            for i in range(4):
+                self.assertIsNone(counter.incr())
+            self.assertIsNone(cache.get("test_buffered"))
+            # size threshold reached
+            counter.incr()
+            self.assertEqual(cache.get("test_buffered"), 5)
+
+            # increments that cancel out are not written, start is respected for new keys
+            counter.incr()
+            counter.incr(step=-1)
+            CacheCounter("test_buffered_start", buffered=True).incr(step=3, start=10)
+            buffer.flush()
+            self.assertEqual(cache.get("test_buffered"), 5)
+            self.assertEqual(cache.get("test_buffered_start"), 13)
+
+            # interval flush doesn't need further increments
+            buffer.flush_interval = 0.1
+            asyncio.run(counter.aincr(step=2))
+            time.sleep(0.5)
+            self.assertEqual(cache.get("test_buffered"), 7)
+        finally:
+            buffer.flush_interval, buffer.flush_size = flush_interval, flush_size
+
+    def test_local_cache(self):
+        local_cache = LocalCache(max_size=2, timeout=0.2)
+        local_cache.set("a", 1)
+        local_cache.set("b", 2)
+        self.assertEqual(local_cache.get("a"), 1)
+        # b is least recently used now, so it gets dropped
+        local_cache.set("c", 3)
+        self.assertIsNone(local_cache.get("b"))
+        self.assertEqual(local_cache.get("c"), 3)
+
+        local_cache.set("d", 4, timeout=10)
+        time.sleep(0.3)
+        self.assertIsNone(local_cache.get("c"))
+        self.assertEqual(local_cache.get("d"), 4)
+        self.assertEqual(local_cache.get("c", "default"), "default")
+
+    def test_lookup_key(self):
+        from django_project_base.notifications.models import DjangoProjectBaseNotification
+
+        self.assertEqual(get_lookup_key(a=1, b="x"), get_lookup_key(b="x", a=1))
+        self.assertNotEqual(get_lookup_key(a=1), get_lookup_key(a="1"))
+        self.assertNotEqual(get_lookup_key(a=1), get_lookup_key(a=True))
+        self.assertEqual(get_lookup_key(a=[1, 2]), get_lookup_key(a=[1, 2]))
+        self.assertNotEqual(get_lookup_key(a=[1, 2]), get_lookup_key(a=[2, 1]))
+        self.assertEqual(get_lookup_key(a={2, 1}), get_lookup_key(a={1, 2}))
+
+        # Q trees, model instances and querysets are encoded by their content
+        self.assertEqual(get_lookup_key(Q(a=1) | Q(b=2)), get_lookup_key(Q(b=2) | Q(a=1)))
+        self.assertNotEqual(get_lookup_key(Q(a=1) | Q(b=2)), get_lookup_key(Q(a=1) & Q(b=2)))
+        self.assertNotEqual(get_lookup_key(Q(a=1)), get_lookup_key(~Q(a=1)))
+        self.assertEqual(
+            get_lookup_key(item=DjangoProjectBaseNotification(pk=1)),
+            get_lookup_key(item=DjangoProjectBaseNotification(pk=1)),
+        )
+        self.assertNotEqual(
+            get_lookup_key(item=DjangoProjectBaseNotification(pk=1)),
+            get_lookup_key(item=DjangoProjectBaseNotification(pk=2)),
+        )
+        self.assertEqual(
+            get_lookup_key(pk__in=DjangoProjectBaseNotification.objects.filter(level=1)),
+            get_lookup_key(pk__in=DjangoProjectBaseNotification.objects.filter(level=1)),
+        )
+        self.assertNotEqual(
+            get_lookup_key(pk__in=DjangoProjectBaseNotification.objects.filter(level=1)),
+            get_lookup_key(pk__in=DjangoProjectBaseNotification.objects.filter(level=2)),
+        )
+
+    def test_cache_stats(self):
+        stats = CacheStats.get_instance()
+        stats.flush()
+        cache.clear()
+        self.assertEqual(get_key_prefix("user_12__data_%s" % ("a" * 32)), "user_#__data_#")
+
+        for _ in range(3):
+            record_cache_event("test", "item_#", "hit", duration=0.0002, size=100)
+        record_cache_event("test", "item_#", "miss", duration=0.02)
+        queue = CacheQueue.get_cache_queue("test_stats_queue", timeout=None)
+        queue.rpush(1, 2)
+        queue.lpop()
+        stats.flush()
+
+        rows = {(row["component"], row["prefix"], row["event"]): row for row in get_cache_stats()}
+        hit = rows[("test", "item_#", "hit")]
+        self.assertEqual(hit["count"], 3)
+        self.assertEqual(hit["hit_rate"], 0.75)
+        self.assertEqual(hit["latency_p50"], 0.25)
+        self.assertEqual(hit["size_avg"], 100)
+        miss = rows[("test", "item_#", "miss")]
+        self.assertEqual(miss["latency_p99"], 25)
+        self.assertIsNone(miss["size_avg"])
+        # queue operations are instrumented, statistics' own flushes aren't
+        self.assertEqual(rows[("queue", "test_stats_queue", "rpush")]["count"], 1)
+        self.assertEqual(rows[("queue", "test_stats_queue", "lpop")]["count"], 1)
+        self.assertNotIn(("queue", "cache_stats", "rpush"), rows)
+
+        self.assertEqual(get_cache_stats(since=time.time() + 1), [])
+
+    def test_cache_stats_nested_calls(self):
+        stats = CacheStats.get_instance()
+        stats.flush()
+        cache.clear()
+
+        # buffered redis counter calls super().incr, locmem aincr falls back to incr
+        CacheCounterRedis("test_stats_counter", buffered=True).incr()
+        asyncio.run(CacheCounter("test_stats_counter").aincr())
+        stats.flush()
+
+        rows = {(row["component"], row["prefix"], row["event"]): row for row in get_cache_stats()}
+        self.assertEqual(rows[("counter", "test_stats_counter", "incr")]["count"], 1)
+        self.assertEqual(rows[("counter", "test_stats_counter", "aincr")]["count"], 1)
+
+    def test_benchmark(self):
+        backends = [backend for backend in get_benchmark_backends() if backend.name in ("locmem", "fakeredis")]
+        report = run_benchmarks(backends, modes=("threads",), concurrency=(2,), iterations=5, max_duration=10)
+        results = {(row["benchmark"], row["backend"], row["operation"]): row for row in report["results"]}
+        self.assertEqual(results[("counter", "locmem", "incr")]["ops"], 10)
+        self.assertEqual(results[("lock", "locmem", "acquire")]["ops"], 10)
+        self.assertEqual(results[("queue_other", "locmem", "lpop")]["errors"], 0)
+        # redis queue is only benchmarked on redis backends
+        self.assertNotIn(("queue_redis", "locmem", "rpush"), results)
+        if any(backend.name == "fakeredis" for backend in backends):
+            self.assertEqual(results[("queue_redis", "fakeredis", "rpush")]["ops"], 10)
+        for row in results.values():
+            self.assertFalse(row["timed_out"])
+            self.assertGreater(row["ops_per_second"], 0)
+            self.assertLessEqual(row["latency_p50_ms"], row["latency_p99_ms"])
@@ -1,10 +1,18 @@
 import datetime
+import threading
+import time
+import uuid
+
+from unittest.mock import patch
+
+from django.core.cache import cache
 
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.test import APIClient
 
-from django_project_base.notifications.models import DjangoProjectBaseMessage
+from django_project_base.base.queryset_with_cache import CachedEntry
+from django_project_base.notifications.models import DjangoProjectBaseMessage, DjangoProjectBaseNotification
 from django_project_base.utils import get_pk_name
 from tests.test_base import TestBase
 
@@ -54,3 +62,103 @@ class TestMaintenanceNotifications(TestBase):
         )
         self.assertEqual(status.HTTP_201_CREATED, acknowledged_response.status_code)
         self.assertEqual(1, len(self.api_client.get(self.url).data))
+
+    def test_maintenance_notifications_cache_invalidation(self):
+        self.assertEqual(status.HTTP_201_CREATED, self._create_maintenance_notification({}).status_code)
+        self.assertEqual(1, len(DjangoProjectBaseNotification.objects.maintenance_notifications()))
+
+        # update through queryset invalidates cached notifications on every cache backend
+        DjangoProjectBaseNotification.objects.all().update(
+            delayed_to=int((datetime.datetime.now() - datetime.timedelta(hours=1)).timestamp())
+        )
+        self.assertEqual(0, len(DjangoProjectBaseNotification.objects.maintenance_notifications()))
+
+    def test_maintenance_notifications_local_cache(self):
+        self.assertEqual(status.HTTP_201_CREATED, self._create_maintenance_notification({}).status_code)
+        DjangoProjectBaseNotification.objects.all().update()
+        notifications = DjangoProjectBaseNotification.objects.maintenance_notifications()
+        # served from per-process cache without going to shared cache
+        with patch("django_project_base.base.queryset_with_cache.cache") as shared_cache:
+            self.assertIs(notifications, DjangoProjectBaseNotification.objects.maintenance_notifications())
+            shared_cache.get.assert_not_called()
+
+    def test_maintenance_notifications_stampede_protection(self):
+        self.assertEqual(status.HTTP_201_CREATED, self._create_maintenance_notification({}).status_code)
+        queryset = DjangoProjectBaseNotification.objects.all()
+        queryset.update()
+        cache_key = queryset.versioned_base_cache_key
+        notifications = queryset.maintenance_notifications()
+
+        # expired entry is served stale while another worker recomputes it
+        queryset.cache_set(cache_key, CachedEntry(notifications, time.time() - 1, 0))
+        cache.add("%s__refresh" % cache_key, True)
+        with self.assertNumQueries(0):
+            self.assertIs(notifications, queryset.maintenance_notifications())
+
+        # once refresh lock is released, expired entry is recomputed
+        cache.delete("%s__refresh" % cache_key)
+        with self.assertNumQueries(1):
+            self.assertEqual(1, len(queryset.maintenance_notifications()))
+        with self.assertNumQueries(0):
+            queryset.maintenance_notifications()
+
+        # entries which take long to compute are refreshed before they expire
+        queryset.cache_set(cache_key, CachedEntry(notifications, time.time() + 10, 3600))
+        with self.assertNumQueries(1), patch("random.random", return_value=0.5):
+            queryset.maintenance_notifications()
+
+    def test_cache_get_or_compute_single_flight(self):
+        queryset = DjangoProjectBaseNotification.objects.all()
+        cache_key = "%s__single_flight" % queryset.versioned_base_cache_key
+        computed = []
+        results = []
+
+        def compute():
+            computed.append(True)
+            time.sleep(0.2)
+            return "value"
+
+        # concurrent cold misses compute the value once, the others wait for it
+        threads = [
+            threading.Thread(target=lambda: results.append(queryset.cache_get_or_compute(cache_key, compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def test_maintenance_notifications_get_many(self):
+        self.assertEqual(status.HTTP_201_CREATED, self._create_maintenance_notification({}).status_code)
+        self.assertEqual(
+            status.HTTP_201_CREATED,
+            self._create_maintenance_notification(
+                dict(delayed_to=int((datetime.datetime.now() + datetime.timedelta(hours=3)).timestamp()))
+            ).status_code,
+        )
+        queryset = DjangoProjectBaseNotification.objects.all()
+        queryset.update()
+        pks = list(queryset.values_list("pk", flat=True))
+        self.assertEqual(2, len(pks))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(pks), set(queryset.get_many(pks + [uuid.uuid4()])))
+        # all instances are now cached, only the missing one is queried
+        with self.assertNumQueries(0):
+            self.assertEqual(set(pks), set(queryset.in_bulk(pks)))
+        with self.assertNumQueries(1):
+            self.assertEqual(set(pks), set(queryset.get_many(pks + [uuid.uuid4()])))
+
+        # filtered querysets are not served from cache
+        with self.assertNumQueries(1):
+            self.assertEqual(dict(), queryset.filter(pk=uuid.uuid4()).get_many(pks))
+
+        # neither are querysets returning something else than whole instances, they behave like in django
+        with self.assertRaisesMessage(TypeError, "in_bulk() cannot be used with values() or values_list()."):
+            queryset.values("pk").in_bulk(pks)
+        with self.assertNumQueries(1):
+            self.assertEqual(set(pks), set(queryset.only("pk").in_bulk(pks)))
+        with self.assertNumQueries(1):
+            self.assertEqual(set(pks), set(queryset.select_related("message").in_bulk(pks)))
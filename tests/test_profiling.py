@@ -0,0 +1,353 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.test import override_settings, RequestFactory, SimpleTestCase
+
+from django_project_base.caching.instrumentation import CacheStats
+from django_project_base.profiling.latency import get_latency_stats, LatencySketch, LatencyStats
+from django_project_base.profiling.log_sink import ProfileLogSink
+from django_project_base.profiling.middleware import ProfileRequest
+from django_project_base.profiling.request_stats import get_request_stats_summary, RequestStatsRing
+from django_project_base.profiling.sampling import ProfileSampler
+from django_project_base.profiling.views import (
+    app_debug_cache_stats_view,
+    app_debug_data_view,
+    app_debug_view,
+    get_long_running_requests,
+)
+
+
+class TestProfileLogSink(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "wsgi_performance.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_records(self, number):
+        with open("%s.%d" % (self.path, number)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_add_buffers_records(self):
+        sink = ProfileLogSink(self.path)
+        sink.flush_interval = 0.1
+        with patch("builtins.open") as mock_open, patch("os.path.getsize") as mock_getsize:
+            sink.add(dict(path_info="a"))
+            sink.add(dict(path_info="b"))
+            mock_open.assert_not_called()
+            mock_getsize.assert_not_called()
+        self.assertEqual(len(sink.buffer), 2)
+        # background thread writes buffered records
+        time.sleep(0.5)
+        self.assertEqual(len(sink.buffer), 0)
+        self.assertEqual([record["path_info"] for record in self.read_records(1)], ["a", "b"])
+
+    def test_rotation(self):
+        sink = ProfileLogSink(self.path)
+        sink.max_file_size = 10
+        sink.max_files = 3
+        for i in range(5):
+            sink.buffer.append(dict(request=i))
+            sink.flush()
+        self.assertEqual(sink.get_file_numbers(), [1, 2, 3])
+        self.assertEqual([self.read_records(number) for number in (1, 2, 3)], [[{"request": i}] for i in (2, 3, 4)])
+
+        # records are appended to the newest file while it has room
+        sink.max_file_size = 1000
+        sink.buffer.append(dict(request=5))
+        sink.flush()
+        self.assertEqual(self.read_records(3), [{"request": 4}, {"request": 5}])
+
+
+def write_request_stats(file_name, path, count, barrier=None):
+    ring = RequestStatsRing(file_name, workers=2, records=4, paths=2)
+    for i in range(count):
+        ring.write(path, 200, i, 1, 1, 2)
+    if barrier:
+        # keeps worker alive until the others have claimed their regions
+        barrier.wait(5)
+
+
+class TestRequestStatsRing(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, "request_stats")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_read(self):
+        ring = RequestStatsRing(self.file_name, workers=2, records=4, paths=2)
+        self.assertEqual(ring.read(), [])
+        for i in range(6):
+            ring.write("rest/a" if i % 2 else "rest/b", 500 if i == 5 else 200, i, 1, 2, 3)
+        ring.write("rest/c", 200, 10, 1, 2, 3)
+
+        # ring keeps newest records, oldest one is skipped in case it is being overwritten
+        records = ring.read()
+        self.assertEqual([record.wall_time for record in records], [4, 5, 10])
+        self.assertEqual({record.pid for record in records}, {os.getpid()})
+        # path table only holds two names, others are shown by id
+        self.assertEqual([record.path for record in records[:2]], ["rest/b", "rest/a"])
+        self.assertTrue(records[2].path.startswith("#"))
+
+        summary = get_request_stats_summary(records)
+        self.assertEqual(summary[0]["wall_time"], 10)
+        self.assertEqual(
+            [(row["path"], row["count"], row["errors"]) for row in summary[1:]], [("rest/a", 1, 1), ("rest/b", 1, 0)]
+        )
+        self.assertEqual(ring.read(since=time.time() + 1), [])
+
+    def test_workers(self):
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(2)
+        processes = [
+            context.Process(target=write_request_stats, args=(self.file_name, path, count, barrier))
+            for path, count in (("rest/a", 2), ("rest/b", 3))
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        ring = RequestStatsRing(self.file_name, workers=2, records=4, paths=2)
+        records = ring.read()
+        self.assertEqual(
+            sorted((record.path, record.wall_time) for record in records),
+            [("rest/a", 0), ("rest/a", 1), ("rest/b", 0), ("rest/b", 1), ("rest/b", 2)],
+        )
+        self.assertEqual(len({record.pid for record in records}), 2)
+
+        # region of a finished worker is reused, its records stay until overwritten
+        ring.write("rest/c", 200, 0, 0, 0, 0)
+        records = ring.read()
+        self.assertEqual([record.pid for record in records if record.path == "rest/c"], [os.getpid()])
+        self.assertEqual(len({record.pid for record in records}), 2)
+
+    def test_layout_change(self):
+        ring = RequestStatsRing(self.file_name, workers=2, records=4096, paths=2)
+        ring.write("rest/a", 200, 1, 1, 1, 1)
+        # differently configured process (e.g. during deploy) uses its own file and doesn't break the mapped one
+        other = RequestStatsRing(self.file_name, workers=2, records=16, paths=2)
+        other.write("rest/b", 200, 2, 1, 1, 1)
+        ring.write("rest/a", 200, 3, 1, 1, 1)
+        self.assertEqual([record.wall_time for record in ring.read()], [1, 3])
+        self.assertEqual([record.wall_time for record in other.read()], [2])
+
+        # file with wrong content is replaced, not truncated under other mappings
+        with open(other.path, "r+b") as f:
+            f.write(b"garbage!")
+        other = RequestStatsRing(self.file_name, workers=2, records=16, paths=2)
+        other.write("rest/b", 200, 4, 1, 1, 1)
+        self.assertEqual([record.wall_time for record in other.read()], [4])
+
+    def test_open_failure(self):
+        ring = RequestStatsRing(os.path.join(self.directory.name, "missing", "request_stats"))
+        with patch("django_project_base.profiling.request_stats.log_profiler_error") as mock_log_error:
+            ring.write("rest/a", 200, 1, 1, 1, 1)
+            ring.write("rest/a", 200, 1, 1, 1, 1)
+        # process gives up after the first failure
+        self.assertFalse(ring.enabled)
+        self.assertEqual(mock_log_error.call_count, 1)
+        self.assertEqual(ring.read(), [])
+
+    def test_middleware_ring_failure(self):
+        response = HttpResponse()
+        with (
+            patch.object(RequestStatsRing, "write", side_effect=OSError("no space left")),
+            patch("django_project_base.profiling.middleware.record_request_latency") as mock_record_latency,
+            patch("django_project_base.profiling.middleware.log_profiler_error"),
+        ):
+            with ProfileRequest(dict(REQUEST_METHOD="GET", PATH_INFO="/rest/a"), lambda: response, (), {}) as pr:
+                self.assertIs(pr.response, response)
+        # rest of profiling still happens
+        mock_record_latency.assert_called_once()
+
+    def test_query_count(self):
+        used = SimpleNamespace(connection=object(), queries_log=[dict(sql="SELECT 1")] * 3)
+        unused = SimpleNamespace(connection=None, queries_log=[])
+        with patch("django_project_base.profiling.middleware.connections") as mock_connections:
+            mock_connections.all.return_value = [used, unused]
+            self.assertEqual(
+                ProfileRequest(dict(REQUEST_METHOD="GET", PATH_INFO="/"), None, (), {})._get_query_count(), 3
+            )
+        # initialized_only is only available since Django 4.1
+        mock_connections.all.assert_called_once_with()
+
+    @override_settings(PROFILER_SAMPLE_RATE=1000, PROFILER_LONG_RUNNING_TASK_THRESHOLD=-1)
+    def test_long_running_not_sampled(self):
+        cache.clear()
+        with (
+            patch.object(RequestStatsRing, "write"),
+            patch("django_project_base.profiling.middleware.record_request_latency"),
+            patch.object(ProfileLogSink, "add") as mock_add,
+            patch("random.random", return_value=0.99),
+        ):
+            with ProfileRequest(dict(REQUEST_METHOD="GET", PATH_INFO="/rest/a"), HttpResponse, (), {}):
+                pass
+        # request is left out of the sampled log, but still recorded as long running
+        mock_add.assert_not_called()
+        requests = get_long_running_requests()
+        self.assertEqual([(req["PATH_INFO"], req["sample_rate"]) for req in requests], [("rest/a", 1)])
+
+
+class TestProfileSampler(SimpleTestCase):
+    def test_fixed_rate(self):
+        sampler = ProfileSampler(rate=4, always_above=1000)
+        with patch("random.random", return_value=0.3):
+            self.assertEqual(sampler.get_sample_rate(10), 0)
+            self.assertEqual(sampler.get_sample_rate(1001), 1)
+        with patch("random.random", return_value=0.2):
+            self.assertEqual(sampler.get_sample_rate(10), 0.25)
+
+        self.assertEqual(ProfileSampler().get_sample_rate(10), 1)
+        with override_settings(PROFILER_SAMPLE_RATE=10):
+            self.assertEqual(ProfileSampler.get_sampler().rate, 10)
+        self.assertEqual(ProfileSampler.get_sampler().rate, 1)
+
+    def test_adaptive_rate(self):
+        with patch("time.time", return_value=100.5):
+            sampler = ProfileSampler(rate=2, max_per_second=10)
+            for i in range(200):
+                sampler.get_sample_rate(10)
+        self.assertEqual(sampler.probability, 0.5)
+
+        # 200 requests in previous second, 10 should be recorded
+        with patch("time.time", return_value=101.5), patch("random.random", return_value=0.01):
+            self.assertEqual(sampler.get_sample_rate(10), 0.05)
+
+        # low traffic is sampled with fixed rate again
+        with patch("time.time", return_value=103.5):
+            self.assertIn(sampler.get_sample_rate(10), (0, 0.5))
+        self.assertEqual(sampler.probability, 0.5)
+
+
+class TestLatencyStats(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sketch(self):
+        sketches = [LatencySketch(), LatencySketch()]
+        for value in range(1, 10001):
+            sketches[value % 2].add(value)
+        sketch = sketches[0]
+        sketch.merge(sketches[1])
+        self.assertEqual((sketch.count, sketch.sum, sketch.max), (10000, 50005000, 10000))
+        for percentile in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(sketch.get_percentile(percentile), 10000 * percentile, delta=10000 * percentile / 32)
+        # small values are exact
+        sketch = LatencySketch()
+        for value in (3, 3, 5, 20):
+            sketch.add(value)
+        self.assertEqual([sketch.get_percentile(p) for p in (0.5, 0.75, 0.99)], [3, 5, 20])
+        self.assertIsNone(LatencySketch().get_percentile(0.5))
+
+    def test_flush(self):
+        now = time.time()
+        for stats in (LatencyStats(), LatencyStats()):
+            for wall_time in range(1, 101):
+                stats.record("rest/a", wall_time, 2, 1, 3, timestamp=now)
+            stats.record("rest/b", 5, 1, 0, 1, timestamp=now - 7200)
+            stats.flush()
+            self.assertEqual(stats.data, dict())
+
+        rows = get_latency_stats(since=now - 60)
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual((row["path"], row["count"], row["wall_time"], row["cpu_time"]), ("rest/a", 200, 10100, 600))
+        self.assertAlmostEqual(row["wall_p50"], 50, delta=2)
+        self.assertAlmostEqual(row["wall_p99"], 99, delta=3)
+        self.assertEqual((row["cpu_p95"], row["queries_p95"]), (3, 3))
+
+        self.assertEqual([row["count"] for row in get_latency_stats(since=now - 7200, path="rest/b")], [2])
+
+
+class TestAppDebugData(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        now = time.time()
+        for cache_ptr, (path, timestamp) in enumerate(
+            (("rest/a", now - 10), ("rest/b", now - 20), ("rest/a", now - 5400))
+        ):
+            cache.set(
+                "long_running_cmds_data%d" % cache_ptr,
+                dict(timestamp=timestamp, duration=1500, queries=[], PATH_INFO=path, sample_rate=0.5),
+            )
+        stats = LatencyStats()
+        stats.record("rest/a", 1500, 10, 5, 2)
+        stats.record("rest/b", 100, 10, 5, 2)
+        stats.flush()
+
+    def get(self, view, user=None, **params):
+        request = RequestFactory().get("/app-debug/data/", params)
+        request.user = user or SimpleNamespace(is_authenticated=True, is_staff=True)
+        return view(request)
+
+    def test_data(self):
+        data = json.loads(self.get(app_debug_data_view, window=600, path="rest/a").content)
+        self.assertEqual([rec["r_data"]["path_info"] for rec in data["debug_data"]], ["rest/a"])
+        self.assertEqual(data["spenders"], [dict(count=2, time=3000, path="rest/a")])
+        self.assertEqual([row["path"] for row in data["all_requests"]], ["rest/a"])
+        self.assertIn("cache_stats", data)
+
+        data = json.loads(self.get(app_debug_data_view, window=10800, sections="debug_data,spenders").content)
+        self.assertEqual(len(data["debug_data"]), 3)
+        self.assertNotIn("all_requests", data)
+        data = json.loads(self.get(app_debug_data_view, until=time.time() - 3600).content)
+        self.assertEqual(len(data["debug_data"]), 1)
+
+    def test_invalid_filters(self):
+        # invalid values fall back to defaults
+        for params in (dict(window="1h"), dict(window="-5"), dict(until="now"), dict(until="inf")):
+            response = self.get(app_debug_data_view, **params)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            self.assertEqual(int(data["until"] - data["since"]), 3600)
+            self.assertAlmostEqual(data["until"], time.time(), delta=10)
+        self.assertEqual(self.get(app_debug_view, window="1h").status_code, 200)
+        data = json.loads(self.get(app_debug_cache_stats_view, window="1h").content)
+        self.assertEqual(data["window"], 3600)
+
+    def test_window_limit(self):
+        # window can't be longer than latency sketches are kept
+        for view in (app_debug_view, app_debug_data_view, app_debug_cache_stats_view):
+            self.assertEqual(self.get(view, window=10**12).status_code, 400)
+        self.assertEqual(self.get(app_debug_data_view, window=86400).status_code, 200)
+        with override_settings(PROFILER_LATENCY_TIMEOUT=600):
+            self.assertEqual(self.get(app_debug_data_view, window=3600).status_code, 400)
+            data = json.loads(self.get(app_debug_data_view).content)
+            self.assertEqual(int(data["until"] - data["since"]), 600)
+
+    def test_staff_only(self):
+        for user in (AnonymousUser(), SimpleNamespace(is_authenticated=True, is_staff=False)):
+            for view in (app_debug_view, app_debug_data_view, app_debug_cache_stats_view):
+                with self.assertRaises(PermissionDenied):
+                    self.get(view, user=user)
+
+    def test_cache_stats_until(self):
+        stats = CacheStats()
+        stats.record("queue", "test", "hit")
+        with patch.object(CacheStats, "get_instance", return_value=stats):
+            stats.flush()
+            data = json.loads(self.get(app_debug_data_view, sections="cache_stats").content)
+            self.assertEqual([row["prefix"] for row in data["cache_stats"]], ["test"])
+            data = json.loads(self.get(app_debug_data_view, sections="cache_stats", until=time.time() - 60).content)
+            self.assertEqual(data["cache_stats"], [])
+
+    def test_page(self):
+        # long running requests are loaded from the JSON api
+        content = self.get(app_debug_view, path="rest/").content.decode()
+        self.assertIn("rest/b", content)
+        self.assertIn("/app-debug/data/", content)
+        self.assertNotIn("num_of_queries", content)
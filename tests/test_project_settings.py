@@ -1,4 +1,8 @@
+from unittest.mock import patch
+
 import swapper
+
+from django.core.exceptions import ValidationError
 from django.utils.crypto import get_random_string
 from rest_framework.test import APIClient
 
@@ -37,3 +41,90 @@ class TestProjectSettings(TestBase):
 
     def test_list_settings(self):
         self.assertEqual(1, len(self.api_client.get(self.url, HTTP_CURRENT_PROJECT=self.project.slug).data))
+
+    def test_settings_snapshot(self):
+        self.settingsModel.objects.create(
+            name="test-int",
+            description="test",
+            value="5",
+            pending_value="6",
+            value_type=self.settingsModel.VALUE_TYPE_INTEGER,
+            project=self.project,
+        )
+        with self.assertNumQueries(1):
+            snapshot = self.settingsModel.get_snapshot(self.project.slug)
+        self.assertEqual(snapshot["test-int"], 5)
+        self.assertEqual(snapshot.get_pending("test-int"), 6)
+        self.assertEqual(snapshot.get_value_type("test-int"), self.settingsModel.VALUE_TYPE_INTEGER)
+        self.assertEqual(snapshot["test"], "test")
+        self.assertIsNone(snapshot.get("missing"))
+        with self.assertRaises(self.settingsModel.DoesNotExist):
+            snapshot["missing"]
+
+        # snapshot is cached until a setting of the project changes
+        with self.assertNumQueries(0):
+            self.assertEqual(self.settingsModel.get_snapshot(self.project)["test-int"], 5)
+        setting = self.settingsModel.objects.get(project=self.project, name="test-int")
+        setting.value = "7"
+        setting.save()
+        self.assertEqual(self.settingsModel.get_snapshot(self.project)["test-int"], 7)
+        self.settingsModel.objects.filter(project=self.project, name="test").update(value="updated")
+        self.assertEqual(self.settingsModel.get_snapshot(self.project)["test"], "updated")
+
+    def test_settings_snapshot_malformed_value(self):
+        self.settingsModel.objects.create(
+            name="test-float",
+            description="test",
+            value="1.5",
+            value_type=self.settingsModel.VALUE_TYPE_FLOAT,
+            project=self.project,
+        )
+        self.settingsModel.objects.filter(project=self.project, name="test-float").update(value="not a number")
+        snapshot = self.settingsModel.get_snapshot(self.project)
+        # only reads of the malformed setting fail
+        self.assertEqual(snapshot["test"], "test")
+        with self.assertRaises(ValidationError):
+            snapshot["test-float"]
+
+    def test_settings_bulk_create(self):
+        self.assertNotIn("bulk-2", self.settingsModel.get_snapshot(self.project))
+        # slugs of projects are read with a single query
+        with self.assertNumQueries(2):
+            self.settingsModel.objects.bulk_create(
+                [
+                    self.settingsModel(
+                        name="bulk-%d" % i,
+                        description="test",
+                        value="x",
+                        value_type=self.settingsModel.VALUE_TYPE_CHAR,
+                        project_id=self.project.pk,
+                    )
+                    for i in range(3)
+                ]
+            )
+        self.assertEqual(self.settingsModel.get_snapshot(self.project)["bulk-2"], "x")
+
+    def test_settings_value_coercion(self):
+        model = self.settingsModel
+        setting = model(name="int", value="5", pending_value="6", value_type=model.VALUE_TYPE_INTEGER)
+        self.assertEqual(setting.python_value, 5)
+        self.assertEqual(setting.python_pending_value, 6)
+        # converted value is kept until value changes
+        with patch.object(model.value_coercers[model.VALUE_TYPE_INTEGER], "to_python") as to_python:
+            self.assertEqual(setting.python_value, 5)
+            to_python.assert_not_called()
+        setting.value = "7"
+        self.assertEqual(setting.python_value, 7)
+        setting.value_type = model.VALUE_TYPE_CHAR
+        self.assertEqual(setting.python_value, "7")
+
+        settings = [
+            model(name="float", value="1.5", value_type=model.VALUE_TYPE_FLOAT),
+            model(name="bool", value="False", value_type=model.VALUE_TYPE_BOOL),
+            model(name="char", value="text", value_type=model.VALUE_TYPE_CHAR),
+            model(name="custom", value="x", value_type=model.VALUE_TYPE_CUSTOM),
+            model(name="int", value="3", value_type=model.VALUE_TYPE_INTEGER),
+        ]
+        self.assertEqual([setting.python_value for setting in settings], [1.5, False, "text", "x", 3])
+        with self.assertRaises(ValidationError):
+            model(name="int", value="x", value_type=model.VALUE_TYPE_INTEGER).python_value
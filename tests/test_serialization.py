@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import time
 
@@ -5,7 +6,10 @@ from django.core.cache import cache, caches
 from django.test import override_settings, SimpleTestCase
 
 from django_project_base.caching import CacheCounter
+from django_project_base.caching.cache_lock import CacheLockBackend
+from django_project_base.caching.cache_lock.cache_lock_redis import CacheLockRedis
 from django_project_base.serialization import CacheLock, NoTimeoutCheck, ObjectLockTimeout
+from tests.test_caching import fake_redis_cache, get_redis_cache_backend_name
 
 
 class TestSerialization(SimpleTestCase):
@@ -17,6 +21,64 @@ class TestSerialization(SimpleTestCase):
         }
     })
     def test_serialization_blocking(self):
+        self._test_serialization_blocking()
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': get_redis_cache_backend_name(),
+            'LOCATION': 'redis://127.0.0.1:6379?db=1',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    })
+    def test_serialization_blocking_redis_cache(self):
+        self._test_serialization_blocking()
+
+    @fake_redis_cache
+    def test_serialization_blocking_fakeredis_cache(self):
+        self._test_serialization_blocking()
+
+    @fake_redis_cache
+    @override_settings(CACHE_LOCK_LEASE_TIMEOUT=0.2)
+    def test_redis_lock_owner(self):
+        caches["default"].clear()
+        first = CacheLockBackend.get_cache_lock_backend("CacheLock.owner")
+        second = CacheLockBackend.get_cache_lock_backend("CacheLock.owner")
+        self.assertIsInstance(first, CacheLockRedis)
+        # lock uses cache's key prefix and version
+        self.assertEqual(first.redis_key, caches["default"].make_key("CacheLock.owner"))
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        # after first owner's lease expired and lock was taken over, its late release doesn't delete the new lock
+        time.sleep(0.3)
+        self.assertTrue(second.acquire())
+        first.release()
+        self.assertFalse(first.acquire())
+        second.release()
+        self.assertTrue(first.acquire())
+        first.release()
+
+    @fake_redis_cache
+    def test_redis_lock_wake_up(self):
+        caches["default"].clear()
+        holder = CacheLockBackend.get_cache_lock_backend("CacheLock.wake_up")
+        waiter = CacheLockBackend.get_cache_lock_backend("CacheLock.wake_up")
+        # waiter would otherwise re-check the lock every second anyway
+        waiter.max_wait_interval = 5
+        self.assertTrue(holder.acquire())
+        releaser = threading.Timer(0.2, holder.release)
+        releaser.start()
+        start = time.time()
+        waiter.wait(5)
+        # waiter is woken up by the release, not by its wait timeout
+        self.assertLess(time.time() - start, 1)
+        self.assertTrue(waiter.acquire())
+        waiter.release()
+        releaser.join()
+
+    def _test_serialization_blocking(self):
         times = dict()
         caches["default"].clear()
 
@@ -141,3 +203,43 @@ class TestSerialization(SimpleTestCase):
 
         expect_processed += 1
         _check_counters()
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': '',
+        }
+    })
+    async def test_serialization_blocking_async(self):
+        times = dict()
+        await caches["default"].aclear()
+
+        async def _run_task(name):
+            times.setdefault(name, dict())
+            async with CacheLock("Process"):
+                times[name]["start"] = time.time()
+                await asyncio.sleep(.3)
+                times[name]["end"] = time.time()
+
+        # Tasks in same event loop must wait for each other too
+        await asyncio.gather(*[_run_task(f"Task-{i + 1}") for i in range(3)])
+
+        end = 0
+        for key in sorted(times.keys(), key=lambda k: times[k]["start"]):
+            start = times[key]["start"]
+            self.assertLessEqual(end, start)
+            end = times[key]["end"]
+
+        # With timeout, tasks that can't get the lock in time get ObjectLockTimeout
+        async def _run_task_timeout(results):
+            try:
+                async with CacheLock("Process", timeout=.2) as cl:
+                    cl()
+                    await asyncio.sleep(.5)
+                    results.append("processed")
+            except ObjectLockTimeout:
+                results.append("timeout")
+
+        results = []
+        await asyncio.gather(*[_run_task_timeout(results) for _i in range(3)])
+        self.assertEqual(sorted(results), ["processed", "timeout", "timeout"])